@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+合成媒体库生成器
+按常见的 scene / 压制组命名规则生成视频和字幕文件名：混合 SxxEyy、1x02、102 三种集数格式，
+带语言标记、压制组、画质、片源、编码，字幕命名风格与视频不同（空格、方括号、缺失或多余的字幕）
+
+    python benchmarks/generate.py /tmp/library 10000 [--seed 1]
+"""
+
+import argparse
+import random
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+TITLE_WORDS = [
+    'breaking', 'bad', 'game', 'thrones', 'office', 'star', 'trek', 'picard', 'discovery',
+    'friends', 'lost', 'dark', 'fargo', 'westworld', 'house', 'dragon', 'better', 'call', 'saul',
+    'stranger', 'things', 'crown', 'boys', 'expanse', 'mandalorian', 'succession', 'severance',
+    'wire', 'sopranos', 'mad', 'men', 'true', 'detective', 'black', 'mirror', 'silicon', 'valley',
+    'last', 'us', 'ozark', 'chernobyl', 'mindhunter', 'barry', 'atlanta', 'bear', 'andor', 'loki',
+    'wednesday', 'reacher',
+]
+RELEASE_GROUPS = ['eztv', 'rarbg', 'ntb', 'killers', 'yts', 'vxt', 'sparks', 'flux', 'cakes',
+                  'ggez']
+QUALITIES = ['720p', '1080p', '2160p']
+SOURCES = ['WEB-DL', 'WEBRip', 'BluRay', 'HDTV', 'AMZN.WEB-DL', 'NF.WEBRip']
+CODECS = ['x264', 'x265', 'H.264', 'HEVC', 'DDP5.1.H.264']
+LANGUAGE_TAGS = ['chs', 'cht', 'eng', 'chs&eng', 'cht&eng', '简体', '双语', 'sc', '']
+VIDEO_EXTENSIONS = ['.mkv', '.mkv', '.mp4', '.avi']
+SUBTITLE_EXTENSIONS = ['.ass', '.srt']
+EPISODE_STYLES = ['S{season:02d}E{episode:02d}', '{season}x{episode:02d}', '{season}{episode:02d}']
+
+EPISODES_PER_SHOW = 200
+
+
+def show_names(count: int, rnd: random.Random) -> List[str]:
+    """生成 count 个互不相同的剧名（由 2~3 个标题词组成，单词首字母大写）"""
+    names = set()
+    while len(names) < count:
+        words = rnd.sample(TITLE_WORDS, rnd.randint(2, 3))
+        names.add('.'.join(word.capitalize() for word in words))
+    return sorted(names)
+
+
+def generate_names(total: int, seed: int = 1) -> Iterator[Tuple[str, str]]:
+    """生成约 total 个（剧集目录，文件名），视频与字幕大致各占一半"""
+    rnd = random.Random(seed)
+    videos_per_show = EPISODES_PER_SHOW // 2
+    shows = show_names(max(1, total // EPISODES_PER_SHOW), rnd)
+    produced = 0
+    for show in shows:
+        season_count = rnd.randint(1, 5)
+        style = rnd.choice(EPISODE_STYLES)
+        subtitle_title = show.replace('.', rnd.choice([' ', '.', '_']))
+        for index in range(videos_per_show):
+            if produced >= total:
+                return
+            season = 1 + index * season_count // videos_per_show
+            episode = 1 + index % max(1, videos_per_show // season_count)
+            # 同一剧集内偶尔混用其他格式（"102" 格式要求集数 >= 10，否则退回 SxxEyy）
+            episode_style = style if rnd.random() < 0.9 else rnd.choice(EPISODE_STYLES)
+            if episode_style == EPISODE_STYLES[2] and episode < 10:
+                episode_style = EPISODE_STYLES[0]
+            marker = episode_style.format(season=season, episode=episode)
+            group = rnd.choice(RELEASE_GROUPS)
+            video = (f"{show}.{marker}.{rnd.choice(QUALITIES)}.{rnd.choice(SOURCES)}."
+                     f"{rnd.choice(CODECS)}-{group}{rnd.choice(VIDEO_EXTENSIONS)}")
+            yield show, video
+            produced += 1
+
+            # 0~2 个字幕：多数有一个，部分缺失，部分有多个语言版本
+            subtitle_count = rnd.choices([0, 1, 2], weights=[1, 7, 2])[0]
+            for language in rnd.sample(LANGUAGE_TAGS, subtitle_count):
+                if produced >= total:
+                    return
+                subtitle_group = group if rnd.random() < 0.6 else rnd.choice(RELEASE_GROUPS)
+                subtitle = (f"{subtitle_title} {marker} {language} [{subtitle_group}]"
+                            f"{rnd.choice(SUBTITLE_EXTENSIONS)}")
+                yield show, subtitle
+                produced += 1
+
+
+def generate_library(root: str, total: int, seed: int = 1) -> int:
+    """在 root 下按剧集分目录创建空文件，返回创建的文件数"""
+    root_path = Path(root)
+    created = 0
+    directories = set()
+    for show, name in generate_names(total, seed):
+        directory = root_path / show
+        if show not in directories:
+            directory.mkdir(parents=True, exist_ok=True)
+            directories.add(show)
+        (directory / name).touch()
+        created += 1
+    return created
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成用于基准测试的合成媒体库')
+    parser.add_argument('root', help='输出目录')
+    parser.add_argument('files', type=int, help='文件数')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子（默认：1）')
+    args = parser.parse_args()
+
+    created = generate_library(args.root, args.files, args.seed)
+    print(f"已生成 {created} 个文件：{args.root}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+基准测试
+在 1k / 10k / 100k 个文件的合成媒体库上测量分词、集数提取、目录扫描、单个视频的最佳匹配、
+全局分配和端到端运行的耗时，结果可保存为基线 JSON，之后与基线比较，发现单项变慢或随规模增长的趋势（扩展指数）变差
+
+    python benchmarks/run_benchmarks.py --save benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --compare benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --sizes 1k,10k --only tokenize,extract
+    python benchmarks/run_benchmarks.py --sizes 10k --only assign --budget assign@10k=5
+
+每个用例在独立的子进程中运行（互不影响缓存和内存），超过 --timeout 秒的用例记为超时。
+超过耗时上限（DEFAULT_BUDGETS 及 --budget）的用例同样以状态码 1 退出。
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import yaml
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+BASE_DIR = BENCHMARK_DIR.parent
+sys.path.insert(0, str(BASE_DIR / "core"))
+sys.path.insert(0, str(BENCHMARK_DIR))
+
+from generate import generate_library, generate_names
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+# find_best_match 每次调用都遍历全部字幕，只抽样部分视频
+MATCH_SAMPLE = 20
+# assign 用例对整个库（不分区）评分后求全局分配，只在不超过该规模的库上运行
+ASSIGN_MAX_SIZE = 20000
+
+
+def _parse_size(text: str) -> int:
+    text = text.strip().lower()
+    if text.endswith('k'):
+        return int(float(text[:-1]) * 1000)
+    return int(text)
+
+
+def _best_of(repeat: int, setup: Callable[[], object], func: Callable[[object], None]) -> float:
+    """重复 repeat 次取最短耗时；setup 不计入耗时"""
+    best = math.inf
+    for _ in range(repeat):
+        state = setup()
+        started = time.perf_counter()
+        func(state)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _repeat_for(size: int) -> int:
+    return 5 if size <= 10000 else 1
+
+
+def bench_tokenize(size: int, library: str, config_path: str) -> Dict:
+    from submatcher import Config, Tokenizer
+
+    config = Config(config_path)
+    names = [name for _, name in generate_names(size)]
+
+    def run(tokenizer):
+        for name in names:
+            tokenizer.tokenize(name)
+
+    # 每次使用新的 Tokenizer，测量未命中缓存的分词
+    seconds = _best_of(_repeat_for(size), lambda: Tokenizer(config), run)
+    return {'seconds': seconds, 'items': len(names)}
+
+
+def bench_extract(size: int, library: str, config_path: str) -> Dict:
+    from submatcher import Config, EpisodeExtractor, _split_suffix
+
+    config = Config(config_path)
+    stems = [_split_suffix(name)[0] for _, name in generate_names(size)]
+
+    def run(extractor):
+        for stem in stems:
+            extractor.extract(stem)
+
+    seconds = _best_of(_repeat_for(size), lambda: EpisodeExtractor(config), run)
+    return {'seconds': seconds, 'items': len(stems)}
+
+
+def bench_scan(size: int, library: str, config_path: str) -> Dict:
+    from submatcher import SubMatcher
+
+    counts = []
+
+    def run(submatcher):
+        videos, subtitles = submatcher.file_scanner.scan_directory(library)
+        counts.append(len(videos) + len(subtitles))
+
+    seconds = _best_of(_repeat_for(size), lambda: SubMatcher(config_path), run)
+    return {'seconds': seconds, 'items': counts[-1]}
+
+
+def bench_find_best_match(size: int, library: str, config_path: str) -> Dict:
+    from submatcher import SubMatcher
+
+    submatcher = SubMatcher(config_path)
+    videos, subtitles = submatcher.file_scanner.scan_directory(library)
+    global_tokens, _ = submatcher.cluster_analyzer.analyze(videos + subtitles)
+    step = max(1, len(videos) // MATCH_SAMPLE)
+    sample = videos[::step][:MATCH_SAMPLE]
+
+    def run(matcher):
+        for video in sample:
+            matcher.find_best_match(video, subtitles, global_tokens)
+
+    seconds = _best_of(_repeat_for(size), lambda: submatcher.matcher, run)
+    return {'seconds': seconds, 'items': len(sample), 'subtitles': len(subtitles)}
+
+
+def bench_run(size: int, library: str, config_path: str) -> Dict:
+    from submatcher import SubMatcher
+
+    def run(submatcher):
+        with open(os.devnull, 'w', encoding='utf-8') as devnull, \
+                contextlib.redirect_stdout(devnull):
+            submatcher.run(library)
+
+    seconds = _best_of(1, lambda: SubMatcher(config_path), run)
+    return {'seconds': seconds, 'items': size}
+
+
+def bench_assign(size: int, library: str, config_path: str) -> Dict:
+    from submatcher import CandidateIndex, SubMatcher
+    from assignment import max_weight_matching
+
+    if size > ASSIGN_MAX_SIZE:
+        # 不分区时候选对数随规模近似平方增长，更大的库应使用 matching.partition
+        return {'status': 'skipped', 'seconds': None}
+    submatcher = SubMatcher(config_path)
+    videos, subtitles = submatcher.file_scanner.scan_directory(library)
+    global_tokens, _ = submatcher.cluster_analyzer.analyze(videos + subtitles)
+    candidate_index = CandidateIndex(subtitles, global_tokens)
+    adjacency = submatcher.matcher.score_candidates(videos, candidate_index, global_tokens)
+
+    def run(_):
+        max_weight_matching(adjacency, len(candidate_index.subtitles))
+
+    seconds = _best_of(_repeat_for(size), lambda: None, run)
+    return {'seconds': seconds, 'items': len(videos),
+            'edges': sum(len(edges) for edges in adjacency)}
+
+
+BENCHMARKS: Dict[str, Callable[[int, str, str], Dict]] = {
+    'tokenize': bench_tokenize,
+    'extract': bench_extract,
+    'scan': bench_scan,
+    'find_best_match': bench_find_best_match,
+    'assign': bench_assign,
+    'run': bench_run,
+}
+
+# 耗时上限（秒），超过时与基线回退一样以状态码 1 退出；可用 --budget 覆盖或补充
+DEFAULT_BUDGETS: Dict[str, Dict[int, float]] = {
+    'assign': {10000: 5.0},
+}
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_case(name: str, size: int, library: str, config_path: str) -> Dict:
+    """在当前进程中运行单个用例（由子进程调用）"""
+    result = BENCHMARKS[name](size, library, config_path)
+    if result.setdefault('status', 'ok') == 'ok':
+        result['per_item_us'] = result['seconds'] / max(1, result['items']) * 1e6
+        result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def run_case_subprocess(name: str, size: int, library: str, config_path: str,
+                        timeout: float) -> Dict:
+    command = [sys.executable, str(Path(__file__).resolve()), '--case', name,
+               '--case-size', str(size), '--library', library, '--config', config_path]
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=timeout or None)
+    except subprocess.TimeoutExpired:
+        return {'status': 'timeout', 'seconds': None, 'timeout': timeout}
+    if completed.returncode != 0:
+        return {'status': 'error', 'seconds': None, 'error': completed.stderr.strip()[-2000:]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def write_config(path: str) -> None:
+    """基准测试配置：以仓库配置为准，强制演习模式并关闭扫描缓存"""
+    with open(BASE_DIR / "core" / "config.yaml", 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    config.setdefault('safety', {})['dry_run'] = True
+    config.setdefault('scan_cache', {})['enabled'] = False
+    with open(path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f, allow_unicode=True, sort_keys=False)
+
+
+def run_suite(sizes: List[int], names: List[str], timeout: float, workdir: str) -> Dict:
+    os.makedirs(workdir, exist_ok=True)
+    config_path = os.path.join(workdir, 'config.yaml')
+    write_config(config_path)
+    results: Dict[str, Dict[str, Dict]] = {name: {} for name in names}
+    for size in sizes:
+        library = os.path.join(workdir, f"library-{size}")
+        if not os.path.isdir(library):
+            started = time.perf_counter()
+            created = generate_library(library, size)
+            print(f"生成 {created} 个文件（{time.perf_counter() - started:.1f} 秒）", file=sys.stderr)
+        for name in names:
+            result = run_case_subprocess(name, size, library, config_path, timeout)
+            results[name][str(size)] = result
+            print(f"  {_format_result(name, size, result)}", file=sys.stderr)
+    return {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'sizes': sizes,
+        'results': results,
+    }
+
+
+def _format_result(name: str, size: int, result: Dict) -> str:
+    if result['status'] != 'ok':
+        return f"{name:<16} {size:>7}  {result['status']}"
+    return (f"{name:<16} {size:>7}  {result['seconds']:>9.3f} s"
+            f"  {result['per_item_us']:>10.1f} us/item"
+            f"  {result.get('peak_rss_mb') or 0:>7.1f} MB")
+
+
+def scaling_exponents(results: Dict[str, Dict], min_seconds: float = 0.0) -> Dict[str, float]:
+    """相邻规模之间的扩展指数 log(t2/t1) / log(n2/n1)：1 为线性，2 为平方
+
+    耗时低于 min_seconds 的规模受计时噪声影响太大，不参与计算。
+    """
+    exponents = {}
+    sizes = sorted(int(size) for size, result in results.items()
+                   if result.get('status') == 'ok' and result['seconds'] >= min_seconds)
+    for small, large in zip(sizes, sizes[1:]):
+        t_small = results[str(small)]['seconds']
+        t_large = results[str(large)]['seconds']
+        if t_small > 0 and t_large > 0:
+            exponents[f"{small}->{large}"] = math.log(t_large / t_small) / math.log(large / small)
+    return exponents
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float, scaling_tolerance: float,
+            min_seconds: float) -> List[str]:
+    """与基线比较，打印对比表，返回所有回退项；增加不足 min_seconds 的差异视为计时噪声"""
+    regressions = []
+    print(f"{'用例':<16} {'规模':>7}  {'基线':>10}  {'当前':>10}  {'比值':>6}")
+    for name, results in current['results'].items():
+        base_results = baseline.get('results', {}).get(name, {})
+        for size, result in results.items():
+            base = base_results.get(size)
+            if base is None:
+                continue
+            if result['status'] != 'ok':
+                line = f"{name:<16} {size:>7}  {_seconds(base):>10}  {result['status']:>10}"
+                if base.get('status') == 'ok':
+                    regressions.append(f"{name} @ {size}: {result['status']}")
+                print(line)
+                continue
+            if base.get('status') != 'ok':
+                print(f"{name:<16} {size:>7}  {base.get('status'):>10}  {_seconds(result):>10}")
+                continue
+            ratio = result['seconds'] / base['seconds'] if base['seconds'] else math.inf
+            flag = ''
+            if ratio > 1 + tolerance and result['seconds'] - base['seconds'] >= min_seconds:
+                flag = '  变慢'
+                regressions.append(f"{name} @ {size}: {ratio:.2f}x")
+            elif ratio < 1 - tolerance:
+                flag = '  变快'
+            print(f"{name:<16} {size:>7}  {_seconds(base):>10}  {_seconds(result):>10}"
+                  f"  {ratio:>5.2f}x{flag}")
+
+        base_exponents = scaling_exponents(base_results, min_seconds)
+        for span, exponent in scaling_exponents(results, min_seconds).items():
+            base_exponent = base_exponents.get(span)
+            if base_exponent is not None and exponent > base_exponent + scaling_tolerance:
+                regressions.append(f"{name} 扩展指数 {span}: {base_exponent:.2f} -> {exponent:.2f}")
+    return regressions
+
+
+def parse_budget(text: str) -> Tuple[str, int, float]:
+    """解析 用例@规模=秒数，例如 assign@10k=5"""
+    try:
+        case, rest = text.split('@', 1)
+        size, seconds = rest.split('=', 1)
+        return case.strip(), _parse_size(size), float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的耗时上限：{text}（格式：用例@规模=秒数）")
+
+
+def check_budgets(report: Dict, budgets: Dict[str, Dict[int, float]]) -> List[str]:
+    """返回超过耗时上限（或超时、出错）的用例"""
+    violations = []
+    for name, limits in budgets.items():
+        results = report['results'].get(name, {})
+        for size, limit in sorted(limits.items()):
+            result = results.get(str(size))
+            if result is None or result['status'] == 'skipped':
+                continue
+            if result['status'] != 'ok':
+                violations.append(f"{name} @ {size}: {result['status']}（上限 {limit:g} 秒）")
+            elif result['seconds'] > limit:
+                violations.append(
+                    f"{name} @ {size}: {result['seconds']:.2f} 秒，超过上限 {limit:g} 秒")
+    return violations
+
+
+def _seconds(result: Dict) -> str:
+    if result.get('status') == 'ok':
+        return f"{result['seconds']:.3f}s"
+    return str(result.get('status'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SubMatcher 基准测试')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='媒体库规模，逗号分隔，支持 k 后缀（默认：1k,10k,100k）')
+    parser.add_argument('--only', default=None,
+                        help=f"只运行指定用例，逗号分隔（可选：{', '.join(BENCHMARKS)}）")
+    parser.add_argument('--save', metavar='JSON', help='将结果保存为基线')
+    parser.add_argument('--compare', metavar='JSON', help='与基线比较，有回退时以状态码 1 退出')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='允许的耗时增长比例（默认：0.25）')
+    parser.add_argument('--scaling-tolerance', type=float, default=0.2,
+                        help='允许的扩展指数增长（默认：0.2）')
+    parser.add_argument('--min-seconds', type=float, default=0.05,
+                        help='低于该秒数的耗时差异视为计时噪声（默认：0.05）')
+    parser.add_argument('--budget', action='append', type=parse_budget, default=[],
+                        metavar='CASE@SIZE=SECONDS',
+                        help='耗时上限，可重复（默认：assign@10k=5），超过时以状态码 1 退出')
+    parser.add_argument('--timeout', type=float, default=900, help='单个用例的超时秒数（默认：900，0 表示不限制）')
+    parser.add_argument('--workdir', help='生成的媒体库目录（默认使用临时目录并在结束后删除）')
+    # 以下参数供子进程运行单个用例
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--case-size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--library', help=argparse.SUPPRESS)
+    parser.add_argument('--config', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        # 被测代码的输出不能混入结果
+        with contextlib.redirect_stdout(sys.stderr):
+            result = run_case(args.case, args.case_size, args.library, args.config)
+        print(json.dumps(result))
+        return
+
+    sizes = [_parse_size(size) for size in args.sizes.split(',') if size.strip()]
+    names = [name.strip() for name in args.only.split(',')] if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的用例：{', '.join(unknown)}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='submatcher-bench-')
+    try:
+        report = run_suite(sizes, names, args.timeout, workdir)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    for name, results in report['results'].items():
+        exponents = scaling_exponents(results)
+        if exponents:
+            spans = '，'.join(f"{span}: {value:.2f}" for span, value in exponents.items())
+            print(f"{name:<16} 扩展指数 {spans}")
+
+    budgets = {name: dict(limits) for name, limits in DEFAULT_BUDGETS.items()}
+    for name, size, seconds in args.budget:
+        budgets.setdefault(name, {})[size] = seconds
+    violations = check_budgets(report, budgets)
+    for violation in violations:
+        print(f"超过耗时上限：{violation}")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存：{args.save}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.scaling_tolerance,
+                              args.min_seconds)
+        if regressions:
+            print(f"\n发现 {len(regressions)} 项回退：")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\n未发现回退")
+
+    if violations:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
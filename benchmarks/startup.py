@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+MCP 服务器冷启动基准
+测量从启动服务器进程到收到 initialize 响应的耗时（即客户端每次连接时等待的时间），
+并检查启动过程没有在仓库中创建备份目录或审计日志
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 20 --max-seconds 1.5
+    python benchmarks/startup.py --command "uvx mcp-submatcher"
+"""
+
+import argparse
+import json
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+# 启动阶段不应产生的文件（只在首次修改配置时创建）
+SIDE_EFFECT_PATHS = [BASE_DIR / ".config_backups", BASE_DIR / "SYSTEM_MOD_LOG.md"]
+
+INITIALIZE_REQUEST = {
+    'jsonrpc': '2.0',
+    'id': 1,
+    'method': 'initialize',
+    'params': {
+        'protocolVersion': '2024-11-05',
+        'capabilities': {},
+        'clientInfo': {'name': 'submatcher-startup-bench', 'version': '1.0'},
+    },
+}
+
+
+def measure_once(command: List[str], timeout: float) -> float:
+    """启动服务器、发送 initialize 并等待响应，返回耗时（秒）"""
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL, cwd=str(BASE_DIR))
+    try:
+        process.stdin.write((json.dumps(INITIALIZE_REQUEST) + '\n').encode('utf-8'))
+        process.stdin.flush()
+        while True:
+            line = process.stdout.readline()
+            if not line:
+                raise RuntimeError(f"服务器在响应 initialize 之前退出（状态码 {process.poll()}）")
+            message = json.loads(line)
+            if message.get('id') == INITIALIZE_REQUEST['id']:
+                break
+            if time.perf_counter() - started > timeout:
+                raise TimeoutError(f"{timeout} 秒内未收到 initialize 响应")
+        elapsed = time.perf_counter() - started
+        if 'error' in message:
+            raise RuntimeError(f"initialize 失败：{message['error']}")
+        return elapsed
+    finally:
+        process.stdin.close()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MCP 服务器冷启动基准')
+    parser.add_argument('--runs', type=int, default=10, help='启动次数（默认：10）')
+    parser.add_argument('--command', default=None,
+                        help='启动服务器的命令（默认：当前解释器运行 mcp_server.py）')
+    parser.add_argument('--timeout', type=float, default=60, help='单次启动的超时秒数（默认：60）')
+    parser.add_argument('--max-seconds', type=float, default=None,
+                        help='中位数超过该秒数时以状态码 1 退出')
+    args = parser.parse_args()
+
+    if args.command:
+        command = shlex.split(args.command)
+    else:
+        command = [sys.executable, str(BASE_DIR / "mcp_server.py")]
+    existing = {path for path in SIDE_EFFECT_PATHS if os.path.exists(path)}
+
+    timings = []
+    for _ in range(args.runs):
+        timings.append(measure_once(command, args.timeout))
+
+    median = statistics.median(timings)
+    print(f"启动到 initialize 响应（{args.runs} 次）：最短 {min(timings) * 1000:.0f} ms，"
+          f"中位数 {median * 1000:.0f} ms，最长 {max(timings) * 1000:.0f} ms")
+
+    failed = False
+    created = [path for path in SIDE_EFFECT_PATHS if os.path.exists(path) and path not in existing]
+    if created:
+        print(f"启动过程创建了文件：{', '.join(str(path) for path in created)}")
+        failed = True
+    if args.max_seconds is not None and median > args.max_seconds:
+        print(f"中位数超过 {args.max_seconds} 秒")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,19 +4,25 @@ Configuration Manager for SubMatcher
 提供配置文件读写、备份和审计日志功能
 """
 
+import os
 import sys
-import yaml
-import shutil
+import copy
+import time
+import hashlib
+import threading
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Any, Tuple
+from dataclasses import dataclass, field
 import logging
 
 BASE_DIR = Path(__file__).parent
 CORE_DIR = BASE_DIR / "core"
 sys.path.insert(0, str(BASE_DIR))
 
+from core.config_store import ConfigStore
+from core.submatcher import validate_config
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -34,6 +40,18 @@ class ConfigChange:
     timestamp: str = ""
 
 
+@dataclass
+class ConfigBatchChange:
+    """批量配置变更记录：全部生效或全部不生效，只产生一份备份和一条审计日志"""
+    success: bool
+    config_path: str
+    changes: List[Dict] = field(default_factory=list)
+    backup_path: Optional[str] = None
+    error: Optional[str] = None
+    failed_path: Optional[str] = None
+    timestamp: str = ""
+
+
 class ConfigManager:
     """配置管理器"""
 
@@ -41,10 +59,13 @@ class ConfigManager:
         if config_path is None:
             config_path = str(BASE_DIR / "core" / "config.yaml")
         self.config_path = config_path
+        # 与 SubMatcherAdapter 共享同一份缓存：读取不再重复解析，写入后匹配器立即重新编译
+        self.store = ConfigStore.for_path(config_path)
+        # 备份目录和审计日志在首次修改配置时才创建
         self.backup_dir = BASE_DIR / ".config_backups"
-        self.backup_dir.mkdir(exist_ok=True)
+        # 读取-修改-写入需串行，避免并发的修改互相覆盖
+        self._write_lock = threading.Lock()
         self.log_file = BASE_DIR / "SYSTEM_MOD_LOG.md"
-        self._init_log_file()
         logger.info(f"ConfigManager initialized with config: {config_path}")
 
     def _init_log_file(self):
@@ -52,40 +73,84 @@ class ConfigManager:
         if not self.log_file.exists():
             self.log_file.write_text("# 系统修改日志\n\n")
 
-    def _write_log(self, path: str, old_value: Any, new_value: Any, environment: str):
-        """写入审计日志"""
+    def _write_log(self, changes: List[Dict], environment: str, backup_path: Optional[str] = None):
+        """写入审计日志（一次变更写一条）"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
-        log_entry = f"## {timestamp}\n- **配置路径**: {path}\n- **旧值**: {old_value}\n- **新值**: {new_value}\n- **环境**: {environment}\n\n"
+        if len(changes) == 1:
+            change = changes[0]
+            log_entry = (f"## {timestamp}\n- **配置路径**: {change['path']}\n"
+                         f"- **旧值**: {change['old_value']}\n- **新值**: {change['new_value']}\n")
+        else:
+            log_entry = f"## {timestamp}\n- **批量变更**: {len(changes)} 项\n"
+            for change in changes:
+                log_entry += (f"  - `{change['path']}`: "
+                              f"{change['old_value']} → {change['new_value']}\n")
+        if backup_path:
+            log_entry += f"- **备份**: {Path(backup_path).name}\n"
+        log_entry += f"- **环境**: {environment}\n\n"
+        self._init_log_file()
         with open(self.log_file, 'a', encoding='utf-8') as f:
             f.write(log_entry)
-        logger.info(f"Log entry written: {path}")
+        logger.info(f"Log entry written: {', '.join(change['path'] for change in changes)}")
 
     def _load_config(self) -> Dict:
-        """加载配置文件"""
+        """加载配置文件（文件未变化时直接返回缓存，调用方不得修改）"""
         try:
-            with open(self.config_path, 'r', encoding='utf-8') as f:
-                return yaml.safe_load(f)
+            return self.store.load()
         except FileNotFoundError:
             logger.error(f"Config file not found: {self.config_path}")
             raise
 
     def _save_config(self, config: Dict):
-        """保存配置文件"""
-        with open(self.config_path, 'w', encoding='utf-8') as f:
-            yaml.dump(config, f, allow_unicode=True, default_flow_style=False, sort_keys=False)
-
-    def _backup_config(self) -> str:
-        """备份配置文件"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_filename = f"config_backup_{timestamp}.yaml"
-        backup_path = self.backup_dir / backup_filename
-        shutil.copy2(self.config_path, backup_path)
-        logger.info(f"Config backed up to: {backup_path}")
+        """原子写入配置文件"""
+        self.store.write(config)
+
+    def _backup_config(self, retention: Dict) -> str:
+        """备份配置文件；内容相同的备份只保留一份（按内容哈希去重），并按保留策略清理旧备份"""
+        content = Path(self.config_path).read_bytes()
+        self.backup_dir.mkdir(exist_ok=True)
+        digest = hashlib.sha256(content).hexdigest()[:16]
+        existing = sorted(self.backup_dir.glob(f"config_backup_*_{digest}.yaml"))
+        if existing:
+            backup_path = existing[-1]
+            # 刷新修改时间，使其在保留策略中视为最新
+            os.utime(backup_path)
+            logger.info(f"Config unchanged since backup: {backup_path}")
+        else:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            backup_path = self.backup_dir / f"config_backup_{timestamp}_{digest}.yaml"
+            backup_path.write_bytes(content)
+            logger.info(f"Config backed up to: {backup_path}")
+        self._prune_backups(retention, keep=backup_path)
         return str(backup_path)
 
+    def _prune_backups(self, retention: Dict, keep: Path):
+        """按数量和天数清理备份；0 表示不限制"""
+        max_backups = retention.get('max_backups', 50)
+        max_age = retention.get('max_age_days', 90) * 86400
+        try:
+            backups = sorted(self.backup_dir.glob("config_backup_*.yaml"),
+                             key=lambda p: p.stat().st_mtime, reverse=True)
+        except OSError:
+            return
+        now = time.time()
+        for index, backup in enumerate(backups):
+            if backup == keep:
+                continue
+            try:
+                expired = max_age and now - backup.stat().st_mtime > max_age
+                if (max_backups and index >= max_backups) or expired:
+                    backup.unlink()
+                    logger.info(f"Old config backup removed: {backup}")
+            except OSError:
+                pass
+
     def get_config_value(self, path: str) -> Any:
         """读取配置值（支持点号路径和数组索引）"""
-        config = self._load_config()
+        return copy.deepcopy(self._resolve(self._load_config(), path))
+
+    @staticmethod
+    def _resolve(config: Dict, path: str) -> Any:
         value = config
         
         keys = path.split('.')
@@ -107,83 +172,115 @@ class ConfigManager:
                 return None
         return value
 
-    def set_config_value(self, path: str, value: Any) -> ConfigChange:
-        """设置配置值（支持点号路径和数组索引）"""
+    @staticmethod
+    def _assign(config: Dict, path: str, value: Any) -> Optional[str]:
+        """在配置树中设置值，路径无效时返回错误信息"""
+        current = config
+        
+        keys = path.split('.')
+        for key in keys[:-1]:
+            if '[' in key and key.endswith(']'):
+                base_key = key[:key.index('[')]
+                index = int(key[key.index('[')+1:key.index(']')])
+                if base_key not in current:
+                    current[base_key] = []
+                if isinstance(current[base_key], list) and 0 <= index < len(current[base_key]):
+                    current = current[base_key][index]
+                else:
+                    return f"Invalid index for {base_key}"
+            else:
+                if key not in current:
+                    current[key] = {}
+                current = current[key]
+        
+        last_key = keys[-1]
+        if '[' in last_key and last_key.endswith(']'):
+            base_key = last_key[:last_key.index('[')]
+            index = int(last_key[last_key.index('[')+1:last_key.index(']')])
+            if base_key not in current:
+                current[base_key] = []
+            if isinstance(current[base_key], list) and 0 <= index < len(current[base_key]):
+                current[base_key][index] = value
+            else:
+                return f"Invalid index for {base_key}"
+        else:
+            current[last_key] = value
+        return None
+
+    def set_config_values(self, changes: Iterable[Tuple[str, Any]]) -> ConfigBatchChange:
+        """批量设置配置值：任一路径无效或修改后的配置无法编译时不做任何修改；全部成功时只备份、写入、记录一次"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
+        path = None
         
         try:
-            old_value = self.get_config_value(path)
-            
-            config = self._load_config()
-            current = config
-            
-            keys = path.split('.')
-            for i, key in enumerate(keys[:-1]):
-                if '[' in key and key.endswith(']'):
-                    base_key = key[:key.index('[')]
-                    index = int(key[key.index('[')+1:key.index(']')])
-                    if base_key not in current:
-                        current[base_key] = []
-                    if isinstance(current[base_key], list) and 0 <= index < len(current[base_key]):
-                        current = current[base_key][index]
-                    else:
-                        return ConfigChange(
+            with self._write_lock:
+                # 在缓存配置树的副本上修改，写入后副本成为新的缓存
+                current = self._load_config()
+                config = copy.deepcopy(current)
+                applied = []
+                for path, value in changes:
+                    old_value = copy.deepcopy(self._resolve(config, path))
+                    error = self._assign(config, path, value)
+                    if error:
+                        return ConfigBatchChange(
                             success=False,
-                            path=path,
                             config_path=self.config_path,
-                            error=f"Invalid index for {base_key}",
+                            error=error,
+                            failed_path=path,
                             timestamp=timestamp
                         )
-                else:
-                    if key not in current:
-                        current[key] = {}
-                    current = current[key]
-            
-            last_key = keys[-1]
-            if '[' in last_key and last_key.endswith(']'):
-                base_key = last_key[:last_key.index('[')]
-                index = int(last_key[last_key.index('[')+1:last_key.index(']')])
-                if base_key not in current:
-                    current[base_key] = []
-                if isinstance(current[base_key], list) and 0 <= index < len(current[base_key]):
-                    current[base_key][index] = value
-                else:
-                    return ConfigChange(
-                        success=False,
-                        path=path,
-                        config_path=self.config_path,
-                        error=f"Invalid index for {base_key}",
-                        timestamp=timestamp
-                    )
-            else:
-                current[last_key] = value
-            
-            backup_path = self._backup_config()
-            self._save_config(config)
-            
-            import sys
-            environment = f"Python {sys.version.split()[0]}"
-            self._write_log(path, old_value, value, environment)
+                    applied.append({'path': path, 'old_value': old_value, 'new_value': value})
+                
+                # 所有值都未变化时不产生备份和日志
+                backup_path = None
+                if config != current:
+                    # 写入前编译新配置（集数模式、条件、分词规则、权重表）：无效的配置不落盘
+                    try:
+                        validate_config(config)
+                    except ValueError as e:
+                        return ConfigBatchChange(
+                            success=False,
+                            config_path=self.config_path,
+                            error=str(e),
+                            timestamp=timestamp
+                        )
+                    backup_path = self._backup_config(config.get('config_backups', {}))
+                    self._save_config(config)
+                    environment = f"Python {sys.version.split()[0]}"
+                    self._write_log(applied, environment, backup_path)
             
-            return ConfigChange(
+            return ConfigBatchChange(
                 success=True,
-                path=path,
                 config_path=self.config_path,
+                changes=applied,
                 backup_path=backup_path,
-                old_value=old_value,
-                new_value=value,
                 timestamp=timestamp
             )
             
         except Exception as e:
-            return ConfigChange(
+            return ConfigBatchChange(
                 success=False,
-                path=path,
                 config_path=self.config_path,
                 error=str(e),
+                failed_path=path,
                 timestamp=timestamp
             )
 
+    def set_config_value(self, path: str, value: Any) -> ConfigChange:
+        """设置配置值（支持点号路径和数组索引）"""
+        batch = self.set_config_values([(path, value)])
+        change = batch.changes[0] if batch.changes else {}
+        return ConfigChange(
+            success=batch.success,
+            path=path,
+            config_path=self.config_path,
+            backup_path=batch.backup_path,
+            old_value=change.get('old_value'),
+            new_value=change.get('new_value'),
+            error=batch.error,
+            timestamp=batch.timestamp
+        )
+
     def get_config_summary(self) -> Dict:
         """获取配置摘要"""
         config = self._load_config()
@@ -196,7 +293,7 @@ class ConfigManager:
             'matching': config.get('matching', {})
         }
         
-        return summary
+        return copy.deepcopy(summary)
 
 
 class ConfigMCPWrapper:
@@ -231,6 +328,23 @@ class ConfigMCPWrapper:
         
         return result
 
+    def set_config_values(self, changes: List[Dict]) -> Dict:
+        """批量设置配置值；changes 为 [{"path": ..., "value": ...}, ...]"""
+        paths = ', '.join(str(change.get('path')) for change in changes)
+        logger.info(f"Setting {len(changes)} config values: {paths}")
+        batch = self.manager.set_config_values((change['path'], change['value'])
+                                               for change in changes)
+        
+        return {
+            'success': batch.success,
+            'config_path': batch.config_path,
+            'backup_path': batch.backup_path,
+            'changes': batch.changes,
+            'error': batch.error,
+            'failed_path': batch.failed_path,
+            'timestamp': batch.timestamp
+        }
+
     def get_config_summary(self) -> Dict:
         """获取配置摘要"""
         logger.info("Getting config summary")
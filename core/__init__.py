@@ -4,6 +4,6 @@ Core package for SubMatcher
 核心功能模块
 """
 
-from .submatcher import SubMatcher, Config, FileInfo, MatchResult
+from .submatcher import SubMatcher, Config, FileInfo, MatchResult, CandidateIndex
 
-__all__ = ['SubMatcher', 'Config', 'FileInfo', 'MatchResult']
+__all__ = ['SubMatcher', 'Config', 'FileInfo', 'MatchResult', 'CandidateIndex']
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+稀疏二分图最大权匹配
+按行逐次求最短增广路（带势函数的 Dijkstra，即稀疏版匈牙利算法），
+每个左侧节点附带一个权重为 0 的虚拟列，表示"不匹配"
+
+安装了 scipy（fast 可选依赖）时改用 scipy.sparse.csgraph.min_weight_full_bipartite_matching
+（C 实现的 LAPJVsp），两种实现的总权重相同，只是同分方案之间的取舍可能不同。
+"""
+
+from collections import deque
+from heapq import heappop, heappush
+from itertools import chain
+from operator import itemgetter
+from typing import Dict, List, Tuple
+
+Adjacency = List[List[Tuple[int, float]]]
+
+_INF = float('inf')
+
+# None 表示尚未尝试导入 scipy，False 表示不可用
+_scipy_solver = None
+
+
+def max_weight_matching(adjacency: Adjacency, right_count: int) -> Dict[int, int]:
+    """求最大权匹配，返回 {左侧下标: 右侧下标}
+
+    adjacency[u] 为 (v, weight) 列表，weight 须为正数；不存在的边视为不可匹配。
+    """
+    if not any(adjacency):
+        return {}
+    solver = _load_scipy_solver()
+    if solver:
+        return _scipy_matching(solver, adjacency, right_count)
+    return _augmenting_path_matching(adjacency, right_count)
+
+
+def _load_scipy_solver():
+    global _scipy_solver
+    if _scipy_solver is None:
+        # scipy 为可选依赖，首次求解时才导入，不拖慢启动
+        try:
+            import numpy
+            from scipy.sparse import csr_matrix
+            from scipy.sparse.csgraph import min_weight_full_bipartite_matching
+            _scipy_solver = (numpy, csr_matrix, min_weight_full_bipartite_matching)
+        except ImportError:
+            _scipy_solver = False
+    return _scipy_solver
+
+
+def _scipy_matching(solver, adjacency: Adjacency, right_count: int) -> Dict[int, int]:
+    np, csr_matrix, min_weight_full_bipartite_matching = solver
+    left_count = len(adjacency)
+    counts = np.fromiter(map(len, adjacency), dtype=np.int64, count=left_count)
+    edge_count = int(counts.sum())
+    edges = np.fromiter(chain.from_iterable(chain.from_iterable(adjacency)),
+                        dtype=np.float64, count=2 * edge_count).reshape(edge_count, 2)
+    weights = edges[:, 1]
+    big = float(weights.max()) + 1.0
+    # 与纯 Python 实现相同的代价：big - weight，虚拟列代价为 big，保证总能找到完整匹配
+    rows = np.concatenate([np.repeat(np.arange(left_count), counts), np.arange(left_count)])
+    columns = np.concatenate([edges[:, 0].astype(np.int64), right_count + np.arange(left_count)])
+    costs = np.concatenate([big - weights, np.full(left_count, big)])
+    matrix = csr_matrix((costs, (rows, columns)), shape=(left_count, right_count + left_count))
+    left, right = min_weight_full_bipartite_matching(matrix)
+    return {int(u): int(v) for u, v in zip(left, right) if v < right_count}
+
+
+def _augmenting_path_matching(adjacency: Adjacency, right_count: int) -> Dict[int, int]:
+    """纯 Python 实现
+
+    每行的边按权重从高到低排列并延迟扫描：边的距离不小于 d(u) + 势 + big - weight，
+    该下界超过堆顶时把剩余的边作为一个整体放回堆中，大多数低分边永远不需要扫描。
+    距离相同时优先弹出空闲的列，尽早结束本次增广。
+    """
+    left_count = len(adjacency)
+    max_weight = max((w for edges in adjacency for _, w in edges), default=0.0)
+    if max_weight <= 0:
+        return {}
+
+    # 代价 = big - weight > 0；虚拟列（编号 right_count + u）代价为 big，
+    # 最小代价的左侧完美匹配即为最大权匹配
+    big = max_weight + 1.0
+    column_count = right_count + left_count
+    ranked = [sorted(edges, key=itemgetter(1), reverse=True) for edges in adjacency]
+    left_potential = [0.0] * left_count
+    right_potential = [0.0] * column_count
+    match_left = [-1] * left_count
+    match_right = [-1] * column_count
+    # 每次增广后只重置访问过的列
+    dist_right = [_INF] * column_count
+    parent = [-1] * column_count
+    done_right = [False] * column_count
+
+    for source in range(left_count):
+        if not ranked[source]:
+            continue
+
+        dist_left: Dict[int, float] = {}
+        touched: List[int] = []
+        # 堆元素为（距离，类别，节点，起始位置）：类别 0 为空闲列，1 为已匹配列，
+        # 2 为左侧节点（节点编号取 -1 - u），起始位置是该行尚未扫描的第一条边，-1 表示首次到达
+        heap: List[Tuple[float, int, int, int]] = [(0.0, 2, -1 - source, -1)]
+        target = -1
+        target_dist = 0.0
+        while heap:
+            d, _, v, position = heappop(heap)
+            if v < 0:
+                u = -1 - v
+                if position < 0:
+                    dist_left[u] = d
+                    dummy = right_count + u
+                    nd = d + left_potential[u] + big - right_potential[dummy]
+                    if nd < dist_right[dummy]:
+                        if dist_right[dummy] == _INF:
+                            touched.append(dummy)
+                        dist_right[dummy] = nd
+                        parent[dummy] = u
+                        heappush(heap, (nd, match_right[dummy] >= 0, dummy, 0))
+                    position = 0
+                base = dist_left[u] + left_potential[u] + big
+                edges = ranked[u]
+                for position in range(position, len(edges)):
+                    v, w = edges[position]
+                    bound = base - w
+                    if heap and bound > heap[0][0]:
+                        heappush(heap, (bound, 2, -1 - u, position))
+                        break
+                    if done_right[v]:
+                        continue
+                    nd = bound - right_potential[v]
+                    if nd < dist_right[v]:
+                        if dist_right[v] == _INF:
+                            touched.append(v)
+                        dist_right[v] = nd
+                        parent[v] = u
+                        heappush(heap, (nd, match_right[v] >= 0, v, 0))
+                continue
+
+            if done_right[v]:
+                continue
+            done_right[v] = True
+            owner = match_right[v]
+            if owner < 0:
+                target = v
+                target_dist = d
+                break
+            # 已匹配边经过势函数调整后代价为 0，且 owner 只能经由 v 到达
+            heappush(heap, (d, 2, -1 - owner, -1))
+
+        if target >= 0:
+            for u, d in dist_left.items():
+                left_potential[u] += d - target_dist
+            for v in touched:
+                if done_right[v]:
+                    right_potential[v] += dist_right[v] - target_dist
+
+            v = target
+            while True:
+                u = parent[v]
+                previous = match_left[u]
+                match_left[u] = v
+                match_right[v] = u
+                if u == source:
+                    break
+                v = previous
+
+        for v in touched:
+            dist_right[v] = _INF
+            done_right[v] = False
+
+    return {u: v for u, v in enumerate(match_left) if 0 <= v < right_count}
+
+
+def ambiguous_lefts(adjacency: Adjacency, matching: Dict[int, int]) -> List[int]:
+    """找出存在等价替代方案的左侧节点：matching 中在另一个最大权匹配里匹配不同（或不匹配）的节点
+
+    matching 须为最大权匹配。两个最大权匹配的差由总分不变的交替环与交替路径组成
+    （如三个视频轮换字幕、空闲字幕引起的连锁让位），只检查直接互换会漏掉较长的替代方案。
+    以列为节点：左侧 u 从当前的列 m(u)（未匹配时为其虚拟列）改选列 v 记为弧 m(u) -> v，
+    权重为 u 因此损失的分数。求出各列的最短距离（对偶势）后，只保留势调整后代价为 0 的紧弧；
+    空闲列可以被占用、势为 0 的已匹配列可以空出，两者经由一个公共节点相连。
+    紧弧 m(u) -> v 位于环上（两端在同一强连通分量中）时，u 的匹配不唯一。
+    """
+    left_count = len(adjacency)
+    if not matching:
+        return []
+    right_count = max(chain((v for edges in adjacency for v, _ in edges), matching.values())) + 1
+    column_count = right_count + left_count
+
+    # 每个左侧节点的当前列、当前分数和改选弧（目标列，损失）；虚拟列分数为 0
+    current = [right_count + u for u in range(left_count)]
+    owner = [-1] * column_count
+    arcs: List[List[Tuple[int, float]]] = []
+    max_weight = 0.0
+    for u, edges in enumerate(adjacency):
+        v = matching.get(u)
+        weight = 0.0
+        if v is not None:
+            weight = next(w for other, w in edges if other == v)
+            current[u] = v
+        owner[current[u]] = u
+        moves = [(other, weight - w) for other, w in edges if other != v]
+        if v is not None:
+            moves.append((right_count + u, weight))
+        arcs.append(moves)
+        max_weight = max(max_weight, weight, max((w for _, w in edges), default=0.0))
+    tolerance = 1e-9 * (max_weight + 1.0)
+
+    # 公共源点到每一列的距离为 0；最大权匹配中不存在总分增加的交替环（负环），SPFA 必然收敛
+    distance = [0.0] * column_count
+    queue = deque(range(column_count))
+    queued = [True] * column_count
+    relaxations = [0] * column_count
+    while queue:
+        column = queue.popleft()
+        queued[column] = False
+        u = owner[column]
+        if u < 0:
+            continue
+        base = distance[column]
+        for other, loss in arcs[u]:
+            if base + loss < distance[other] - tolerance:
+                distance[other] = base + loss
+                if not queued[other]:
+                    relaxations[other] += 1
+                    if relaxations[other] > column_count:
+                        raise ValueError("matching 不是最大权匹配")
+                    queued[other] = True
+                    queue.append(other)
+
+    # 紧弧图；节点 column_count 为公共节点
+    hub = column_count
+    tight: List[List[int]] = [[] for _ in range(column_count + 1)]
+    for u in range(left_count):
+        column = current[u]
+        for other, loss in arcs[u]:
+            if abs(distance[column] + loss - distance[other]) <= tolerance:
+                tight[column].append(other)
+    for column in range(column_count):
+        if abs(distance[column]) <= tolerance:
+            if owner[column] < 0:
+                tight[column].append(hub)
+            else:
+                tight[hub].append(column)
+
+    component = _strongly_connected_components(tight)
+    return sorted(u for u in matching
+                  if any(component[other] == component[current[u]] for other in tight[current[u]]))
+
+
+def _strongly_connected_components(graph: List[List[int]]) -> List[int]:
+    """Tarjan 算法（迭代实现），返回每个节点所属分量的编号"""
+    node_count = len(graph)
+    index = [-1] * node_count
+    lowlink = [0] * node_count
+    component = [-1] * node_count
+    on_stack = [False] * node_count
+    stack: List[int] = []
+    counter = 0
+    component_count = 0
+    for root in range(node_count):
+        if index[root] >= 0:
+            continue
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, 0)]
+        while work:
+            node, position = work[-1]
+            edges = graph[node]
+            if position < len(edges):
+                work[-1] = (node, position + 1)
+                other = edges[position]
+                if index[other] < 0:
+                    index[other] = lowlink[other] = counter
+                    counter += 1
+                    stack.append(other)
+                    on_stack[other] = True
+                    work.append((other, 0))
+                elif on_stack[other]:
+                    lowlink[node] = min(lowlink[node], index[other])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component[member] = component_count
+                    if member == node:
+                        break
+                component_count += 1
+    return component
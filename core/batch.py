@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+多媒体库批处理
+将多个相互独立的目录（或一个根目录下的各个剧集子目录）分发到进程池并行处理，汇总为一份报告
+"""
+
+import os
+import sys
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+try:
+    from .submatcher import SubMatcher, Config
+    from .engine import drain
+except ImportError:
+    from submatcher import SubMatcher, Config
+    from engine import drain
+
+# 每个工作进程只构建一次 SubMatcher（配置、分词缓存、自动机在同一进程的任务之间复用）
+_worker_matcher: Optional[SubMatcher] = None
+
+
+def _init_worker(config_path: str) -> None:
+    global _worker_matcher
+    # 工作进程继承父进程的 stdout；MCP 服务器中 stdout 是协议通道，任何输出都改写到 stderr
+    sys.stdout = sys.stderr
+    _worker_matcher = SubMatcher(config_path)
+
+
+def expand_directories(directories: Iterable[str], split_roots: bool = False,
+                       media_extensions: Optional[Iterable[str]] = None) -> List[str]:
+    """规范化目录列表：去重、去掉嵌套在其他目录中的目录；split_roots 时将根目录拆分为各个子目录
+
+    根目录下直接存在媒体文件时不拆分，避免这些文件与子目录中的文件失去匹配机会。
+    media_extensions 为媒体文件扩展名（小写，含点）；为 None 时任何文件都视为媒体文件。
+    """
+    resolved = []
+    for directory in directories:
+        path = Path(directory).resolve()
+        if not path.is_dir():
+            raise ValueError(f"目录不存在：{directory}")
+        resolved.append(path)
+
+    # 同一文件只能由一个工作进程处理：去掉被其他目录包含的目录
+    roots = []
+    for path in sorted(set(resolved)):
+        if not any(root in path.parents for root in roots):
+            roots.append(path)
+
+    if not split_roots:
+        return [str(root) for root in roots]
+
+    if media_extensions is not None:
+        media_extensions = set(media_extensions)
+    shards = []
+    for root in roots:
+        subdirectories = []
+        has_loose_files = False
+        with os.scandir(root) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif entry.is_file() and (
+                        media_extensions is None
+                        or os.path.splitext(entry.name)[1].lower() in media_extensions):
+                    # 说明文件、封面等不参与匹配，不影响拆分
+                    has_loose_files = True
+        if has_loose_files or not subdirectories:
+            shards.append(str(root))
+        else:
+            shards.extend(sorted(subdirectories))
+    return shards
+
+
+def process_directory(directory: str, dry_run: bool,
+                      submatcher: Optional[SubMatcher] = None) -> Dict:
+    """扫描、匹配并重命名单个目录，返回该目录的报告（不向 stdout 输出）"""
+    submatcher = submatcher or _worker_matcher
+    started = time.perf_counter()
+    report = {
+        'directory': directory,
+        'success': True,
+        'video_count': 0,
+        'subtitle_count': 0,
+        'renamed_files': [],
+        'failed_files': [],
+        'skipped_files': [],
+        'journal': None,
+    }
+    try:
+        result = drain(submatcher.engine.run(directory, dry_run=dry_run))
+        report['video_count'] = len(result.videos)
+        report['subtitle_count'] = len(result.subtitles)
+        if result.outcome is not None:
+            report['journal'] = result.outcome.journal
+            for match_result in result.matches:
+                if result.outcome.succeeded(str(match_result.subtitle.path)):
+                    report['renamed_files'].append({
+                        'old_name': match_result.subtitle.name,
+                        'new_name': match_result.video.stem + match_result.subtitle.extension,
+                        'video_name': match_result.video.name,
+                        'score': match_result.score
+                    })
+                else:
+                    report['failed_files'].append(match_result.subtitle.name)
+            report['skipped_files'] = [video.name for video in result.unmatched]
+    except Exception as e:
+        report['success'] = False
+        report['error'] = str(e)
+
+    report['renamed_count'] = len(report['renamed_files'])
+    report['failed_count'] = len(report['failed_files'])
+    report['skipped_count'] = len(report['skipped_files'])
+    report['elapsed'] = time.perf_counter() - started
+    return report
+
+
+def run_batch(config_path: str, directories: Iterable[str], dry_run: bool = True,
+              max_workers: Optional[int] = None, split_roots: bool = False) -> Dict:
+    """在进程池中处理多个目录，返回汇总报告；各目录的结果按目录路径排序"""
+    started = time.perf_counter()
+    config = Config(config_path)
+    shards = expand_directories(directories, split_roots,
+                                config.get_video_extensions() + config.get_subtitle_extensions())
+    max_workers = max(1, min(max_workers or os.cpu_count() or 1, len(shards) or 1))
+
+    results = []
+    if max_workers == 1:
+        # 单个工作进程时不必启动进程池
+        submatcher = SubMatcher(config_path)
+        results = [process_directory(shard, dry_run, submatcher) for shard in shards]
+    else:
+        # MCP 服务器进程中有其他线程，使用 spawn 避免 fork 继承被占用的锁
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(config_path,)) as executor:
+            futures = {executor.submit(process_directory, shard, dry_run): shard
+                       for shard in shards}
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append({'directory': futures[future], 'success': False, 'error': str(e),
+                                    'renamed_count': 0, 'failed_count': 0, 'skipped_count': 0})
+        results.sort(key=lambda report: report['directory'])
+
+    return {
+        'success': all(report['success'] for report in results),
+        'dry_run': dry_run,
+        'directory_count': len(results),
+        'renamed_count': sum(report['renamed_count'] for report in results),
+        'failed_count': sum(report['failed_count'] for report in results),
+        'skipped_count': sum(report['skipped_count'] for report in results),
+        'error_count': sum(1 for report in results if not report['success']),
+        'workers': max_workers,
+        'elapsed': time.perf_counter() - started,
+        'results': results,
+    }
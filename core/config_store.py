@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+共享配置存储
+同一配置文件在进程内只解析一次：按 (inode, mtime, size) 判断文件是否变化，未变化时直接返回缓存的配置树；
+写入采用临时文件 + os.replace，变化后通知订阅者（Config 等）重新编译派生的表。
+写入前的校验由调用方负责（见 submatcher.validate_config）；订阅者的异常不会中断通知
+"""
+
+import os
+import sys
+import threading
+import types
+import weakref
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import yaml
+
+Signature = Tuple[int, int, int]
+
+
+def _signature(path: str) -> Signature:
+    st = os.stat(path)
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class ConfigStore:
+    _stores: Dict[str, 'ConfigStore'] = {}
+    _stores_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data: Optional[dict] = None
+        self._signature: Optional[Signature] = None
+        self._lock = threading.RLock()
+        self._listeners: list = []
+
+    @classmethod
+    def for_path(cls, path: str) -> 'ConfigStore':
+        """返回该配置文件的共享存储（按绝对路径区分）"""
+        key = str(Path(path).resolve())
+        with cls._stores_lock:
+            store = cls._stores.get(key)
+            if store is None:
+                store = cls._stores[key] = cls(key)
+            return store
+
+    def load(self) -> dict:
+        """返回当前配置树；文件未变化时不重新解析。调用方不得修改返回的对象
+
+        文件不存在时抛出 FileNotFoundError，YAML 格式错误时抛出 yaml.YAMLError。
+        """
+        signature = _signature(self.path)
+        with self._lock:
+            if signature == self._signature:
+                return self._data
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = yaml.safe_load(f) or {}
+            changed = self._data is not None
+            self._data, self._signature = data, signature
+        if changed:
+            self._notify(data)
+        return data
+
+    def write(self, data: dict) -> None:
+        """原子写入配置文件并通知订阅者；写入后 data 成为新的缓存配置树"""
+        tmp_path = f"{self.path}.tmp"
+        with self._lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                yaml.dump(data, f, allow_unicode=True, default_flow_style=False, sort_keys=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._data, self._signature = data, _signature(self.path)
+        self._notify(data)
+
+    def subscribe(self, callback: Callable[[dict], None]) -> None:
+        """注册配置变化回调；绑定方法以弱引用保存，不会阻止订阅者被回收
+
+        函数与内置方法（如 list.append）按强引用保存。
+        """
+        if isinstance(callback, types.MethodType):
+            reference = weakref.WeakMethod(callback)
+        else:
+            def reference():
+                return callback
+        with self._lock:
+            self._listeners.append(reference)
+
+    def _notify(self, data: dict) -> List[Exception]:
+        """通知所有订阅者，返回失败的回调抛出的异常
+
+        每个回调单独捕获异常：一个订阅者失败不会跳过其他订阅者，文件与各订阅者的配置始终一致
+        """
+        with self._lock:
+            self._listeners = [
+                reference for reference in self._listeners if reference() is not None
+            ]
+            callbacks = [reference() for reference in self._listeners]
+        errors = []
+        for callback in callbacks:
+            if callback is None:
+                continue
+            try:
+                callback(data)
+            except Exception as e:
+                print(f"警告：配置变化回调失败：{e}", file=sys.stderr)
+                errors.append(e)
+        return errors
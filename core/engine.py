@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+匹配引擎
+以生成器的形式执行扫描 → 聚类 → 匹配 → 重命名，逐步产出结构化事件，由调用方决定如何使用：
+CLI 把事件交给 ConsoleSink 输出，MCP 适配器和批处理只收集最终的 RunCompleted。
+不传入 sink 时引擎不做任何文本格式化
+
+    result = drain(submatcher.engine.run(directory, dry_run=True), ConsoleSink(verbose=True))
+"""
+
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Generator, Iterable, List, Optional, Set
+
+try:
+    from .submatcher import FileInfo, MatchResult, ShowClusters
+    from .journal import RenameOutcome
+except ImportError:
+    from submatcher import FileInfo, MatchResult, ShowClusters
+    from journal import RenameOutcome
+
+# run() 的执行范围：只扫描 / 扫描并匹配 / 完整执行（含重命名）
+UNTIL_SCAN = 'scan'
+UNTIL_MATCH = 'match'
+UNTIL_RENAME = 'rename'
+_UNTIL = (UNTIL_SCAN, UNTIL_MATCH, UNTIL_RENAME)
+
+
+@dataclass
+class RunStarted:
+    directory: str
+    dry_run: bool
+
+
+@dataclass
+class ScanCompleted:
+    directory: str
+    videos: List[FileInfo]
+    subtitles: List[FileInfo]
+    stats: Dict
+
+
+@dataclass
+class TokensAnalyzed:
+    global_tokens: Set[str]
+    token_counter: Counter
+    # matching.partition 为 show 时的剧集分组
+    clusters: Optional[ShowClusters] = None
+
+
+@dataclass
+class VideoMatched:
+    """每个视频一个事件，按扫描顺序产出；match 为 None 表示未匹配"""
+    video: FileInfo
+    match: Optional[MatchResult]
+
+
+@dataclass
+class SubtitleRenamed:
+    """一个字幕的重命名结果（整批事务执行之后产出）；error 为 None 表示成功"""
+    match: MatchResult
+    source: str
+    target: str
+    dry_run: bool
+    error: Optional[str] = None
+
+
+@dataclass
+class RenameCompleted:
+    outcome: RenameOutcome
+    dry_run: bool
+
+
+@dataclass
+class RunCompleted:
+    """一次执行的最终结果，总是最后一个事件"""
+    directory: str
+    dry_run: bool
+    videos: List[FileInfo] = field(default_factory=list)
+    subtitles: List[FileInfo] = field(default_factory=list)
+    scan_stats: Dict = field(default_factory=dict)
+    matches: List[MatchResult] = field(default_factory=list)
+    unmatched: List[FileInfo] = field(default_factory=list)
+    # 未执行重命名（until 为 scan / match，或没有可匹配的文件）时为 None
+    outcome: Optional[RenameOutcome] = None
+    # 视频路径 -> 备选字幕，只在 run(alternatives=True) 时收集
+    alternatives: Dict[Path, List[MatchResult]] = field(default_factory=dict)
+
+    @property
+    def renamed(self) -> List[MatchResult]:
+        if self.outcome is None:
+            return []
+        return [match for match in self.matches if self.outcome.succeeded(str(match.subtitle.path))]
+
+    @property
+    def failed(self) -> List[MatchResult]:
+        if self.outcome is None:
+            return []
+        return [match for match in self.matches
+                if not self.outcome.succeeded(str(match.subtitle.path))]
+
+
+@dataclass
+class StreamScanned:
+    """流式模式的扫描结果：文件只计数，记录已写入溢出文件"""
+    directory: str
+    video_count: int
+    subtitle_count: int
+    groups: int
+    stats: Dict
+
+
+@dataclass
+class SubtitleUnmatched:
+    """流式模式中未匹配或重命名失败的字幕，在 StreamCompleted 之前按路径顺序产出"""
+    path: str
+
+
+@dataclass
+class StreamCompleted:
+    """流式模式的最终结果，总是最后一个事件；匹配结果已通过 VideoMatched 逐个产出，这里只保留计数"""
+    directory: str
+    dry_run: bool
+    until: str = UNTIL_RENAME
+    video_count: int = 0
+    subtitle_count: int = 0
+    groups: int = 0
+    matched_count: int = 0
+    unmatched_count: int = 0
+    renamed_count: int = 0
+    # 未匹配或重命名失败的字幕数，路径已通过 SubtitleUnmatched 逐个产出
+    unmatched_subtitle_count: int = 0
+    # 每批重命名一个日志
+    journals: List[str] = field(default_factory=list)
+
+
+Sink = Callable[[object], None]
+
+
+def drain(events: Iterable, sink: Optional[Sink] = None):
+    """消费事件流，依次交给 sink，返回最后一个事件（run() 为 RunCompleted，rename() 为 RenameCompleted）"""
+    event = None
+    if sink is None:
+        for event in events:
+            pass
+    else:
+        for event in events:
+            sink(event)
+    return event
+
+
+class Engine:
+    def __init__(self, submatcher):
+        self.submatcher = submatcher
+
+    def run(self, directory: str, dry_run: bool = True, until: str = UNTIL_RENAME,
+            scan_progress: Optional[Callable[[int, int], None]] = None,
+            alternatives: bool = False) -> Generator:
+        """扫描、匹配并重命名目录，逐步产出事件，最后产出 RunCompleted
+
+        alternatives 为 True 时在分配过程中顺便收集每个视频的备选字幕（RunCompleted.alternatives）
+        """
+        if until not in _UNTIL:
+            raise ValueError(f"未知的执行范围：{until}")
+        submatcher = self.submatcher
+        yield RunStarted(directory, dry_run)
+
+        video_files, subtitle_files = submatcher.file_scanner.scan_directory(directory,
+                                                                             scan_progress)
+        scan_stats = submatcher.file_scanner.last_scan_stats
+        yield ScanCompleted(directory, video_files, subtitle_files, scan_stats)
+        result = RunCompleted(directory, dry_run, video_files, subtitle_files, scan_stats)
+        if until == UNTIL_SCAN or not video_files or not subtitle_files:
+            yield result
+            return
+
+        all_files = video_files + subtitle_files
+        global_tokens, token_counter = submatcher.cluster_analyzer.analyze(all_files)
+        clusters = None
+        if submatcher.config.get_matching_config().get('partition', 'none') == 'show':
+            clusters = submatcher.cluster_analyzer.show_clusters(video_files, subtitle_files)
+        yield TokensAnalyzed(global_tokens, token_counter, clusters)
+
+        matches = submatcher.matcher.assign(video_files, subtitle_files, global_tokens, clusters,
+                                            result.alternatives if alternatives else None)
+        assignments = {match_result.video.path: match_result for match_result in matches}
+        for video in video_files:
+            match_result = assignments.get(video.path)
+            if match_result is None:
+                result.unmatched.append(video)
+            else:
+                result.matches.append(match_result)
+            yield VideoMatched(video, match_result)
+
+        if until == UNTIL_RENAME:
+            # 整批作为一次事务重命名，中断后可用日志撤销
+            result.outcome = yield from self.rename(result.matches, dry_run)
+        yield result
+
+    def run_streaming(self, directory: str, dry_run: bool = True,
+                      until: str = UNTIL_RENAME) -> Generator:
+        """流式执行：内存占用不随文件数增长，最后产出 StreamCompleted（见 streaming 模块）"""
+        if until not in _UNTIL:
+            raise ValueError(f"未知的执行范围：{until}")
+        try:
+            from .streaming import StreamingRun
+        except ImportError:
+            from streaming import StreamingRun
+        return StreamingRun(self.submatcher, directory, dry_run, until).events()
+
+    def rename(self, matches: List[MatchResult], dry_run: bool = True,
+               journal_group: Optional[str] = None) -> Generator:
+        """整批重命名，逐个产出 SubtitleRenamed，最后产出 RenameCompleted；生成器的返回值为 RenameOutcome"""
+        renamer = self.submatcher.renamer
+        outcome = renamer.rename_batch(matches, dry_run=dry_run, journal_group=journal_group)
+        for match_result in matches:
+            source = match_result.subtitle.path
+            target = renamer.target_path(match_result)
+            if target == source:
+                continue
+            yield SubtitleRenamed(match_result, str(source), str(target), dry_run,
+                                  outcome.errors.get(str(source)))
+        yield RenameCompleted(outcome, dry_run)
+        return outcome
+
+
+class ConsoleSink:
+    """将引擎事件格式化输出到控制台（CLI 与监视模式使用）"""
+
+    def __init__(self, verbose: bool = False, log_unmatched: bool = True):
+        self.verbose = verbose
+        self.log_unmatched = log_unmatched
+        self._dry_run = True
+        self._matched = 0
+        self._renaming = False
+        self._unmatched_subtitles = 0
+        self._handlers = {
+            RunStarted: self._run_started,
+            ScanCompleted: self._scan_completed,
+            TokensAnalyzed: self._tokens_analyzed,
+            VideoMatched: self._video_matched,
+            SubtitleRenamed: self._subtitle_renamed,
+            RenameCompleted: self._rename_completed,
+            RunCompleted: self._run_completed,
+            StreamScanned: self._stream_scanned,
+            SubtitleUnmatched: self._subtitle_unmatched,
+            StreamCompleted: self._stream_completed,
+        }
+
+    def __call__(self, event) -> None:
+        handler = self._handlers.get(type(event))
+        if handler is not None:
+            handler(event)
+
+    def _run_started(self, event: RunStarted) -> None:
+        self._dry_run = event.dry_run
+        self._matched = 0
+        self._unmatched_subtitles = 0
+        print(f"扫描目录：{event.directory}")
+
+    def _scan_completed(self, event: ScanCompleted) -> None:
+        print(f"找到 {len(event.videos)} 个视频文件")
+        print(f"找到 {len(event.subtitles)} 个字幕文件")
+        if self.verbose and event.stats:
+            print(f"扫描耗时：{event.stats['elapsed']:.2f} 秒"
+                  f"（{event.stats['entries']} 个条目，{event.stats['files_per_sec']:.0f} 个/秒）")
+
+    def _tokens_analyzed(self, event: TokensAnalyzed) -> None:
+        if self.verbose:
+            print("\n全局Token（前20个）：")
+            for token, count in event.token_counter.most_common(20):
+                print(f"  {token}: {count}")
+            if event.clusters is not None:
+                unclustered = (len(event.clusters.unclustered_videos)
+                               + len(event.clusters.unclustered_subtitles))
+                print(f"\n剧集分组：{len(event.clusters.clusters)} 组（未分组文件 {unclustered} 个）")
+        self._print_mode()
+
+    def _print_mode(self) -> None:
+        if self._dry_run:
+            print("\n=== 演习模式（Dry Run）===")
+            print("仅显示拟重命名结果，不会实际修改文件")
+            print("使用 --confirm 或 -y 参数执行实际重命名\n")
+        else:
+            print("\n=== 执行模式 ===")
+            print("将实际重命名字幕文件\n")
+
+    def _video_matched(self, event: VideoMatched) -> None:
+        match_result = event.match
+        if match_result is None:
+            if self.verbose:
+                print(f"\n未匹配：{event.video.name}")
+            return
+        self._matched += 1
+        if self.verbose:
+            base_score = (match_result.score - match_result.language_weight
+                          - match_result.format_weight - match_result.lineage_bonus)
+            print(f"\n匹配：{event.video.name}")
+            print(f"  字幕：{match_result.subtitle.name}")
+            print(f"  评分：{match_result.score:.1f}")
+            print(f"    - 基础分：{base_score:.1f}")
+            print(f"    - 语言权重：{match_result.language_weight:.1f}")
+            print(f"    - 格式权重：{match_result.format_weight:.1f}")
+            print(f"    - 血统加分：{match_result.lineage_bonus:.1f}")
+
+    def _start_renaming(self) -> None:
+        if not self._renaming:
+            self._renaming = True
+            if self.verbose and self._matched:
+                print()
+
+    def _subtitle_renamed(self, event: SubtitleRenamed) -> None:
+        self._start_renaming()
+        old_name = Path(event.source).name
+        new_name = Path(event.target).name
+        if event.error:
+            print(f"[ERROR] 重命名失败：{old_name} -> {new_name}")
+            print(f"  错误信息：{event.error}")
+        elif event.dry_run:
+            print(f"[DRY RUN] {old_name} -> {new_name}")
+        else:
+            print(f"[RENAME] {old_name} -> {new_name}")
+
+    def _rename_completed(self, event: RenameCompleted) -> None:
+        self._start_renaming()
+        if event.outcome.journal:
+            print(f"重命名日志：{event.outcome.journal}")
+        self._renaming = False
+        self._matched = 0
+
+    def _run_completed(self, event: RunCompleted) -> None:
+        if not event.videos or not event.subtitles:
+            print("未找到视频或字幕文件，退出")
+            return
+        if event.outcome is None:
+            return
+
+        renamed_subtitles = {match_result.subtitle.path for match_result in event.renamed}
+        remaining = [subtitle for subtitle in event.subtitles
+                     if subtitle.path not in renamed_subtitles]
+        print("\n=== 总结 ===")
+        print(f"匹配成功：{len(renamed_subtitles)} 个")
+        print(f"跳过：{len(event.unmatched)} 个")
+        print(f"剩余未匹配字幕：{len(remaining)} 个")
+
+        if self.log_unmatched and remaining:
+            print("\n未匹配的字幕文件：")
+            for subtitle in remaining:
+                print(f"  {subtitle.name}")
+
+    def _stream_scanned(self, event: StreamScanned) -> None:
+        print(f"找到 {event.video_count} 个视频文件")
+        print(f"找到 {event.subtitle_count} 个字幕文件")
+        if self.verbose:
+            print(f"扫描耗时：{event.stats['elapsed']:.2f} 秒"
+                  f"（{event.stats['entries']} 个条目，{event.stats['files_per_sec']:.0f} 个/秒）")
+            print(f"\n分组：{event.groups} 组")
+        if event.video_count and event.subtitle_count:
+            self._print_mode()
+
+    def _subtitle_unmatched(self, event: SubtitleUnmatched) -> None:
+        if not self.log_unmatched:
+            return
+        if not self._unmatched_subtitles:
+            print("\n未匹配的字幕文件：")
+        self._unmatched_subtitles += 1
+        print(f"  {Path(event.path).name}")
+
+    def _stream_completed(self, event: StreamCompleted) -> None:
+        if not event.video_count or not event.subtitle_count:
+            print("未找到视频或字幕文件，退出")
+            return
+        if event.until != UNTIL_RENAME:
+            return
+
+        print("\n=== 总结 ===")
+        print(f"匹配成功：{event.renamed_count} 个")
+        print(f"跳过：{event.unmatched_count} 个")
+        print(f"剩余未匹配字幕：{event.subtitle_count - event.renamed_count} 个")
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+事务化批量重命名
+执行前用目标路径索引检查整批计划（冲突、覆盖已有文件、链式与循环重命名），
+再分两阶段移动：先将所有源文件移到临时名，再从临时名移到目标名。
+每批写一份逐条 fsync 的日志，中途失败自动回滚，崩溃或误操作后可用日志撤销：
+    python core/submatcher.py undo <日志文件>
+"""
+
+import json
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 日志状态：begin（已记录计划）→ staged（源文件均已移到临时名）→ committed / rolled_back
+STATE_BEGIN = 'begin'
+STATE_STAGED = 'staged'
+STATE_COMMITTED = 'committed'
+STATE_ROLLED_BACK = 'rolled_back'
+
+TEMP_SUFFIX = '.submatcher.tmp'
+
+
+@dataclass
+class RenameOperation:
+    source: str
+    target: str
+    temp: str = ''
+    inode: int = 0
+
+    def to_dict(self) -> Dict:
+        return {'source': self.source, 'target': self.target, 'temp': self.temp,
+                'inode': self.inode}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'RenameOperation':
+        return cls(data['source'], data['target'], data.get('temp', ''), data.get('inode', 0))
+
+
+@dataclass
+class RenameOutcome:
+    """一批重命名的结果：errors 记录未执行的操作（源路径 -> 原因）"""
+    operations: List[RenameOperation] = field(default_factory=list)
+    errors: Dict[str, str] = field(default_factory=dict)
+    journal: Optional[str] = None
+    state: Optional[str] = None
+
+    def succeeded(self, source: str) -> bool:
+        return source not in self.errors and self.state in (STATE_COMMITTED, None)
+
+
+def check_operations(operations: Sequence[RenameOperation]
+                     ) -> Tuple[List[RenameOperation], Dict[str, str]]:
+    """用目标路径索引检查整批操作，返回（可执行的操作，被拒绝的源路径 -> 原因）
+
+    - 源路径与目标相同的操作为空操作，直接拒绝
+    - 同一源或同一目标只保留第一个操作（重复的源直接忽略）
+    - 目标已存在且不会在本批中被移走时拒绝（不覆盖已有文件）
+    链式（A->B、B->C）与循环（A->B、B->A）重命名由两阶段移动处理；
+    被拒绝的操作留在原地，依赖其让出位置的操作随之被拒绝，直到稳定。
+    """
+    errors: Dict[str, str] = {}
+    by_source: Dict[str, RenameOperation] = {}
+    by_target: Dict[str, RenameOperation] = {}
+    for operation in operations:
+        if operation.source == operation.target:
+            errors[operation.source] = '源文件与目标相同'
+        elif operation.source in by_source:
+            continue
+        elif operation.target in by_target:
+            errors[operation.source] = f'目标与 {Path(by_target[operation.target].source).name} 冲突'
+        elif not os.path.lexists(operation.source):
+            errors[operation.source] = '源文件不存在'
+        else:
+            by_source[operation.source] = operation
+            by_target[operation.target] = operation
+
+    changed = True
+    while changed:
+        changed = False
+        for target, operation in list(by_target.items()):
+            # 目标已被占用：只有占用者本身也在本批中移走时才可继续
+            if target in errors and os.path.lexists(target):
+                reason = f'目标被未移动的 {Path(target).name} 占用'
+            elif os.path.lexists(target) and target not in by_source:
+                reason = '目标文件已存在'
+            else:
+                continue
+            errors[operation.source] = reason
+            del by_source[operation.source]
+            del by_target[target]
+            changed = True
+
+    accepted = [operation for operation in operations
+                if by_source.get(operation.source) is operation]
+    return accepted, errors
+
+
+def _fsync_directory(directory: str) -> None:
+    # 目录 fsync 保证 rename 本身落盘；Windows 等平台不支持时忽略
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class RenameJournal:
+    """JSON Lines 格式的重命名日志：首行为计划，其后每次状态变化追加一行，每次写入均 fsync"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = None
+
+    def begin(self, batch_id: str, operations: Sequence[RenameOperation]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'x', encoding='utf-8')
+        self._append({'state': STATE_BEGIN, 'batch_id': batch_id, 'created': time.time(),
+                      'operations': [operation.to_dict() for operation in operations]})
+        _fsync_directory(str(self.path.parent))
+
+    def mark(self, state: str, **extra) -> None:
+        self._append({'state': state, 'time': time.time(), **extra})
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _append(self, record: Dict) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    @staticmethod
+    def load(path: str) -> Tuple[List[RenameOperation], str]:
+        """读取日志，返回（操作列表，最后记录的状态）；崩溃时截断的末行被忽略"""
+        operations: List[RenameOperation] = []
+        state = None
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if record.get('state') == STATE_BEGIN:
+                    operations = [RenameOperation.from_dict(data) for data in record['operations']]
+                state = record.get('state', state)
+        if state is None:
+            raise ValueError(f"无效的重命名日志：{path}")
+        return operations, state
+
+
+class BatchRenamer:
+    def __init__(self, journal_dir: Optional[str] = None, keep: int = 100):
+        self.journal_dir = Path(os.path.expanduser(journal_dir)) if journal_dir else None
+        self.keep = keep
+
+    def execute(self, operations: Sequence[RenameOperation], dry_run: bool = True,
+                group: Optional[str] = None) -> RenameOutcome:
+        """检查并执行一批重命名；任一步失败时按相反顺序回滚已完成的移动
+
+        group 为日志分组（如一个监视会话）：日志写入 journal_dir 下的同名子目录，清理时整组计为一份。
+        """
+        valid, errors = check_operations(operations)
+        outcome = RenameOutcome(operations=valid, errors=errors)
+        if dry_run or not valid:
+            return outcome
+
+        batch_id = uuid.uuid4().hex
+        for index, operation in enumerate(valid):
+            temp_name = f".{batch_id[:12]}-{index}{TEMP_SUFFIX}"
+            operation.temp = str(Path(operation.source).parent / temp_name)
+            operation.inode = os.lstat(operation.source).st_ino
+
+        journal = None
+        if self.journal_dir is not None:
+            journal_name = f"{time.strftime('%Y%m%d-%H%M%S')}-{batch_id[:12]}.jsonl"
+            journal_dir = self.journal_dir / group if group else self.journal_dir
+            journal = RenameJournal(journal_dir / journal_name)
+            journal.begin(batch_id, valid)
+            outcome.journal = str(journal.path)
+
+        done: List[Tuple[str, str]] = []
+        try:
+            for operation in valid:
+                os.rename(operation.source, operation.temp)
+                done.append((operation.source, operation.temp))
+            self._sync(valid)
+            if journal is not None:
+                journal.mark(STATE_STAGED)
+            for operation in valid:
+                # 检查之后目标可能被其他进程创建：宁可回滚也不覆盖
+                if os.path.lexists(operation.target):
+                    raise FileExistsError(f"目标文件已存在：{operation.target}")
+                os.rename(operation.temp, operation.target)
+                done.append((operation.temp, operation.target))
+            self._sync(valid)
+            outcome.state = STATE_COMMITTED
+            if journal is not None:
+                journal.mark(STATE_COMMITTED)
+        except OSError as e:
+            rollback_errors = self._rollback(done)
+            outcome.state = STATE_ROLLED_BACK
+            for operation in valid:
+                errors.setdefault(operation.source, f'批量重命名已回滚：{e}')
+            if journal is not None:
+                journal.mark(STATE_ROLLED_BACK, error=str(e), rollback_errors=rollback_errors)
+        finally:
+            if journal is not None:
+                journal.close()
+                self._prune()
+        return outcome
+
+    def undo(self, journal_path: str, dry_run: bool = False) -> RenameOutcome:
+        """依据日志将文件恢复到原名；文件可能位于原名、临时名或目标名（崩溃中断时）
+
+        撤销本身也作为一批事务执行并写入新的日志。
+        """
+        operations, _ = RenameJournal.load(journal_path)
+        reverse = []
+        errors: Dict[str, str] = {}
+        for operation in operations:
+            if operation.temp and os.path.lexists(operation.temp):
+                current = operation.temp
+            elif os.path.lexists(operation.target) and (
+                    not os.path.lexists(operation.source)
+                    or (operation.inode and os.lstat(operation.target).st_ino == operation.inode)):
+                # 链式或循环重命名后源路径已被其他文件占用，按 inode 确认目标仍是本文件
+                current = operation.target
+            else:
+                # 未被移动，或已恢复
+                continue
+            if operation.inode and os.lstat(current).st_ino != operation.inode:
+                errors[current] = '文件已被替换，跳过'
+                continue
+            reverse.append(RenameOperation(current, operation.source))
+
+        outcome = self.execute(reverse, dry_run=dry_run)
+        outcome.errors.update(errors)
+        return outcome
+
+    def _rollback(self, done: List[Tuple[str, str]]) -> List[str]:
+        failures = []
+        for source, destination in reversed(done):
+            try:
+                os.rename(destination, source)
+            except OSError as e:
+                failures.append(f"{destination} -> {source}: {e}")
+        return failures
+
+    @staticmethod
+    def _sync(operations: Sequence[RenameOperation]) -> None:
+        for directory in {str(Path(operation.source).parent) for operation in operations}:
+            _fsync_directory(directory)
+
+    def _prune(self) -> None:
+        """只保留最近的 keep 份日志；分组子目录整体计为一份，组内的新日志使其保持为最近"""
+        if not self.keep:
+            return
+        entries = []
+        try:
+            for entry in self.journal_dir.iterdir():
+                if entry.suffix == '.jsonl' or entry.is_dir():
+                    entries.append((entry.stat().st_mtime, entry.name, entry))
+        except OSError:
+            return
+        entries.sort(reverse=True)
+        for _, _, entry in entries[self.keep:]:
+            try:
+                if entry.is_dir():
+                    shutil.rmtree(entry)
+                else:
+                    entry.unlink()
+            except OSError:
+                pass
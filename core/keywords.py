@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+多模式关键词匹配（Aho-Corasick 自动机）
+用于语言关键词和压制组标识的一次性线性扫描
+"""
+
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List, Set, Tuple
+
+
+class KeywordAutomaton:
+    """将 (关键词, 标签) 编译为自动机，search 返回文本中出现的所有标签"""
+
+    def __init__(self, keywords: Iterable[Tuple[str, int]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        outputs: List[Set[int]] = [set()]
+        # 空关键词是任何文本的子串
+        always = set()
+        for keyword, label in keywords:
+            if not keyword:
+                always.add(label)
+                continue
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    outputs.append(set())
+                state = next_state
+            outputs[state].add(label)
+        self.always: FrozenSet[int] = frozenset(always)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                outputs[next_state] |= outputs[self._fail[next_state]]
+
+        self._outputs: List[FrozenSet[int]] = [frozenset(labels) for labels in outputs]
+
+    def search(self, text: str) -> FrozenSet[int]:
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        found = set(self.always)
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found |= outputs[state]
+        return frozenset(found)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+运行指标
+按阶段（扫描、解析、聚类、评分、分配、重命名……）累计耗时和处理数量，并汇总缓存命中率与进程峰值内存。
+只在阶段粒度计时（每次调用几次 perf_counter），不在逐文件的循环中记录；关闭时 stage() 返回空上下文
+"""
+
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+class StageRecord:
+    """一次阶段执行中记录的计数，在阶段结束时并入累计值"""
+    __slots__ = ('counts',)
+
+    def __init__(self):
+        self.counts: Dict[str, float] = {}
+
+    def count(self, name: str, value: float = 1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + value
+
+
+class _NullRecord:
+    __slots__ = ()
+
+    def count(self, name: str, value: float = 1) -> None:
+        pass
+
+
+NULL_RECORD = _NullRecord()
+_NULL_STAGE = nullcontext(NULL_RECORD)
+# 计时字段，其余字段为 record.count 记录的计数
+_TIMING_KEYS = ('calls', 'total_seconds', 'max_seconds', 'last_seconds', 'mean_seconds')
+
+
+class Metrics:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, float]] = {}
+        self._counters: Dict[str, float] = {}
+        # 缓存命中：名称 -> [命中，未命中]；register_cache 注册的函数在 snapshot 时读取
+        self._cache_counts: Dict[str, List[int]] = {}
+        self._caches: Dict[str, Callable[[], Tuple[int, int]]] = {}
+        self.started = time.time()
+
+    def stage(self, name: str):
+        """计时上下文：with metrics.stage('scan') as record: record.count('files', n)"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name: str) -> Iterator[StageRecord]:
+        record = StageRecord()
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            self.record(name, time.perf_counter() - started, record.counts)
+
+    def record(self, name: str, seconds: float, counts: Optional[Dict[str, float]] = None) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = {'calls': 0, 'total_seconds': 0.0, 'max_seconds': 0.0}
+            stage['calls'] += 1
+            stage['total_seconds'] += seconds
+            stage['max_seconds'] = max(stage['max_seconds'], seconds)
+            stage['last_seconds'] = seconds
+            for key, value in (counts or {}).items():
+                stage[key] = stage.get(key, 0) + value
+
+    def count(self, name: str, value: float = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def cache(self, name: str, hits: int, misses: int) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            counts = self._cache_counts.setdefault(name, [0, 0])
+            counts[0] += hits
+            counts[1] += misses
+
+    def register_cache(self, name: str, stats: Callable[[], Tuple[int, int]]) -> None:
+        """注册自带统计的缓存（如 lru_cache），stats 返回累计的（命中，未命中）"""
+        self._caches[name] = stats
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self._cache_counts.clear()
+            self.started = time.time()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stages = {name: dict(stage) for name, stage in self._stages.items()}
+            counters = dict(self._counters)
+            cache_counts = {name: tuple(counts) for name, counts in self._cache_counts.items()}
+        for stage in stages.values():
+            stage['mean_seconds'] = stage['total_seconds'] / stage['calls']
+        for name, stats in self._caches.items():
+            cache_counts[name] = tuple(stats())
+
+        caches = {}
+        for name, (hits, misses) in cache_counts.items():
+            total = hits + misses
+            caches[name] = {'hits': hits, 'misses': misses,
+                            'hit_rate': hits / total if total else None}
+
+        return {
+            'enabled': self.enabled,
+            'since': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started)),
+            'stages': stages,
+            'counters': counters,
+            'caches': caches,
+            'peak_memory_mb': peak_memory_mb(),
+        }
+
+    def format(self) -> str:
+        """格式化为表格文本（CLI --profile 输出）"""
+        snapshot = self.snapshot()
+        lines = [f"{'阶段':<20}{'次数':>6}{'总耗时(秒)':>12}{'平均(毫秒)':>12}  计数"]
+        stages = sorted(snapshot['stages'].items(), key=lambda item: -item[1]['total_seconds'])
+        for name, stage in stages:
+            counts = ', '.join(f"{key}={_format_number(value)}" for key, value in stage.items()
+                               if key not in _TIMING_KEYS)
+            lines.append(f"{name:<20}{stage['calls']:>6}{stage['total_seconds']:>12.3f}"
+                         f"{stage['mean_seconds'] * 1000:>12.1f}  {counts}")
+        for name, cache in snapshot['caches'].items():
+            rate = '-' if cache['hit_rate'] is None else f"{cache['hit_rate']:.1%}"
+            lines.append(f"缓存 {name}：命中 {cache['hits']}，未命中 {cache['misses']}，命中率 {rate}")
+        if snapshot['peak_memory_mb'] is not None:
+            lines.append(f"峰值内存：{snapshot['peak_memory_mb']:.1f} MB")
+        return '\n'.join(lines)
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else f"{value:.3f}"
+
+
+def peak_memory_mb() -> Optional[float]:
+    """进程峰值常驻内存（MB）；不支持 resource 模块的平台返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+重命名计划
+预览时生成可序列化的计划并记录文件指纹（inode、mtime、size），
+执行时只需校验指纹即可直接应用，无需重新扫描和匹配
+
+扫描结果的分页快照（ScanSnapshot）使用同样的存储，翻页时不必重新扫描
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from .submatcher import DEFAULT_PLAN_DIR, FileInfo, FileType, MatchResult
+    from .scan_cache import FileStat
+except ImportError:
+    from submatcher import DEFAULT_PLAN_DIR, FileInfo, FileType, MatchResult
+    from scan_cache import FileStat
+
+
+def _stat(path: Path) -> Optional[FileStat]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return FileStat(st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _file_info_to_dict(file_info: FileInfo) -> Dict:
+    return {
+        'path': str(file_info.path),
+        'file_type': file_info.file_type.value,
+        'tokens': list(file_info.tokens),
+        'season': file_info.season,
+        'episode': file_info.episode
+    }
+
+
+def _file_info_from_dict(data: Dict) -> FileInfo:
+    return FileInfo(
+        data['path'],
+        FileType(data['file_type']),
+        data['tokens'],
+        season=data['season'],
+        episode=data['episode']
+    )
+
+
+@dataclass
+class PlanEntry:
+    match: MatchResult
+    video_stat: FileStat
+    subtitle_stat: FileStat
+
+    def to_dict(self) -> Dict:
+        return {
+            'video': _file_info_to_dict(self.match.video),
+            'subtitle': _file_info_to_dict(self.match.subtitle),
+            'score': self.match.score,
+            'language_weight': self.match.language_weight,
+            'format_weight': self.match.format_weight,
+            'lineage_bonus': self.match.lineage_bonus,
+            'video_stat': list(self.video_stat),
+            'subtitle_stat': list(self.subtitle_stat)
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'PlanEntry':
+        match = MatchResult(
+            video=_file_info_from_dict(data['video']),
+            subtitle=_file_info_from_dict(data['subtitle']),
+            score=data['score'],
+            language_weight=data['language_weight'],
+            format_weight=data['format_weight'],
+            lineage_bonus=data['lineage_bonus']
+        )
+        return cls(match, FileStat(*data['video_stat']), FileStat(*data['subtitle_stat']))
+
+
+@dataclass
+class RenamePlan:
+    plan_id: str
+    directory: str
+    created: float
+    entries: List[PlanEntry] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    # 视频路径 -> 备选字幕 [{path, name, score, margin}, ...]，见 build
+    alternatives: Dict[str, List[Dict]] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, directory: str, matches: List[MatchResult], unmatched: List[FileInfo],
+              alternatives: Optional[Dict[Path, List[MatchResult]]] = None) -> 'RenamePlan':
+        """由匹配结果生成计划；生成时已消失的文件直接排除
+
+        alternatives 为每个视频的备选字幕（不含已选中的字幕）。已匹配的视频 margin 为选中字幕与备选的分差，
+        未匹配的视频 margin 相对于备选中的最高分，为 0 表示同分
+        """
+        entries = []
+        for match_result in matches:
+            video_stat = _stat(match_result.video.path)
+            subtitle_stat = _stat(match_result.subtitle.path)
+            if video_stat is None or subtitle_stat is None:
+                continue
+            entries.append(PlanEntry(match_result, video_stat, subtitle_stat))
+
+        plan_alternatives = {}
+        if alternatives:
+            chosen = {match_result.video.path: match_result for match_result in matches}
+            for video in [entry.match.video for entry in entries] + list(unmatched):
+                candidates = alternatives.get(video.path)
+                if not candidates:
+                    continue
+                match_result = chosen.get(video.path)
+                reference = match_result.score if match_result is not None else candidates[0].score
+                plan_alternatives[str(video.path)] = [{
+                    'path': str(candidate.subtitle.path),
+                    'name': candidate.subtitle.name,
+                    'score': candidate.score,
+                    'margin': reference - candidate.score
+                } for candidate in candidates]
+
+        return cls(
+            plan_id=uuid.uuid4().hex,
+            directory=str(Path(directory).resolve()),
+            created=time.time(),
+            entries=entries,
+            skipped=[video.name for video in unmatched],
+            alternatives=plan_alternatives
+        )
+
+    @property
+    def matches(self) -> List[MatchResult]:
+        return [entry.match for entry in self.entries]
+
+    def changed_files(self) -> List[str]:
+        """返回自预览以来被修改、移动或删除的文件"""
+        changed = []
+        for entry in self.entries:
+            if _stat(entry.match.video.path) != entry.video_stat:
+                changed.append(str(entry.match.video.path))
+            if _stat(entry.match.subtitle.path) != entry.subtitle_stat:
+                changed.append(str(entry.match.subtitle.path))
+        return changed
+
+    def to_dict(self) -> Dict:
+        return {
+            'plan_id': self.plan_id,
+            'directory': self.directory,
+            'created': self.created,
+            'entries': [entry.to_dict() for entry in self.entries],
+            'skipped': self.skipped,
+            'alternatives': self.alternatives
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'RenamePlan':
+        return cls(
+            plan_id=data['plan_id'],
+            directory=data['directory'],
+            created=data['created'],
+            entries=[PlanEntry.from_dict(entry) for entry in data['entries']],
+            skipped=list(data['skipped']),
+            alternatives=data.get('alternatives', {})
+        )
+
+
+@dataclass
+class ScanSnapshot:
+    """一次扫描的结果，scan_media_files 后续分页直接读取；plan_id 为快照 ID（与计划共用存储）"""
+    plan_id: str
+    directory: str
+    created: float
+    videos: List[FileInfo] = field(default_factory=list)
+    subtitles: List[FileInfo] = field(default_factory=list)
+    scan_stats: Dict = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, directory: str, videos: List[FileInfo], subtitles: List[FileInfo],
+              scan_stats: Dict) -> 'ScanSnapshot':
+        return cls(
+            plan_id=uuid.uuid4().hex,
+            directory=str(Path(directory).resolve()),
+            created=time.time(),
+            videos=videos,
+            subtitles=subtitles,
+            scan_stats=scan_stats
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            'plan_id': self.plan_id,
+            'directory': self.directory,
+            'created': self.created,
+            'videos': [_file_info_to_dict(video) for video in self.videos],
+            'subtitles': [_file_info_to_dict(subtitle) for subtitle in self.subtitles],
+            'scan_stats': self.scan_stats
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ScanSnapshot':
+        return cls(
+            plan_id=data['plan_id'],
+            directory=data['directory'],
+            created=data['created'],
+            videos=[_file_info_from_dict(video) for video in data['videos']],
+            subtitles=[_file_info_from_dict(subtitle) for subtitle in data['subtitles']],
+            scan_stats=data.get('scan_stats', {})
+        )
+
+
+class PlanStore:
+    """有界的计划存储：内存中保留最近的计划，同时写入磁盘供其他工作进程读取
+
+    内存中的计划按数量（max_plans）和总大小（max_memory_mb，按序列化后的大小估算，0 表示不限）
+    限制，超出时淘汰最久未使用的；写入新计划时先丢弃已过期的。被淘汰的计划仍可从磁盘读取。
+    """
+
+    record_type = RenamePlan
+
+    def __init__(self, path: Optional[str] = DEFAULT_PLAN_DIR, max_plans: int = 32,
+                 ttl: float = 3600, max_memory_mb: float = 64):
+        self.path = Path(os.path.expanduser(path)) if path else None
+        self.max_plans = max_plans
+        self.ttl = ttl
+        self.max_memory = int(max_memory_mb * 1024 * 1024)
+        # plan_id -> (计划, 估算大小)
+        self._plans: 'OrderedDict[str, Tuple[RenamePlan, int]]' = OrderedDict()
+        self._memory = 0
+        self._lock = threading.Lock()
+        if self.path is not None:
+            self.path.mkdir(parents=True, exist_ok=True)
+
+    def _file_for(self, plan_id: str) -> Optional[Path]:
+        # plan_id 来自客户端，只接受 uuid4 十六进制串，避免路径穿越
+        if (self.path is None or len(plan_id) != 32
+                or not all(c in '0123456789abcdef' for c in plan_id)):
+            return None
+        return self.path / f"{plan_id}.json"
+
+    def _expired(self, plan: RenamePlan) -> bool:
+        return bool(self.ttl) and time.time() - plan.created > self.ttl
+
+    def _pop(self, plan_id: str) -> None:
+        # 调用方持有 self._lock
+        entry = self._plans.pop(plan_id, None)
+        if entry is not None:
+            self._memory -= entry[1]
+
+    def put(self, plan: RenamePlan) -> str:
+        text = json.dumps(plan.to_dict(), ensure_ascii=False)
+        with self._lock:
+            for plan_id in [plan_id for plan_id, (stored, _) in self._plans.items()
+                            if self._expired(stored)]:
+                self._pop(plan_id)
+            self._pop(plan.plan_id)
+            self._plans[plan.plan_id] = (plan, len(text))
+            self._memory += len(text)
+            # 至少保留刚写入的计划
+            while len(self._plans) > 1 and (
+                    len(self._plans) > self.max_plans
+                    or (self.max_memory and self._memory > self.max_memory)):
+                self._pop(next(iter(self._plans)))
+
+        plan_file = self._file_for(plan.plan_id)
+        if plan_file is not None:
+            tmp_file = plan_file.with_suffix('.tmp')
+            tmp_file.write_text(text, encoding='utf-8')
+            os.replace(tmp_file, plan_file)
+            self._prune()
+        return plan.plan_id
+
+    def get(self, plan_id: str) -> Optional[RenamePlan]:
+        with self._lock:
+            entry = self._plans.get(plan_id)
+            plan = None
+            if entry is not None:
+                plan = entry[0]
+                self._plans.move_to_end(plan_id)
+
+        if plan is None:
+            plan_file = self._file_for(plan_id)
+            if plan_file is None or not plan_file.exists():
+                return None
+            try:
+                data = json.loads(plan_file.read_text(encoding='utf-8'))
+                plan = self.record_type.from_dict(data)
+            except (OSError, ValueError, KeyError, TypeError):
+                return None
+
+        if self._expired(plan):
+            self.discard(plan_id)
+            return None
+        return plan
+
+    def discard(self, plan_id: str) -> None:
+        with self._lock:
+            self._pop(plan_id)
+        plan_file = self._file_for(plan_id)
+        if plan_file is not None:
+            try:
+                plan_file.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _prune(self) -> None:
+        """按数量和有效期清理磁盘上的旧计划"""
+        try:
+            plan_files = sorted(self.path.glob('*.json'), key=lambda p: p.stat().st_mtime,
+                                reverse=True)
+        except OSError:
+            return
+        now = time.time()
+        for index, plan_file in enumerate(plan_files):
+            try:
+                expired = self.ttl and now - plan_file.stat().st_mtime > self.ttl
+                if index >= self.max_plans or expired:
+                    plan_file.unlink()
+            except OSError:
+                pass
+
+
+class ScanStore(PlanStore):
+    """扫描快照的存储；分页读完后由调用方 discard，未读完的按数量和有效期清理"""
+
+    record_type = ScanSnapshot
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+扫描结果持久化缓存
+以 SQLite 保存每个文件的解析结果（分词、季号、集号），按路径 + inode + mtime + size
+以及分词/集数配置摘要校验，未变化的文件在重新扫描时无需再次解析
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import closing
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+SCHEMA_VERSION = 1
+
+
+class FileStat(NamedTuple):
+    inode: int
+    mtime_ns: int
+    size: int
+
+
+class CachedParse(NamedTuple):
+    stat: FileStat
+    tokens: List[str]
+    season: Optional[int]
+    episode: Optional[int]
+
+
+def config_digest(tokenization_config: dict, episode_patterns: List[dict]) -> str:
+    """影响解析结果的配置摘要；配置变化后旧缓存自动失效"""
+    relevant = {
+        'schema': SCHEMA_VERSION,
+        'separators': tokenization_config.get('separators', []),
+        'min_token_length': tokenization_config.get('min_token_length', 2),
+        'ignore_tokens': sorted(tokenization_config.get('ignore_tokens', [])),
+        'episode_patterns': episode_patterns,
+    }
+    encoded = json.dumps(relevant, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()
+
+
+class ScanCache:
+    """SQLite 扫描缓存，每次扫描打开一次连接，可在任意线程中使用"""
+
+    def __init__(self, db_path: str):
+        self.db_path = os.path.expanduser(db_path)
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS scan_cache ("
+                " path TEXT PRIMARY KEY,"
+                " inode INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " config_digest TEXT NOT NULL,"
+                " extension TEXT NOT NULL,"
+                " tokens TEXT NOT NULL,"
+                " season INTEGER,"
+                " episode INTEGER)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def load(self, root: str, digest: str) -> Dict[str, CachedParse]:
+        """读取 root 下所有与当前配置摘要一致的记录"""
+        prefix = root.rstrip(os.sep) + os.sep
+        # 前缀范围查询可走主键索引
+        upper = prefix[:-1] + chr(ord(os.sep) + 1)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT path, inode, mtime_ns, size, tokens, season, episode FROM scan_cache"
+                " WHERE path >= ? AND path < ? AND config_digest = ?",
+                (prefix, upper, digest),
+            ).fetchall()
+
+        return {
+            path: CachedParse(FileStat(inode, mtime_ns, size), json.loads(tokens), season, episode)
+            for path, inode, mtime_ns, size, tokens, season, episode in rows
+        }
+
+    def update(self, root: str, digest: str,
+               records: Iterable[Tuple[str, FileStat, str, List[str],
+                                       Optional[int], Optional[int]]],
+               seen: Iterable[str]) -> None:
+        """写入新解析的记录，并删除 root 下已不存在的文件"""
+        prefix = root.rstrip(os.sep) + os.sep
+        upper = prefix[:-1] + chr(ord(os.sep) + 1)
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO scan_cache"
+                " (path, inode, mtime_ns, size, config_digest, extension, tokens, season, episode)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (path, stat.inode, stat.mtime_ns, stat.size, digest, extension,
+                     json.dumps(tokens, ensure_ascii=False), season, episode)
+                    for path, stat, extension, tokens, season, episode in records
+                ],
+            )
+
+            seen = set(seen)
+            stale = [
+                (path,) for (path,) in conn.execute(
+                    "SELECT path FROM scan_cache WHERE path >= ? AND path < ?", (prefix, upper)
+                )
+                if path not in seen
+            ]
+            conn.executemany("DELETE FROM scan_cache WHERE path = ?", stale)
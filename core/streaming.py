@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+流式模式
+面向百万级文件的归档库：内存占用不随文件数增长。
+
+1. 遍历目录，把每个文件解析为紧凑的记录写入溢出文件，内存中只保留剧名（或目录）表和计数
+2. 合并剧名（与 matching.partition: show 相同的并查集；partition 为 directory 时按目录分区），
+   按（分组，路径）外部排序：分段排序后写入有序段文件，再多路归并
+3. 逐组读取、匹配，按批重命名；不属于任何分组的文件最后再做一次全局匹配
+   （按目录分区时各组剩下的文件也参加，按剧集分组时保持未匹配，与 Matcher.assign 相同）。
+   各组剩下的文件和未匹配的字幕也写入溢出文件，未匹配的字幕最后外部排序后逐个产出
+
+结果与内存中的同一分区模式（show 或 directory）相同。
+"""
+
+import heapq
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from itertools import groupby
+from pathlib import Path
+from typing import Dict, Generator, Iterator, List, Optional, Set, Tuple
+
+try:
+    from .submatcher import CandidateIndex, FileInfo, FileType, MatchResult, _split_suffix
+    from .engine import (UNTIL_RENAME, UNTIL_SCAN, RunStarted, StreamCompleted, StreamScanned,
+                         SubtitleUnmatched, VideoMatched)
+except ImportError:
+    from submatcher import CandidateIndex, FileInfo, FileType, MatchResult, _split_suffix
+    from engine import (UNTIL_RENAME, UNTIL_SCAN, RunStarted, StreamCompleted, StreamScanned,
+                        SubtitleUnmatched, VideoMatched)
+
+# 不属于任何分组（无法识别剧名 / 不在视频目录中 / 分组只有一种文件）的记录，排在最后
+LEFTOVER_GROUP = 1 << 62
+
+# 记录格式：[分组, 路径, 是否视频, Token, 季, 集]
+Record = list
+
+
+def _sort_key(record: Record) -> Tuple[int, str]:
+    return record[0], record[1]
+
+
+def _open_spill(path: str):
+    # 无法按 UTF-8 解码的文件名以代理字符保存，原样写回
+    return open(path, 'w', encoding='utf-8', errors='surrogateescape')
+
+
+def _write_record(f, record: Record) -> None:
+    f.write(json.dumps(record, ensure_ascii=False))
+    f.write('\n')
+
+
+def _record(file_info: FileInfo) -> Record:
+    """各组剩下的文件重新写成记录，留待最后的全局匹配"""
+    return [LEFTOVER_GROUP, str(file_info.path), file_info.file_type == FileType.VIDEO,
+            file_info.tokens, file_info.season, file_info.episode]
+
+
+def _write_lines(path: str, records) -> None:
+    with _open_spill(path) as f:
+        for record in records:
+            _write_record(f, record)
+
+
+def _read_lines(path: str) -> Iterator[Record]:
+    with open(path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def write_runs(records: Iterator[Record], chunk_size: int, spill_dir: str,
+               prefix: str = 'run') -> Tuple[List[str], List[Record]]:
+    """外部排序的第一步：每 chunk_size 条按（分组，路径）排序后写为一个有序段；返回（段文件，最后一段）
+
+    最后一段留在内存中，只有一段时不必写盘；同一溢出目录中的多次排序用不同的 prefix
+    """
+    runs = []
+    chunk: List[Record] = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            chunk.sort(key=_sort_key)
+            runs.append(os.path.join(spill_dir, f"{prefix}-{len(runs)}.jsonl"))
+            _write_lines(runs[-1], chunk)
+            chunk = []
+    chunk.sort(key=_sort_key)
+    return runs, chunk
+
+
+def merge_runs(runs: List[str], chunk: List[Record]) -> Iterator[Record]:
+    """外部排序的第二步：用堆多路归并各有序段"""
+    return heapq.merge(*(_read_lines(run) for run in runs), chunk, key=_sort_key)
+
+
+class StreamingRun:
+    """一次流式执行；通过 Engine.run_streaming 使用"""
+
+    def __init__(self, submatcher, directory: str, dry_run: bool = True, until: str = UNTIL_RENAME):
+        self.submatcher = submatcher
+        self.config = submatcher.config
+        self.metrics = submatcher.metrics
+        self.directory = directory
+        self.dry_run = dry_run
+        self.until = until
+        streaming_config = self.config.get_streaming_config()
+        self.chunk_size = max(1, streaming_config.get('chunk_size', 20000))
+        self.rename_batch_size = max(1, streaming_config.get('rename_batch_size', 5000))
+        self.spill_root = streaming_config.get('spill_dir')
+        matching_config = self.config.get_matching_config()
+        self.by_directory = matching_config.get('partition', 'none') == 'directory'
+        self.min_common_tokens = matching_config.get('min_common_tokens', 1)
+
+        # 分组键（剧名 Token 集合或目录）-> 编号，以及每个键下的（视频数，字幕数）
+        self.keys: Dict[object, int] = {}
+        self.key_counts: List[List[int]] = []
+        # min_common_tokens > 1 时全局 Token 取决于全库计数，只在此时保留词表计数
+        self.token_counter: Optional[Counter] = Counter() if self.min_common_tokens > 1 else None
+        self.video_count = 0
+        self.subtitle_count = 0
+
+    def events(self) -> Generator:
+        if not Path(self.directory).exists():
+            raise ValueError(f"目录不存在：{self.directory}")
+        spill_root = os.path.expanduser(self.spill_root) if self.spill_root else None
+        spill_dir = tempfile.mkdtemp(prefix='submatcher-stream-', dir=spill_root)
+        try:
+            yield RunStarted(self.directory, self.dry_run)
+            yield from self._run(spill_dir)
+        finally:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+    def _run(self, spill_dir: str) -> Generator:
+        spill_path = os.path.join(spill_dir, 'scan.jsonl')
+        walk_stats: Dict[str, int] = {}
+        started = time.perf_counter()
+        with self.metrics.stage('stream.spill') as record:
+            _write_lines(spill_path, self._scan_records(walk_stats))
+            record.count('files', self.video_count + self.subtitle_count)
+        elapsed = time.perf_counter() - started
+        group_of_key, group_count = self._groups()
+        yield StreamScanned(self.directory, self.video_count, self.subtitle_count, group_count, {
+            'directories': walk_stats.get('directories', 0),
+            'entries': walk_stats.get('entries', 0),
+            'media_files': self.video_count + self.subtitle_count,
+            'elapsed': elapsed,
+            'files_per_sec': walk_stats.get('entries', 0) / elapsed if elapsed > 0 else 0.0,
+        })
+
+        completed = StreamCompleted(self.directory, self.dry_run, self.until, self.video_count,
+                                    self.subtitle_count, group_count)
+        if self.until == UNTIL_SCAN or not self.video_count or not self.subtitle_count:
+            yield completed
+            return
+
+        def regrouped() -> Iterator[Record]:
+            for record in _read_lines(spill_path):
+                record[0] = group_of_key[record[0]]
+                yield record
+
+        leftover_path = os.path.join(spill_dir, 'leftover.jsonl')
+        unmatched_path = os.path.join(spill_dir, 'unmatched.jsonl')
+        # 不属于任何分组的记录排在最后，读到时所有分组都已处理完
+        leftover_records: List[Record] = []
+        pending: List[MatchResult] = []
+        with self.metrics.stage('stream.sort') as record:
+            runs, chunk = write_runs(regrouped(), self.chunk_size, spill_dir)
+            record.count('files', self.video_count + self.subtitle_count)
+            record.count('runs', len(runs) + 1)
+        with _open_spill(leftover_path) as leftover_file, \
+                _open_spill(unmatched_path) as unmatched_file:
+            merged = merge_runs(runs, chunk)
+            for group, group_records in groupby(merged, key=lambda record: record[0]):
+                group_records = list(group_records)
+                if group == LEFTOVER_GROUP:
+                    leftover_records = group_records
+                    continue
+                videos, subtitles = self._load(group_records)
+                matches = self._match(videos, subtitles)
+                matched_videos = {match_result.video.path for match_result in matches}
+                matched_subtitles = {match_result.subtitle.path for match_result in matches}
+                yield from self._emit(matches, pending, completed, unmatched_file)
+                for video in videos:
+                    if video.path in matched_videos:
+                        continue
+                    if self.by_directory:
+                        _write_record(leftover_file, _record(video))
+                    else:
+                        # 剧集分组内没配上的文件不参加全局匹配，组外只有其他剧集的文件
+                        completed.unmatched_count += 1
+                        yield VideoMatched(video, None)
+                for subtitle in subtitles:
+                    if subtitle.path in matched_subtitles:
+                        continue
+                    if self.by_directory:
+                        _write_record(leftover_file, _record(subtitle))
+                    else:
+                        self._unmatched(unmatched_file, str(subtitle.path), completed)
+            leftover_file.close()
+
+            # 不属于任何分组的文件（按目录分区时还有各组剩下的文件）做全局匹配（按路径排序，与内存模式一致）。
+            # 全局匹配需要同时载入这些文件，内存占用只取决于剩下的文件数
+            leftover_records.extend(_read_lines(leftover_path))
+            leftover_videos, leftover_subtitles = self._load(leftover_records)
+            del leftover_records
+            leftover_videos.sort(key=lambda video: str(video.path))
+            leftover_subtitles.sort(key=lambda subtitle: str(subtitle.path))
+            matches = []
+            if leftover_videos and leftover_subtitles:
+                self.metrics.count('match.leftover_videos', len(leftover_videos))
+                self.metrics.count('match.leftover_subtitles', len(leftover_subtitles))
+                matches = self._match(leftover_videos, leftover_subtitles)
+            matched_videos = {match_result.video.path for match_result in matches}
+            matched_subtitles = {match_result.subtitle.path for match_result in matches}
+            yield from self._emit(matches, pending, completed, unmatched_file)
+            for video in leftover_videos:
+                if video.path not in matched_videos:
+                    completed.unmatched_count += 1
+                    yield VideoMatched(video, None)
+            yield from self._flush(pending, completed, unmatched_file)
+            for subtitle in leftover_subtitles:
+                if subtitle.path not in matched_subtitles:
+                    self._unmatched(unmatched_file, str(subtitle.path), completed)
+
+        # 未匹配的字幕同样外部排序后逐个产出
+        runs, chunk = write_runs(_read_lines(unmatched_path), self.chunk_size, spill_dir,
+                                 prefix='unmatched')
+        for _, path in merge_runs(runs, chunk):
+            yield SubtitleUnmatched(path)
+        yield completed
+
+    def _scan_records(self, walk_stats: Dict[str, int]) -> Iterator[Record]:
+        scanner = self.submatcher.file_scanner
+        tokenizer = self.submatcher.tokenizer
+        extractor = self.submatcher.episode_extractor
+        title_tokens = self.submatcher.cluster_analyzer.title_tokens
+        for video_entries, subtitle_entries in scanner.walk(self.directory, stats=walk_stats):
+            for entries, is_video in ((video_entries, True), (subtitle_entries, False)):
+                for path, _ in entries:
+                    stem = _split_suffix(os.path.basename(path))[0]
+                    tokens = tokenizer.tokenize(stem)
+                    season, episode = extractor.extract(stem)
+                    if self.by_directory:
+                        key = os.path.dirname(path)
+                    else:
+                        file_type = FileType.VIDEO if is_video else FileType.SUBTITLE
+                        key = title_tokens(FileInfo(path, file_type, tokens))
+                    key_id = self._key_id(key) if key else -1
+                    if key_id >= 0:
+                        self.key_counts[key_id][0 if is_video else 1] += 1
+                    if is_video:
+                        self.video_count += 1
+                    else:
+                        self.subtitle_count += 1
+                    if self.token_counter is not None:
+                        self.token_counter.update(tokens)
+                    yield [key_id, path, is_video, tokens, season, episode]
+
+    def _key_id(self, key) -> int:
+        key_id = self.keys.get(key)
+        if key_id is None:
+            key_id = self.keys[key] = len(self.keys)
+            self.key_counts.append([0, 0])
+        return key_id
+
+    def _groups(self) -> Tuple[Dict[int, int], int]:
+        """返回（分组键编号 -> 分组编号，分组数）；只有一种文件的分组并入 LEFTOVER_GROUP"""
+        keys = list(self.keys)
+        if self.by_directory:
+            # 字幕归入自身或最近的、直接包含视频的上级目录（与 partition_by_directory 相同）
+            video_directories = {key: key_id for key_id, key in enumerate(keys)
+                                 if self.key_counts[key_id][0]}
+            roots = []
+            for key in keys:
+                directory = Path(key)
+                owner = next((str(ancestor) for ancestor in (directory, *directory.parents)
+                              if str(ancestor) in video_directories), None)
+                roots.append(video_directories[owner] if owner is not None else -1)
+        else:
+            roots = self.submatcher.cluster_analyzer.merge_titles(keys)
+
+        totals: Dict[int, List[int]] = {}
+        for key_id, root in enumerate(roots):
+            if root < 0:
+                continue
+            total = totals.setdefault(root, [0, 0])
+            total[0] += self.key_counts[key_id][0]
+            total[1] += self.key_counts[key_id][1]
+        group_of_key = {-1: LEFTOVER_GROUP}
+        for key_id, root in enumerate(roots):
+            if root < 0 or not all(totals[root]):
+                group_of_key[key_id] = LEFTOVER_GROUP
+            else:
+                group_of_key[key_id] = root
+        return group_of_key, sum(1 for total in totals.values() if all(total))
+
+    def _load(self, records) -> Tuple[List[FileInfo], List[FileInfo]]:
+        videos = []
+        subtitles = []
+        for _, path, is_video, tokens, season, episode in records:
+            if is_video:
+                videos.append(FileInfo(path, FileType.VIDEO, tokens, season, episode))
+            else:
+                subtitles.append(FileInfo(path, FileType.SUBTITLE, tokens, season, episode))
+        return videos, subtitles
+
+    def _match(self, videos: List[FileInfo], subtitles: List[FileInfo]) -> List[MatchResult]:
+        if not videos or not subtitles:
+            return []
+        # 只有两个文件都含有的 Token 会计分，组内的词表足以代替全局 Token 集合
+        tokens: Set[str] = set()
+        for file_info in videos + subtitles:
+            tokens.update(file_info.tokens)
+        if self.token_counter is not None:
+            tokens = {token for token in tokens
+                      if self.token_counter[token] >= self.min_common_tokens}
+        matcher = self.submatcher.matcher
+        return matcher.assign_indexed(videos, CandidateIndex(subtitles, tokens), tokens)
+
+    def _unmatched(self, unmatched_file, path: str, completed: StreamCompleted) -> None:
+        # 分组固定为 0，只按路径排序
+        _write_record(unmatched_file, [0, path])
+        completed.unmatched_subtitle_count += 1
+
+    def _emit(self, matches: List[MatchResult], pending: List[MatchResult],
+              completed: StreamCompleted, unmatched_file) -> Generator:
+        for match_result in sorted(matches, key=lambda match_result: str(match_result.video.path)):
+            completed.matched_count += 1
+            yield VideoMatched(match_result.video, match_result)
+            if self.until == UNTIL_RENAME:
+                pending.append(match_result)
+        if len(pending) >= self.rename_batch_size:
+            yield from self._flush(pending, completed, unmatched_file)
+
+    def _flush(self, pending: List[MatchResult], completed: StreamCompleted,
+               unmatched_file) -> Generator:
+        """分批重命名：每批是一次独立的事务，写入各自的重命名日志"""
+        if not pending:
+            return
+        outcome = yield from self.submatcher.engine.rename(list(pending), self.dry_run)
+        for match_result in pending:
+            if outcome.succeeded(str(match_result.subtitle.path)):
+                completed.renamed_count += 1
+            else:
+                self._unmatched(unmatched_file, str(match_result.subtitle.path), completed)
+        if outcome.journal:
+            completed.journals.append(outcome.journal)
+        pending.clear()
@@ -4,15 +4,46 @@
 利用统计分词匹配算法自动将本地美剧字幕文件重命名为与对应视频同名
 """
 
+import heapq
 import os
 import re
+import operator
+import sqlite3
+import time
 import sys
 import yaml
 from pathlib import Path
-from collections import Counter
-from typing import Dict, List, Tuple, Optional, Set
-from dataclasses import dataclass
+from collections import Counter, defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, FrozenSet, Iterable, Iterator, List, Tuple, Optional, Set
+from dataclasses import dataclass, field
 from enum import Enum
+from functools import lru_cache
+from itertools import count
+
+try:
+    from .assignment import max_weight_matching, ambiguous_lefts
+    from .keywords import KeywordAutomaton
+    from .scan_cache import FileStat, ScanCache, config_digest
+    from .journal import BatchRenamer, RenameOperation, RenameOutcome
+    from .config_store import ConfigStore
+    from .metrics import Metrics
+except ImportError:
+    from assignment import max_weight_matching, ambiguous_lefts
+    from keywords import KeywordAutomaton
+    from scan_cache import FileStat, ScanCache, config_digest
+    from journal import BatchRenamer, RenameOperation, RenameOutcome
+    from config_store import ConfigStore
+    from metrics import Metrics
+
+DEFAULT_SCAN_CACHE_PATH = '~/.cache/mcp-submatcher/scan_cache.db'
+DEFAULT_PLAN_DIR = '~/.cache/mcp-submatcher/plans'
+DEFAULT_JOURNAL_DIR = '~/.cache/mcp-submatcher/journals'
+
+_FEATURE_VERSIONS = count(1)
+
+# 未传入 metrics 的组件使用关闭的指标，stage() 为空操作
+_DISABLED_METRICS = Metrics(enabled=False)
 
 
 class FileType(Enum):
@@ -20,16 +51,52 @@ class FileType(Enum):
     SUBTITLE = "subtitle"
 
 
-@dataclass
+def _split_suffix(name: str) -> Tuple[str, str]:
+    # 与 PurePath.stem / PurePath.suffix 的规则一致
+    i = name.rfind('.')
+    if 0 < i < len(name) - 1:
+        return name[:i], name[i:]
+    return name, ''
+
+
 class FileInfo:
-    path: Path
-    file_type: FileType
-    name: str
-    stem: str
-    extension: str
-    tokens: List[str]
-    season: Optional[int] = None
-    episode: Optional[int] = None
+    # 大型媒体库中可达数十万个实例：使用 __slots__，路径只保存一个字符串，
+    # name / stem / extension 按需派生；language / format / release_groups 由 Matcher.annotate 预先计算
+    __slots__ = ('_path', 'file_type', 'tokens', 'season', 'episode',
+                 'language', 'format', 'release_groups', 'feature_version')
+
+    def __init__(self, path, file_type: FileType, tokens: Iterable[str],
+                 season: Optional[int] = None, episode: Optional[int] = None):
+        # 按 Path 的规则规范化（去掉多余的分隔符和 "./"），与 str(file_info.path) 保持一致
+        self._path: str = str(Path(path))
+        self.file_type = file_type
+        self.tokens: Tuple[str, ...] = tuple(tokens)
+        self.season = season
+        self.episode = episode
+        self.language = -1
+        self.format = -1
+        self.release_groups = 0
+        self.feature_version = 0
+
+    @property
+    def path(self) -> Path:
+        return Path(self._path)
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self._path)
+
+    @property
+    def stem(self) -> str:
+        return _split_suffix(self.name)[0]
+
+    @property
+    def extension(self) -> str:
+        return _split_suffix(self.name)[1].lower()
+
+    def __repr__(self) -> str:
+        return (f"FileInfo(path={self._path!r}, file_type={self.file_type}, "
+                f"season={self.season}, episode={self.episode})")
 
 
 @dataclass
@@ -45,12 +112,25 @@ class MatchResult:
 class Config:
     def __init__(self, config_path: str = "config.yaml"):
         self.config_path = config_path
+        # 同一配置文件的 Config 共享一份解析结果；配置变化时通知 Tokenizer、EpisodeExtractor、Matcher 重新编译
+        self.store = ConfigStore.for_path(config_path)
+        self._listeners: List[Callable[[], None]] = []
         self.config = self._load_config()
+        self.store.subscribe(self._on_change)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Config':
+        """不关联配置文件的 Config，用于在写入前编译、校验候选配置（见 validate_config）"""
+        config = cls.__new__(cls)
+        config.config_path = None
+        config.store = None
+        config._listeners = []
+        config.config = data
+        return config
 
     def _load_config(self) -> dict:
         try:
-            with open(self.config_path, 'r', encoding='utf-8') as f:
-                return yaml.safe_load(f)
+            return self.store.load()
         except FileNotFoundError:
             print(f"警告：配置文件 {self.config_path} 未找到，使用默认配置")
             return self._get_default_config()
@@ -81,24 +161,73 @@ class Config:
             'tokenization': {
                 'separators': ['.', '_', '-', '[', ']', '(', ')', ' '],
                 'min_token_length': 2,
-                'ignore_tokens': ['the', 'a', 'an', 'of', 'in', 'on', 'at']
+                'ignore_tokens': ['the', 'a', 'an', 'of', 'in', 'on', 'at'],
+                'cache_size': 4096
             },
             'episode_patterns': [
                 {'pattern': r'S(\d{1,2})E(\d{1,2})', 'season_group': 1, 'episode_group': 2},
                 {'pattern': r'(\d{1,2})x(\d{1,2})', 'season_group': 1, 'episode_group': 2},
                 {'pattern': r'(\d{1,2})(\d{2})', 'season_group': 1, 'episode_group': 2}
             ],
+            'scanning': {
+                'max_workers': 8
+            },
+            'scan_cache': {
+                'enabled': False,
+                'path': DEFAULT_SCAN_CACHE_PATH
+            },
+            'watch': {
+                'backend': 'auto',
+                'debounce': 0.3,
+                'max_delay': 1.0,
+                'poll_interval': 2.0
+            },
             'matching': {
                 'min_common_tokens': 1,
                 'min_score_threshold': 50,
                 'skip_on_conflict': True,
-                'log_unmatched': True
+                'log_unmatched': True,
+                'engine': 'scalar',
+                'partition': 'none',
+                'alternatives': 3
+            },
+            'server': {
+                'executor': 'thread',
+                'max_workers': 4,
+                'per_directory_limit': 1,
+                'tool_timeout': 600,
+                'page_size': 200,
+                'progress_interval': 0.5
+            },
+            'plans': {
+                'path': DEFAULT_PLAN_DIR,
+                'max_plans': 32,
+                'ttl': 3600,
+                'max_memory_mb': 64
+            },
+            'batch': {
+                'max_workers': 0,
+                'split_roots': False
+            },
+            'streaming': {
+                'chunk_size': 20000,
+                'rename_batch_size': 5000,
+                'spill_dir': None
             },
             'safety': {
                 'dry_run': True,
                 'require_confirm': True,
                 'backup_enabled': False,
-                'backup_dir': '.backup'
+                'backup_dir': '.backup',
+                'journal_dir': DEFAULT_JOURNAL_DIR,
+                'journal_keep': 100
+            },
+            'config_backups': {
+                'max_backups': 50,
+                'max_age_days': 90
+            },
+            'metrics': {
+                'enabled': True
             },
             'logging': {
                 'level': 'INFO',
@@ -107,6 +236,44 @@ class Config:
             }
         }
 
+    def refresh(self) -> bool:
+        """配置文件在外部被修改时（按 mtime 判断）重新加载，返回配置是否变化"""
+        current = self.config
+        try:
+            data = self.store.load()
+        except (OSError, yaml.YAMLError):
+            # 文件被删除或正在编辑中格式不完整：保留当前配置
+            return False
+        if data is not self.config:
+            # 通常已由存储的通知完成；此前使用默认配置（文件不存在）时在这里切换
+            self._on_change(data)
+        return self.config is not current
+
+    def add_listener(self, callback: Callable[[], None]) -> None:
+        """注册配置变化后的回调（用于重新编译派生的表）"""
+        self._listeners.append(callback)
+
+    def _on_change(self, data: dict) -> None:
+        # 先用新配置重新编译所有派生的表；任一回调失败时整体回滚到原配置，再抛出第一个异常
+        previous = self.config
+        self.config = data
+        errors = self._run_listeners()
+        if errors:
+            self.config = previous
+            # 已按新配置编译成功的表用原配置重新编译，避免与 self.config 不一致
+            self._run_listeners()
+            raise errors[0]
+
+    def _run_listeners(self) -> List[Exception]:
+        # 每个回调都会执行，返回失败的回调抛出的异常
+        errors = []
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception as e:
+                errors.append(e)
+        return errors
+
     def get_language_weights(self) -> List[dict]:
         return self.config.get('language_weights', [])
 
@@ -128,12 +295,39 @@ class Config:
     def get_episode_patterns(self) -> List[dict]:
         return self.config.get('episode_patterns', [])
 
+    def get_scanning_config(self) -> dict:
+        return self.config.get('scanning', {})
+
+    def get_scan_cache_config(self) -> dict:
+        return self.config.get('scan_cache', {})
+
+    def get_watch_config(self) -> dict:
+        return self.config.get('watch', {})
+
+    def get_server_config(self) -> dict:
+        return self.config.get('server', {})
+
+    def get_plans_config(self) -> dict:
+        return self.config.get('plans', {})
+
+    def get_batch_config(self) -> dict:
+        return self.config.get('batch', {})
+
+    def get_streaming_config(self) -> dict:
+        return self.config.get('streaming', {})
+
     def get_matching_config(self) -> dict:
         return self.config.get('matching', {})
 
     def get_safety_config(self) -> dict:
         return self.config.get('safety', {})
 
+    def get_metrics_config(self) -> dict:
+        return self.config.get('metrics', {})
+
+    def get_config_backups_config(self) -> dict:
+        return self.config.get('config_backups', {})
+
     def get_logging_config(self) -> dict:
         return self.config.get('logging', {})
 
@@ -141,107 +335,433 @@ class Config:
 class Tokenizer:
     def __init__(self, config: Config):
         self.config = config
-        self.separators = config.get_tokenization_config().get('separators', [])
-        self.min_token_length = config.get_tokenization_config().get('min_token_length', 2)
-        self.ignore_tokens = set(config.get_tokenization_config().get('ignore_tokens', []))
+        self.recompile()
+        config.add_listener(self.recompile)
+
+    def recompile(self) -> None:
+        tokenization_config = self.config.get_tokenization_config()
+        separators = tokenization_config.get('separators', [])
+        # 先编译，成功后再替换：配置无效时保留原来的分词规则
+        split = self._compile_separators(separators)
+        self.separators = separators
+        self.min_token_length = tokenization_config.get('min_token_length', 2)
+        self.ignore_tokens = set(tokenization_config.get('ignore_tokens', []))
+        self.cache_size = tokenization_config.get('cache_size', 4096)
+        self._split = split
+        self._tokenize_cached = lru_cache(maxsize=self.cache_size)(self._tokenize)
+
+    @staticmethod
+    def _compile_separators(separators: List[str]) -> Callable[[str], List[str]]:
+        separators = [sep for sep in separators if sep]
+        if not separators:
+            return lambda filename: [filename]
+        if all(len(sep) == 1 for sep in separators):
+            pattern = '[' + ''.join(re.escape(sep) for sep in separators) + ']'
+        else:
+            pattern = '|'.join(re.escape(sep) for sep in sorted(separators, key=len, reverse=True))
+        return re.compile(pattern).split
 
     def tokenize(self, filename: str) -> List[str]:
-        tokens = [filename]
-        for sep in self.separators:
-            new_tokens = []
-            for token in tokens:
-                new_tokens.extend(token.split(sep))
-            tokens = new_tokens
+        return list(self._tokenize_cached(filename))
 
+    def _tokenize(self, filename: str) -> Tuple[str, ...]:
         cleaned_tokens = []
-        for token in tokens:
+        for token in self._split(filename):
             token = token.strip().lower()
             if (len(token) >= self.min_token_length and
                 token not in self.ignore_tokens and
                 not token.isdigit()):
-                cleaned_tokens.append(token)
-
-        return cleaned_tokens
+                # 驻留常见 Token（剧名、1080p、x264 等），大量 FileInfo 共享同一对象
+                cleaned_tokens.append(sys.intern(token))
+
+        return tuple(cleaned_tokens)
+
+
+_CONDITION_CLAUSE = re.compile(
+    r'^\s*(season_group|episode_group)\s*(>=|<=|==|!=|>|<)\s*(-?\d+)\s*$')
+_CONDITION_OPERATORS = {
+    '>=': operator.ge,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '<': operator.lt,
+}
+
+
+# 合并进前瞻分支后含义会改变的写法：全局内联标志（如 (?i)）、编号/命名反向引用、条件分组
+_UNCHAINABLE_PATTERN = re.compile(r'(?<!\\)(?:\\\\)*\\[1-9]|\(\?(?:[aiLmsux]+\)|P=|\()')
+
+
+def _parse_condition(condition: Optional[str]) -> List[Callable[[int, int], bool]]:
+    if not condition:
+        return []
+
+    predicates = []
+    for clause in re.split(r'\s+and\s+', condition.strip()):
+        parsed = _CONDITION_CLAUSE.match(clause)
+        if not parsed:
+            raise ValueError(f"不支持的集数条件：{condition}")
+        field, op, literal = parsed.groups()
+        compare = _CONDITION_OPERATORS[op]
+        value = int(literal)
+        if field == 'season_group':
+            predicates.append(lambda season, episode, compare=compare, value=value:
+                              compare(season, value))
+        else:
+            predicates.append(lambda season, episode, compare=compare, value=value:
+                              compare(episode, value))
+    return predicates
 
 
 class EpisodeExtractor:
     def __init__(self, config: Config):
         self.config = config
-        self.patterns = config.get_episode_patterns()
-
-    def extract(self, filename: str) -> Tuple[Optional[int], Optional[int]]:
-        for pattern_config in self.patterns:
+        self.recompile()
+        config.add_listener(self.recompile)
+
+    def recompile(self) -> None:
+        # 全部编译成功后再替换：配置无效时保留原来的模式，不会只更新一半
+        patterns = self.config.get_episode_patterns()
+        predicates = [_parse_condition(p.get('condition')) for p in patterns]
+        # _chains[i] 按配置优先级合并 patterns[i:] 中可以合并的连续一段：每个分支是一个前瞻，
+        # 从而保留"依次尝试每个模式、取其最左匹配"的语义；条件不满足时从下一个模式继续。
+        # 含全局内联标志、反向引用或与前面重名的命名组的模式无法合并，单独编译并用 search
+        ends = self._chain_ends(patterns)
+        chains = [self._compile_chain(patterns, start, ends[start])
+                  for start in range(len(patterns))]
+        self.patterns = patterns
+        self.pattern_hits = [0] * len(patterns)
+        self._predicates = predicates
+        self._chains = chains
+
+    @staticmethod
+    def _chain_ends(patterns: List[dict]) -> List[int]:
+        """ends[i] 为 patterns[i] 所在合并段的结束位置（不含）"""
+        ends = [0] * len(patterns)
+        start = 0
+        names: Set[str] = set()
+        for index, pattern_config in enumerate(patterns):
             pattern = pattern_config['pattern']
-            season_group = pattern_config['season_group']
-            episode_group = pattern_config['episode_group']
-
-            match = re.search(pattern, filename, re.IGNORECASE)
-            if match:
-                season = int(match.group(season_group))
-                episode = int(match.group(episode_group))
-
-                condition = pattern_config.get('condition')
-                if condition and 'episode_group' in condition:
-                    if not eval(condition.replace('episode_group', str(episode))):
-                        continue
+            pattern_names = set(re.compile(pattern).groupindex) | {f"p{index}"}
+            standalone = _UNCHAINABLE_PATTERN.search(pattern) is not None
+            if standalone or names & pattern_names:
+                # 之前的段到此结束
+                for position in range(start, index):
+                    ends[position] = index
+                start, names = index, set()
+            if standalone:
+                ends[index] = index + 1
+                start = index + 1
+            else:
+                names |= pattern_names
+        for position in range(start, len(patterns)):
+            ends[position] = len(patterns)
+        return ends
+
+    @staticmethod
+    def _compile_chain(patterns: List[dict], start: int, end: int
+                       ) -> Tuple[Callable[[str], Optional[re.Match]],
+                                  Dict[str, Tuple[int, int, int]], int]:
+        """返回 (查找函数, 分支名 -> (模式序号, 季组号, 集组号), 段结束位置)"""
+        pattern_config = patterns[start]
+        if end == start + 1 and _UNCHAINABLE_PATTERN.search(pattern_config['pattern']):
+            regex = re.compile(pattern_config['pattern'], re.IGNORECASE)
+            groups = {f"p{start}": (start, pattern_config['season_group'],
+                                    pattern_config['episode_group'])}
+            return regex.search, groups, end
+
+        branches = []
+        groups = {}
+        offset = 1
+        for index in range(start, end):
+            pattern_config = patterns[index]
+            pattern = pattern_config['pattern']
+            name = f"p{index}"
+            branches.append(f"(?=.*?(?P<{name}>{pattern}))")
+            groups[name] = (index,
+                            offset + pattern_config['season_group'],
+                            offset + pattern_config['episode_group'])
+            offset += 1 + re.compile(pattern).groups
+        regex = re.compile('|'.join(branches), re.IGNORECASE | re.DOTALL)
+        return regex.match, groups, end
 
+    def extract(self, filename: str) -> Tuple[Optional[int], Optional[int]]:
+        start = 0
+        while start < len(self._chains):
+            find, groups, end = self._chains[start]
+            match = find(filename)
+            if not match:
+                # 本段中的模式都不匹配，从下一段继续
+                start = end
+                continue
+
+            index, season_group, episode_group = (groups[match.lastgroup] if len(groups) > 1
+                                                  else next(iter(groups.values())))
+            season = int(match.group(season_group))
+            episode = int(match.group(episode_group))
+
+            if all(predicate(season, episode) for predicate in self._predicates[index]):
+                self.pattern_hits[index] += 1
                 return season, episode
+            start = index + 1
 
         return None, None
 
+    def extract_many(self, stems: Iterable[str]) -> List[Tuple[Optional[int], Optional[int]]]:
+        extract = self.extract
+        return [extract(stem) for stem in stems]
+
 
 class FileScanner:
-    def __init__(self, config: Config, tokenizer: Tokenizer, episode_extractor: EpisodeExtractor):
+    def __init__(self, config: Config, tokenizer: Tokenizer, episode_extractor: EpisodeExtractor,
+                 annotate: Optional[Callable[[FileInfo], None]] = None,
+                 metrics: Optional[Metrics] = None):
         self.config = config
         self.tokenizer = tokenizer
         self.episode_extractor = episode_extractor
-
-    def scan_directory(self, directory: str) -> Tuple[List[FileInfo], List[FileInfo]]:
+        # 扫描时顺带计算匹配特征（语言、格式、压制组），见 Matcher.annotate
+        self.annotate = annotate
+        self.metrics = metrics or _DISABLED_METRICS
+        self.last_scan_stats: Dict[str, float] = {}
+        self._scan_cache: Optional[ScanCache] = None
+
+    def scan_directory(self, directory: str,
+                       progress: Optional[Callable[[int, int], None]] = None
+                       ) -> Tuple[List[FileInfo], List[FileInfo]]:
         directory_path = Path(directory)
         if not directory_path.exists():
             raise ValueError(f"目录不存在：{directory}")
 
-        video_files = []
-        subtitle_files = []
+        started = time.perf_counter()
+        scan_cache = self._get_scan_cache()
+
+        video_entries = []
+        subtitle_entries = []
+        walk_stats = {'directories': 0, 'entries': 0}
+        for videos, subtitles in self.walk(str(directory_path), with_stat=scan_cache is not None,
+                                           progress=progress, stats=walk_stats):
+            video_entries.extend(videos)
+            subtitle_entries.extend(subtitles)
+        directory_count = walk_stats['directories']
+        entry_count = walk_stats['entries']
+
+        # 并发遍历的完成顺序不固定，按路径排序保证结果可复现
+        video_entries.sort()
+        subtitle_entries.sort()
+        walked = time.perf_counter()
+
+        cache_hits = 0
+        if scan_cache is not None:
+            video_files, subtitle_files, cache_hits = self._build_with_cache(
+                scan_cache, str(directory_path), video_entries, subtitle_entries)
+        else:
+            video_files = [self._create_file_info(p, FileType.VIDEO) for p, _ in video_entries]
+            subtitle_files = [self._create_file_info(p, FileType.SUBTITLE)
+                              for p, _ in subtitle_entries]
+
+        elapsed = time.perf_counter() - started
+        media_count = len(video_files) + len(subtitle_files)
+        self.last_scan_stats = {
+            'directories': directory_count,
+            'entries': entry_count,
+            'media_files': media_count,
+            'cache_hits': cache_hits,
+            'cache_misses': media_count - cache_hits if scan_cache is not None else 0,
+            'elapsed': elapsed,
+            'files_per_sec': entry_count / elapsed if elapsed > 0 else 0.0,
+        }
+
+        # 遍历目录与解析文件名（分词、集数、匹配特征）分开计时
+        self.metrics.record('scan.walk', walked - started,
+                            {'directories': directory_count, 'entries': entry_count})
+        self.metrics.record('scan.parse', elapsed - (walked - started), {'files': media_count})
+        if scan_cache is not None:
+            self.metrics.cache('scan_cache', cache_hits, media_count - cache_hits)
 
-        video_extensions = self.config.get_video_extensions()
-        subtitle_extensions = self.config.get_subtitle_extensions()
+        return video_files, subtitle_files
 
-        for file_path in directory_path.rglob('*'):
-            if file_path.is_file():
-                extension = file_path.suffix.lower()
+    def walk(self, directory: str, with_stat: bool = False,
+             progress: Optional[Callable[[int, int], None]] = None,
+             stats: Optional[Dict[str, int]] = None
+             ) -> Iterator[Tuple[List[Tuple[str, Optional[FileStat]]],
+                                 List[Tuple[str, Optional[FileStat]]]]]:
+        """逐个目录产出（视频条目，字幕条目），条目为（路径，文件状态或 None）；顺序不固定
 
-                if extension in video_extensions:
-                    video_files.append(self._create_file_info(file_path, FileType.VIDEO))
-                elif extension in subtitle_extensions:
-                    subtitle_files.append(self._create_file_info(file_path, FileType.SUBTITLE))
+        只保留正在遍历的目录的条目，流式模式据此扫描百万级的目录树。stats 中累计目录数和条目数。
+        """
+        video_extensions = set(self.config.get_video_extensions())
+        subtitle_extensions = set(self.config.get_subtitle_extensions())
+        max_workers = self.config.get_scanning_config().get('max_workers', 8)
+        stats = stats if stats is not None else {}
+        stats.setdefault('directories', 0)
+        stats.setdefault('entries', 0)
+
+        # 目录遍历是 I/O 密集型（尤其是 NAS/NFS），子目录在线程池中并发展开；
+        # 同时进行的目录不超过线程数的两倍，调用方处理较慢时已读出的目录条目不会无限堆积
+        max_pending = max(1, max_workers) * 2
+        queued = deque([directory])
+        pending = set()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while queued or pending:
+                while queued and len(pending) < max_pending:
+                    pending.add(executor.submit(self._scan_one, queued.popleft(),
+                                                video_extensions, subtitle_extensions, with_stat))
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    videos, subtitles, subdirectories, entries = future.result()
+                    stats['directories'] += 1
+                    stats['entries'] += entries
+                    queued.extend(subdirectories)
+                    if progress is not None:
+                        progress(stats['directories'], stats['entries'])
+                    yield videos, subtitles
+
+    def _get_scan_cache(self) -> Optional[ScanCache]:
+        cache_config = self.config.get_scan_cache_config()
+        if not cache_config.get('enabled', False):
+            return None
 
-        return video_files, subtitle_files
+        db_path = os.path.expanduser(cache_config.get('path', DEFAULT_SCAN_CACHE_PATH))
+        if self._scan_cache is None or self._scan_cache.db_path != db_path:
+            try:
+                self._scan_cache = ScanCache(db_path)
+            except (OSError, sqlite3.Error) as e:
+                print(f"警告：扫描缓存不可用：{e}", file=sys.stderr)
+                return None
+        return self._scan_cache
+
+    def _build_with_cache(self, scan_cache: ScanCache, root: str,
+                          video_entries: List[Tuple[str, Optional[FileStat]]],
+                          subtitle_entries: List[Tuple[str, Optional[FileStat]]]
+                          ) -> Tuple[List[FileInfo], List[FileInfo], int]:
+        absolute_root = os.path.abspath(root)
+        digest = config_digest(self.config.get_tokenization_config(),
+                               self.config.get_episode_patterns())
+        try:
+            cached = scan_cache.load(absolute_root, digest)
+        except sqlite3.Error as e:
+            print(f"警告：读取扫描缓存失败：{e}", file=sys.stderr)
+            cached = {}
+
+        fresh = []
+        seen = []
+        hits = 0
+
+        def build(path_str: str, stat: Optional[FileStat], file_type: FileType) -> FileInfo:
+            nonlocal hits
+            key = absolute_root + path_str[len(root):]
+            seen.append(key)
+            hit = cached.get(key)
+            if hit is not None and hit.stat == stat:
+                hits += 1
+                tokens = [sys.intern(token) for token in hit.tokens]
+                return self._create_file_info(path_str, file_type,
+                                              (tokens, hit.season, hit.episode))
+
+            file_info = self._create_file_info(path_str, file_type)
+            if stat is not None:
+                fresh.append((key, stat, file_info.extension, list(file_info.tokens),
+                              file_info.season, file_info.episode))
+            return file_info
+
+        video_files = [build(p, stat, FileType.VIDEO) for p, stat in video_entries]
+        subtitle_files = [build(p, stat, FileType.SUBTITLE) for p, stat in subtitle_entries]
 
-    def _create_file_info(self, path: Path, file_type: FileType) -> FileInfo:
-        name = path.name
-        stem = path.stem
-        extension = path.suffix.lower()
-        tokens = self.tokenizer.tokenize(stem)
-        season, episode = self.episode_extractor.extract(stem)
-
-        return FileInfo(
-            path=path,
-            file_type=file_type,
-            name=name,
-            stem=stem,
-            extension=extension,
-            tokens=tokens,
-            season=season,
-            episode=episode
-        )
+        try:
+            scan_cache.update(absolute_root, digest, fresh, seen)
+        except sqlite3.Error as e:
+            print(f"警告：写入扫描缓存失败：{e}", file=sys.stderr)
+
+        return video_files, subtitle_files, hits
+
+    @staticmethod
+    def _scan_one(directory: str, video_extensions: Set[str], subtitle_extensions: Set[str],
+                  with_stat: bool) -> Tuple[list, list, List[str], int]:
+        videos = []
+        subtitles = []
+        subdirectories = []
+        entries = 0
+        try:
+            with os.scandir(directory) as iterator:
+                for entry in iterator:
+                    entries += 1
+                    # 与 Path.rglob 一致：不进入符号链接目录，但包含指向文件的符号链接
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirectories.append(entry.path)
+                            continue
+                        extension = os.path.splitext(entry.name)[1].lower()
+                        if extension in video_extensions:
+                            target = videos
+                        elif extension in subtitle_extensions:
+                            target = subtitles
+                        else:
+                            continue
+                        if not entry.is_file():
+                            continue
+                        stat = None
+                        if with_stat:
+                            st = entry.stat()
+                            stat = FileStat(st.st_ino, st.st_mtime_ns, st.st_size)
+                        target.append((entry.path, stat))
+                    except OSError:
+                        continue
+        except (PermissionError, NotADirectoryError, FileNotFoundError):
+            pass
+        return videos, subtitles, subdirectories, entries
+
+    def _create_file_info(self, path, file_type: FileType,
+                          parsed: Optional[Tuple[Iterable[str], Optional[int],
+                                                 Optional[int]]] = None) -> FileInfo:
+        if parsed is None:
+            stem = _split_suffix(os.path.basename(path))[0]
+            tokens = self.tokenizer.tokenize(stem)
+            season, episode = self.episode_extractor.extract(stem)
+        else:
+            tokens, season, episode = parsed
+
+        file_info = FileInfo(path, file_type, tokens, season, episode)
+        if self.annotate is not None:
+            self.annotate(file_info)
+        return file_info
+
+
+# 剧名在第一个数字（集数标记、年份、画质）之前结束
+_TITLE_END = re.compile(r'\d')
+
+
+@dataclass
+class ShowCluster:
+    """一部剧集的文件：title_tokens 为组内所有剧名 Token（剧名写法不同的文件合并后的词表）"""
+    title_tokens: FrozenSet[str]
+    videos: List[FileInfo] = field(default_factory=list)
+    subtitles: List[FileInfo] = field(default_factory=list)
+
+
+@dataclass
+class ShowClusters:
+    clusters: List[ShowCluster]
+    # 无法识别剧名，或所在分组只有视频 / 只有字幕的文件，留给全局匹配
+    unclustered_videos: List[FileInfo]
+    unclustered_subtitles: List[FileInfo]
 
 
 class ClusterAnalyzer:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, metrics: Optional[Metrics] = None,
+                 tokenizer: Optional[Tokenizer] = None):
         self.config = config
+        self.metrics = metrics or _DISABLED_METRICS
+        self.tokenizer = tokenizer or Tokenizer(config)
 
     def analyze(self, files: List[FileInfo]) -> Tuple[Set[str], Counter]:
+        with self.metrics.stage('cluster') as record:
+            global_tokens, token_counter = self._analyze(files)
+            record.count('files', len(files))
+            record.count('global_tokens', len(global_tokens))
+        return global_tokens, token_counter
+
+    def _analyze(self, files: List[FileInfo]) -> Tuple[Set[str], Counter]:
         all_tokens = []
         for file_info in files:
             all_tokens.extend(file_info.tokens)
@@ -252,16 +772,247 @@ class ClusterAnalyzer:
         min_common_tokens = matching_config.get('min_common_tokens', 1)
 
         global_tokens = set()
-        for token, count in token_counter.items():
-            if count >= min_common_tokens:
+        for token, frequency in token_counter.items():
+            if frequency >= min_common_tokens:
                 global_tokens.add(token)
 
         return global_tokens, token_counter
 
+    def title_tokens(self, file_info: FileInfo) -> FrozenSet[str]:
+        """文件名中剧名部分（第一个数字之前）的 Token"""
+        stem = file_info.stem
+        end = _TITLE_END.search(stem)
+        return frozenset(self.tokenizer.tokenize(stem[:end.start()] if end else stem))
+
+    def show_clusters(self, videos: List[FileInfo], subtitles: List[FileInfo]) -> ShowClusters:
+        """按剧名把文件分组，混合了多部剧集的媒体库拆成互不相干的小问题
+
+        不同的剧名 Token 集合用并查集合并：一个集合是另一个的子集时视为同一部剧的不同写法
+        （如 "The Office" 与 "The Office US"）。只共享部分 Token 的剧名（"Star Trek Picard" 与
+        "Star Trek Discovery"）保持分开。
+        """
+        with self.metrics.stage('cluster.shows') as record:
+            result = self._show_clusters(videos, subtitles)
+            record.count('files', len(videos) + len(subtitles))
+            record.count('clusters', len(result.clusters))
+            record.count('unclustered',
+                         len(result.unclustered_videos) + len(result.unclustered_subtitles))
+        return result
+
+    @staticmethod
+    def merge_titles(titles: List[FrozenSet[str]]) -> List[int]:
+        """用并查集合并剧名：返回每个剧名所属分组的代表下标（titles 中互不重复、非空）"""
+        parent = list(range(len(titles)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        # 包含某个剧名全部 Token 的剧名 = 各 Token 倒排表的交集
+        postings: Dict[str, Set[int]] = defaultdict(set)
+        for title_id, title in enumerate(titles):
+            for token in title:
+                postings[token].add(title_id)
+        for title_id, title in enumerate(titles):
+            for other in set.intersection(*(postings[token] for token in title)):
+                root, other_root = find(title_id), find(other)
+                if root != other_root:
+                    parent[other_root] = root
+        return [find(title_id) for title_id in range(len(titles))]
+
+    def _show_clusters(self, videos: List[FileInfo], subtitles: List[FileInfo]) -> ShowClusters:
+        key_ids: Dict[FrozenSet[str], int] = {}
+        file_keys = []
+        for file_info in videos + subtitles:
+            key = self.title_tokens(file_info)
+            if key and key not in key_ids:
+                key_ids[key] = len(key_ids)
+            file_keys.append(key_ids.get(key) if key else None)
+
+        roots = self.merge_titles(list(key_ids))
+        titles: Dict[int, Set[str]] = defaultdict(set)
+        for key, key_id in key_ids.items():
+            titles[roots[key_id]].update(key)
+        groups: Dict[int, ShowCluster] = {}
+        unclustered_videos = []
+        unclustered_subtitles = []
+        for file_info, key_id in zip(videos + subtitles, file_keys):
+            is_video = file_info.file_type == FileType.VIDEO
+            if key_id is None:
+                (unclustered_videos if is_video else unclustered_subtitles).append(file_info)
+                continue
+            root = roots[key_id]
+            cluster = groups.get(root)
+            if cluster is None:
+                cluster = groups[root] = ShowCluster(frozenset(titles[root]))
+            (cluster.videos if is_video else cluster.subtitles).append(file_info)
+
+        clusters = []
+        for cluster in groups.values():
+            if cluster.videos and cluster.subtitles:
+                clusters.append(cluster)
+            else:
+                unclustered_videos.extend(cluster.videos)
+                unclustered_subtitles.extend(cluster.subtitles)
+        return ShowClusters(clusters, unclustered_videos, unclustered_subtitles)
+
+
+class CandidateIndex:
+    # Matcher.match 仅在共享全局 Token 或集数相同时给出正分，只需对这些字幕评分
+
+    def __init__(self, subtitles: List[FileInfo], global_tokens: Set[str]):
+        self.subtitles = list(subtitles)
+        self.global_tokens = global_tokens
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        # 按集数（而非季+集）分桶：仅集数相同时 match 也会加 30 分
+        self.episode_buckets: Dict[int, List[int]] = defaultdict(list)
+        self.removed: Set[int] = set()
+        self._positions: Dict[Path, int] = {}
+
+        for position, subtitle in enumerate(self.subtitles):
+            self._index(position, subtitle)
+
+    def _index(self, position: int, subtitle: FileInfo) -> None:
+        self._positions[subtitle.path] = position
+        # 所有 Token 都建立倒排；查询时再与全局 Token 求交，global_tokens 变化后索引依然有效
+        for token in set(subtitle.tokens):
+            self.postings[token].append(position)
+        if subtitle.episode is not None:
+            self.episode_buckets[subtitle.episode].append(position)
+
+    def candidates(self, video: FileInfo) -> List[FileInfo]:
+        return [self.subtitles[position] for position in self.candidate_positions(video)]
+
+    def candidate_positions(self, video: FileInfo) -> List[int]:
+        return [position for position, _ in self.candidate_counts(video)]
+
+    def candidate_counts(self, video: FileInfo) -> List[Tuple[int, int]]:
+        # 倒排表中每个字幕每个 Token 只出现一次，命中次数即共享的全局 Token 数
+        counts: Counter = Counter()
+        for token in set(video.tokens) & self.global_tokens:
+            counts.update(self.postings.get(token, ()))
+
+        if video.season is not None and video.episode is not None:
+            for position in self.episode_buckets.get(video.episode, ()):
+                if position not in counts:
+                    counts[position] = 0
+
+        # 保持原始扫描顺序，使同分时的结果与全量扫描相同
+        removed = self.removed
+        return sorted(item for item in counts.items() if item[0] not in removed)
+
+    def add(self, subtitle: FileInfo) -> None:
+        self.discard(subtitle.path)
+        self.subtitles.append(subtitle)
+        self._index(len(self.subtitles) - 1, subtitle)
+
+    def remove(self, subtitle: FileInfo) -> None:
+        self.removed.add(self._positions[subtitle.path])
+
+    def discard(self, path: Path) -> None:
+        position = self._positions.pop(path, None)
+        if position is not None:
+            self.removed.add(position)
+
+    def __contains__(self, path: Path) -> bool:
+        position = self._positions.get(path)
+        return position is not None and position not in self.removed
+
+
+def partition_by_directory(videos: List[FileInfo], subtitles: List[FileInfo]
+                           ) -> Tuple[Dict[Path, Tuple[List[FileInfo], List[FileInfo]]],
+                                      List[FileInfo]]:
+    """按目录划分匹配分区，返回（目录 -> (视频, 字幕)，不属于任何分区的字幕）
+
+    每个直接包含视频的目录为一个分区；字幕归入自身所在目录或最近的、直接包含视频的上级目录
+    （如 Show/Subs/ 中的字幕归入 Show/），找不到时留给全局匹配。
+    """
+    partitions: Dict[Path, Tuple[List[FileInfo], List[FileInfo]]] = {}
+    for video in videos:
+        partitions.setdefault(video.path.parent, ([], []))[0].append(video)
+
+    owners: Dict[Path, Optional[Path]] = {}
+    leftover = []
+    for subtitle in subtitles:
+        directory = subtitle.path.parent
+        if directory not in owners:
+            owners[directory] = next((ancestor for ancestor in (directory, *directory.parents)
+                                      if ancestor in partitions), None)
+        owner = owners[directory]
+        if owner is None:
+            leftover.append(subtitle)
+        else:
+            partitions[owner][1].append(subtitle)
+    return partitions, leftover
+
 
 class Matcher:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, metrics: Optional[Metrics] = None):
         self.config = config
+        self.metrics = metrics or _DISABLED_METRICS
+        self._vector_engine_warned = False
+        self.recompile()
+        config.add_listener(self.recompile)
+
+    def recompile(self) -> None:
+        # 先编译到局部变量，全部成功后再替换：配置无效时保留原来的特征表
+        language_weights = self.config.get_language_weights()
+        # 末尾的 0 对应特征 ID -1（未识别）
+        language_table = [lang_config.get('weight', 0) for lang_config in language_weights] + [0]
+        language_automaton = KeywordAutomaton(
+            (keyword.lower(), position)
+            for position, lang_config in enumerate(language_weights)
+            for keyword in lang_config.get('keywords', [])
+        )
+
+        lineage_config = self.config.get_lineage_bonus_config()
+        lineage_enabled = lineage_config.get('enabled', False)
+        lineage_weight = lineage_config.get('weight', 20)
+        release_group_automaton = KeywordAutomaton(
+            (group.lower(), position)
+            for position, group in enumerate(lineage_config.get('common_release_groups', []))
+        )
+
+        format_weights = self.config.get_format_weights()
+        format_table = [format_config.get('weight', 0) for format_config in format_weights] + [0]
+        format_ids: Dict[str, int] = {}
+        for position, format_config in enumerate(format_weights):
+            format_ids.setdefault(format_config.get('name', '').lower(), position)
+
+        self._language_table = language_table
+        self._language_automaton = language_automaton
+        self._lineage_enabled = lineage_enabled
+        self._lineage_weight = lineage_weight
+        self._release_group_automaton = release_group_automaton
+        self._format_table = format_table
+        self._format_ids = format_ids
+        self._compiled_for = self.config.config
+        # 文件上缓存的特征带有版本号，配置变化后旧特征会在下次使用时重新计算
+        self._feature_version = next(_FEATURE_VERSIONS)
+
+    def _ensure_compiled(self) -> None:
+        if self.config.config is not self._compiled_for:
+            self.recompile()
+
+    def annotate(self, file_info: FileInfo) -> None:
+        self._ensure_compiled()
+        stem = file_info.stem.lower()
+        languages = self._language_automaton.search(stem)
+        file_info.language = min(languages) if languages else -1
+        file_info.format = self._format_ids.get(file_info.extension.lstrip('.').lower(), -1)
+        # 压制组集合以位掩码保存，血统判断只需一次按位与
+        file_info.release_groups = sum(1 << group
+                                       for group in self._release_group_automaton.search(stem))
+        file_info.feature_version = self._feature_version
+
+    def _ensure_features(self, files: Iterable[FileInfo]) -> None:
+        self._ensure_compiled()
+        version = self._feature_version
+        for file_info in files:
+            if file_info.feature_version != version:
+                self.annotate(file_info)
 
     def match(self, video: FileInfo, subtitle: FileInfo, global_tokens: Set[str]) -> float:
         score = 0.0
@@ -282,20 +1033,13 @@ class Matcher:
 
     def find_best_match(self, video: FileInfo, subtitles: List[FileInfo],
                        global_tokens: Set[str]) -> Optional[MatchResult]:
-        matches = []
-        for subtitle in subtitles:
-            score = self.match(video, subtitle, global_tokens)
-            if score > 0:
-                match_result = self._calculate_detailed_score(video, subtitle, score)
-                matches.append(match_result)
-
-        if not matches:
-            return None
-
         matching_config = self.config.get_matching_config()
         skip_on_conflict = matching_config.get('skip_on_conflict', True)
 
-        matches.sort(key=lambda x: x.score, reverse=True)
+        # 判断是否同分只需要前两名
+        matches = self.top_matches(video, subtitles, global_tokens, 2 if skip_on_conflict else 1)
+        if not matches:
+            return None
 
         if skip_on_conflict and len(matches) > 1:
             if matches[0].score == matches[1].score:
@@ -303,11 +1047,228 @@ class Matcher:
 
         return matches[0]
 
+    def top_matches(self, video: FileInfo, subtitles: List[FileInfo], global_tokens: Set[str],
+                    k: int) -> List[MatchResult]:
+        """返回总分最高的 k 个候选，按总分从高到低排列（同分时保持字幕的原始顺序）"""
+        if k <= 0:
+            return []
+        match = self.match
+        detailed_score = self._calculate_detailed_score
+        results = [detailed_score(video, subtitle, score) for subtitle in subtitles
+                   for score in (match(video, subtitle, global_tokens),) if score > 0]
+        # 与 sorted(..., reverse=True)[:k] 等价，同分时保持原始顺序
+        return heapq.nlargest(k, results, key=lambda match_result: match_result.score)
+
+    def assign(self, videos: List[FileInfo], subtitles: List[FileInfo], global_tokens: Set[str],
+               clusters: Optional[ShowClusters] = None,
+               alternatives: Optional[Dict[Path, List[MatchResult]]] = None) -> List[MatchResult]:
+        """整体最优分配；传入 clusters（matching.partition 为 show）时只在同一部剧集内匹配
+
+        传入 alternatives 字典时，顺便收集每个视频的备选字幕（见 assign_indexed）
+        """
+        if clusters is not None:
+            # 剧集分组内没配上的文件不再参加全局匹配，否则会和其他剧集的文件配对
+            groups = [(cluster.videos, cluster.subtitles) for cluster in clusters.clusters]
+            return self.assign_groups(groups, clusters.unclustered_videos,
+                                      clusters.unclustered_subtitles, global_tokens,
+                                      rematch_leftovers=False, alternatives=alternatives)
+        if self.config.get_matching_config().get('partition', 'none') == 'directory':
+            return self.assign_partitioned(videos, subtitles, global_tokens, alternatives)
+        return self.assign_indexed(videos, CandidateIndex(subtitles, global_tokens), global_tokens,
+                                   alternatives)
+
+    def assign_partitioned(self, videos: List[FileInfo], subtitles: List[FileInfo],
+                           global_tokens: Set[str],
+                           alternatives: Optional[Dict[Path, List[MatchResult]]] = None
+                           ) -> List[MatchResult]:
+        """先在每个目录分区内匹配，各分区剩下的视频和字幕再做一次全局匹配
+
+        同一目录的字幕不会被其他剧集目录中的视频抢走；大目录树拆成许多小的独立问题，评分的候选对随之减少。
+        """
+        with self.metrics.stage('match.partition') as record:
+            partitions, leftover_subtitles = partition_by_directory(videos, subtitles)
+            record.count('partitions', len(partitions))
+        return self.assign_groups(list(partitions.values()), [], leftover_subtitles, global_tokens,
+                                  alternatives=alternatives)
+
+    def assign_groups(self, groups: List[Tuple[List[FileInfo], List[FileInfo]]],
+                      leftover_videos: List[FileInfo], leftover_subtitles: List[FileInfo],
+                      global_tokens: Set[str], rematch_leftovers: bool = True,
+                      alternatives: Optional[Dict[Path, List[MatchResult]]] = None
+                      ) -> List[MatchResult]:
+        """在每组（视频，字幕）内分别匹配，leftover 中的视频和字幕再做一次全局匹配
+
+        rematch_leftovers 为 True 时，各组剩下的文件也参加这次全局匹配（目录分区：字幕可能放在
+        旁边的目录里）；为 False 时各组剩下的文件保持未匹配（剧集分组：组外只有其他剧集的文件）。
+        """
+        results = []
+        leftover_videos = list(leftover_videos)
+        leftover_subtitles = list(leftover_subtitles)
+        for partition_videos, partition_subtitles in groups:
+            if not partition_subtitles:
+                if rematch_leftovers:
+                    leftover_videos.extend(partition_videos)
+                continue
+            matched = self.assign_indexed(partition_videos,
+                                          CandidateIndex(partition_subtitles, global_tokens),
+                                          global_tokens, alternatives)
+            results.extend(matched)
+            if not rematch_leftovers:
+                continue
+            matched_videos = {match_result.video.path for match_result in matched}
+            matched_subtitles = {match_result.subtitle.path for match_result in matched}
+            leftover_videos.extend(video for video in partition_videos
+                                   if video.path not in matched_videos)
+            leftover_subtitles.extend(subtitle for subtitle in partition_subtitles
+                                      if subtitle.path not in matched_subtitles)
+
+        if leftover_videos and leftover_subtitles:
+            # 保持扫描顺序（按路径），同分时的取舍与不分区时一致
+            leftover_videos.sort(key=lambda video: str(video.path))
+            leftover_subtitles.sort(key=lambda subtitle: str(subtitle.path))
+            self.metrics.count('match.leftover_videos', len(leftover_videos))
+            self.metrics.count('match.leftover_subtitles', len(leftover_subtitles))
+            results.extend(self.assign_indexed(leftover_videos,
+                                               CandidateIndex(leftover_subtitles, global_tokens),
+                                               global_tokens, alternatives))
+            if alternatives:
+                # 分组内剩下的字幕可能在全局匹配中分给了别的视频，不再作为备选
+                assigned = {match_result.subtitle.path for match_result in results}
+                for video_path, candidates in alternatives.items():
+                    alternatives[video_path] = [candidate for candidate in candidates
+                                                if candidate.subtitle.path not in assigned]
+        return results
+
+    def assign_indexed(self, videos: List[FileInfo], candidate_index: CandidateIndex,
+                       global_tokens: Set[str],
+                       alternatives: Optional[Dict[Path, List[MatchResult]]] = None
+                       ) -> List[MatchResult]:
+        """对候选索引中的字幕求整体最优分配
+
+        传入 alternatives 字典时，把每个视频总分最高的 matching.alternatives 个备选字幕写入其中，
+        直接取自分配用的已评分候选对，不再重新评分。已分配给其他视频的字幕不算备选，
+        因此已匹配视频与备选的分差不会为负（否则换成该字幕总分更高）；
+        因同分被跳过的视频让出的字幕对它们自己仍是备选。
+        """
+        skip_on_conflict = self.config.get_matching_config().get('skip_on_conflict', True)
+        subtitles = candidate_index.subtitles
+        with self.metrics.stage('match.score') as record:
+            adjacency = self.score_candidates(videos, candidate_index, global_tokens)
+            record.count('videos', len(videos))
+            record.count('subtitles', len(subtitles))
+            record.count('pairs', sum(len(edges) for edges in adjacency))
+
+        with self.metrics.stage('match.assign') as record:
+            assignment = max_weight_matching(adjacency, len(subtitles))
+            optimal_subtitles = set(assignment.values())
+            if skip_on_conflict:
+                ambiguous = ambiguous_lefts(adjacency, assignment)
+                for video_position in ambiguous:
+                    del assignment[video_position]
+                record.count('ambiguous', len(ambiguous))
+            record.count('matches', len(assignment))
+
+        # 只为最终选中的候选对构造 MatchResult
+        results = []
+        for video_position in sorted(assignment):
+            video = videos[video_position]
+            subtitle = subtitles[assignment[video_position]]
+            score = self.match(video, subtitle, global_tokens)
+            results.append(self._calculate_detailed_score(video, subtitle, score))
+
+        alternative_count = self.config.get_matching_config().get('alternatives', 3)
+        if alternatives is not None and alternative_count > 0:
+            with self.metrics.stage('match.alternatives') as record:
+                kept_subtitles = set(assignment.values())
+                for video_position, edges in enumerate(adjacency):
+                    taken = optimal_subtitles if video_position in assignment else kept_subtitles
+                    # 同分时保持字幕的原始顺序
+                    ranked = heapq.nlargest(alternative_count,
+                                            ((score, -position) for position, score in edges
+                                             if position not in taken))
+                    video = videos[video_position]
+                    candidates = []
+                    for _, order in ranked:
+                        subtitle = subtitles[-order]
+                        score = self.match(video, subtitle, global_tokens)
+                        candidates.append(self._calculate_detailed_score(video, subtitle, score))
+                    alternatives[video.path] = candidates
+                    record.count('alternatives', len(candidates))
+        return results
+
+    def score_candidates(self, videos: List[FileInfo], candidate_index: CandidateIndex,
+                         global_tokens: Set[str], engine: Optional[str] = None
+                         ) -> List[List[Tuple[int, float]]]:
+        # 返回邻接表：adjacency[视频下标] = [(字幕下标, 总分), ...]，按字幕下标升序，已去掉低于阈值的候选
+        matching_config = self.config.get_matching_config()
+        min_score_threshold = matching_config.get('min_score_threshold', 0)
+        subtitles = candidate_index.subtitles
+        self._ensure_features(videos)
+        self._ensure_features(subtitles)
+        language_table = self._language_table
+        format_table = self._format_table
+        lineage_enabled = self._lineage_enabled
+        lineage_weight = self._lineage_weight
+
+        vector_engine = self._get_vector_engine(engine or matching_config.get('engine', 'scalar'))
+        if vector_engine is not None:
+            return vector_engine.score_adjacency(
+                videos, subtitles, global_tokens, language_table, format_table,
+                lineage_weight if lineage_enabled else None, min_score_threshold,
+                removed=candidate_index.removed)
+
+        # 与 match + _calculate_detailed_score 等价，但只用预先计算的特征做整数运算
+        adjacency = []
+        for video in videos:
+            edges = []
+            season = video.season
+            episode = video.episode
+            has_episode = season is not None and episode is not None
+            video_groups = video.release_groups
+            for position, common in candidate_index.candidate_counts(video):
+                subtitle = subtitles[position]
+                score = common * 10.0
+                if has_episode:
+                    if subtitle.season == season and subtitle.episode == episode:
+                        score += 50
+                    elif subtitle.episode == episode:
+                        score += 30
+                if score <= 0:
+                    continue
+                lineage_bonus = 0
+                if lineage_enabled and video_groups & subtitle.release_groups:
+                    lineage_bonus = lineage_weight
+                total_score = (score + language_table[subtitle.language]
+                               + format_table[subtitle.format] + lineage_bonus)
+                if total_score < min_score_threshold:
+                    continue
+                edges.append((position, total_score))
+            adjacency.append(edges)
+        return adjacency
+
+    def _get_vector_engine(self, engine: str):
+        if engine != 'numpy':
+            return None
+        # numpy/scipy 为可选依赖，仅在启用时才导入
+        try:
+            if __package__:
+                from . import vector_engine
+            else:
+                import vector_engine
+        except ImportError as e:
+            if not self._vector_engine_warned:
+                print(f"警告：matching.engine 为 numpy，但无法导入 numpy/scipy（{e}），改用标量评分",
+                      file=sys.stderr)
+                self._vector_engine_warned = True
+            return None
+        return vector_engine
+
     def _calculate_detailed_score(self, video: FileInfo, subtitle: FileInfo,
                                   base_score: float) -> MatchResult:
-        language_weight = self._calculate_language_weight(subtitle.stem)
-        format_weight = self._calculate_format_weight(subtitle.extension)
-        lineage_bonus = self._calculate_lineage_bonus(video.stem, subtitle.stem)
+        self._ensure_features((video, subtitle))
+        language_weight = self._language_table[subtitle.language]
+        format_weight = self._format_table[subtitle.format]
+        lineage_bonus = self._calculate_lineage_bonus(video, subtitle)
 
         total_score = base_score + language_weight + format_weight + lineage_bonus
 
@@ -320,163 +1281,249 @@ class Matcher:
             lineage_bonus=lineage_bonus
         )
 
-    def _calculate_language_weight(self, filename: str) -> float:
-        language_weights = self.config.get_language_weights()
-        filename_lower = filename.lower()
-
-        for lang_config in language_weights:
-            keywords = [kw.lower() for kw in lang_config.get('keywords', [])]
-            for keyword in keywords:
-                if keyword in filename_lower:
-                    return lang_config.get('weight', 0)
-
-        return 0
-
-    def _calculate_format_weight(self, extension: str) -> float:
-        format_weights = self.config.get_format_weights()
-        extension = extension.lstrip('.')
-
-        for format_config in format_weights:
-            if format_config.get('name', '').lower() == extension.lower():
-                return format_config.get('weight', 0)
-
-        return 0
-
-    def _calculate_lineage_bonus(self, video_name: str, subtitle_name: str) -> float:
-        lineage_config = self.config.get_lineage_bonus_config()
-        if not lineage_config.get('enabled', False):
+    def _calculate_lineage_bonus(self, video: FileInfo, subtitle: FileInfo) -> float:
+        if not self._lineage_enabled:
             return 0
 
-        video_lower = video_name.lower()
-        subtitle_lower = subtitle_name.lower()
-
-        release_groups = lineage_config.get('common_release_groups', [])
-        bonus_weight = lineage_config.get('weight', 20)
-
-        for group in release_groups:
-            if group.lower() in video_lower and group.lower() in subtitle_lower:
-                return bonus_weight
+        if video.release_groups & subtitle.release_groups:
+            return self._lineage_weight
 
         return 0
 
 
 class Renamer:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, metrics: Optional[Metrics] = None):
         self.config = config
-
-    def rename(self, match_result: MatchResult, dry_run: bool = True) -> bool:
-        video = match_result.video
+        self.metrics = metrics or _DISABLED_METRICS
+        safety_config = config.get_safety_config()
+        self.batch_renamer = BatchRenamer(safety_config.get('journal_dir', DEFAULT_JOURNAL_DIR),
+                                          keep=safety_config.get('journal_keep', 100))
+
+    @staticmethod
+    def target_path(match_result: MatchResult) -> Path:
+        """字幕重命名后的路径：与视频同名，保留字幕扩展名"""
         subtitle = match_result.subtitle
+        return subtitle.path.parent / (match_result.video.stem + subtitle.extension)
 
-        new_subtitle_name = video.stem + subtitle.extension
-        new_subtitle_path = subtitle.path.parent / new_subtitle_name
+    def rename(self, match_result: MatchResult, dry_run: bool = True) -> bool:
+        outcome = self.rename_batch([match_result], dry_run=dry_run)
+        return outcome.succeeded(str(match_result.subtitle.path))
 
-        if new_subtitle_path == subtitle.path:
-            return False
+    def rename_batch(self, matches: List[MatchResult], dry_run: bool = True,
+                     journal_group: Optional[str] = None) -> RenameOutcome:
+        """将一批匹配结果作为一次事务重命名：整批检查冲突后两阶段移动，并写入重命名日志
 
-        if dry_run:
-            print(f"[DRY RUN] {subtitle.name} -> {new_subtitle_name}")
-            return True
-        else:
-            try:
-                subtitle.path.rename(new_subtitle_path)
-                print(f"[RENAME] {subtitle.name} -> {new_subtitle_name}")
-                return True
-            except Exception as e:
-                print(f"[ERROR] 重命名失败：{subtitle.name} -> {new_subtitle_name}")
-                print(f"  错误信息：{e}")
-                return False
+        用 outcome.succeeded(str(subtitle.path)) 判断单个字幕是否重命名成功。
+        不输出任何内容；需要逐个字幕的结果时使用 engine.Engine.rename。
+        journal_group 见 BatchRenamer.execute 的 group。
+        """
+        operations = []
+        unchanged = []
+        for match_result in matches:
+            new_subtitle_path = self.target_path(match_result)
+            if new_subtitle_path == match_result.subtitle.path:
+                unchanged.append(str(new_subtitle_path))
+            else:
+                operations.append(RenameOperation(str(match_result.subtitle.path),
+                                                  str(new_subtitle_path)))
+
+        with self.metrics.stage('rename') as record:
+            outcome = self.batch_renamer.execute(operations, dry_run=dry_run, group=journal_group)
+            record.count('operations', len(operations))
+            record.count('failed', len(outcome.errors))
+
+        for source in unchanged:
+            outcome.errors[source] = '文件名已与视频一致'
+        return outcome
+
+    def undo(self, journal: str, dry_run: bool = True, quiet: bool = False) -> RenameOutcome:
+        """按重命名日志将字幕恢复为原文件名"""
+        outcome = self.batch_renamer.undo(journal, dry_run=dry_run)
+        if not quiet:
+            for operation in outcome.operations:
+                error = outcome.errors.get(operation.source)
+                label = '[ERROR]' if error else ('[DRY RUN]' if dry_run else '[UNDO]')
+                print(f"{label} {Path(operation.source).name} -> {Path(operation.target).name}")
+                if error:
+                    print(f"  错误信息：{error}")
+            sources = {operation.source for operation in outcome.operations}
+            for source, error in outcome.errors.items():
+                if source not in sources:
+                    print(f"[SKIP] {Path(source).name}：{error}")
+            if outcome.journal:
+                print(f"撤销日志：{outcome.journal}")
+        return outcome
+
+
+def validate_config(data: dict) -> None:
+    """在写入前编译候选配置（分词规则、集数模式及条件、匹配特征表），配置无效时抛出 ValueError"""
+    config = Config.from_dict(data)
+    try:
+        Tokenizer(config)
+        EpisodeExtractor(config)
+        Matcher(config)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"配置无效：{e}") from e
 
 
 class SubMatcher:
     def __init__(self, config_path: str = "config.yaml"):
         self.config = Config(config_path)
+        self.metrics = Metrics(enabled=self.config.get_metrics_config().get('enabled', True))
         self.tokenizer = Tokenizer(self.config)
         self.episode_extractor = EpisodeExtractor(self.config)
-        self.file_scanner = FileScanner(self.config, self.tokenizer, self.episode_extractor)
-        self.cluster_analyzer = ClusterAnalyzer(self.config)
-        self.matcher = Matcher(self.config)
-        self.renamer = Renamer(self.config)
+        self.matcher = Matcher(self.config, metrics=self.metrics)
+        self.file_scanner = FileScanner(self.config, self.tokenizer, self.episode_extractor,
+                                        annotate=self.matcher.annotate, metrics=self.metrics)
+        self.cluster_analyzer = ClusterAnalyzer(self.config, metrics=self.metrics,
+                                                tokenizer=self.tokenizer)
+        self.renamer = Renamer(self.config, metrics=self.metrics)
+        self._engine = None
+        # 分词缓存在配置变化后会重建，每次读取当前的缓存统计
+        self.metrics.register_cache('tokenizer',
+                                    lambda: self.tokenizer._tokenize_cached.cache_info()[:2])
+
+    @property
+    def engine(self):
+        """结构化事件引擎；CLI、MCP 适配器和批处理共用同一条执行路径"""
+        if self._engine is None:
+            try:
+                from .engine import Engine
+            except ImportError:
+                from engine import Engine
+            self._engine = Engine(self)
+        return self._engine
+
+    def run(self, directory: str, confirm: bool = False, verbose: bool = False,
+            stream: bool = False):
+        """扫描、匹配并重命名目录，结果输出到控制台；返回 engine.RunCompleted（stream 为真时返回
+        engine.StreamCompleted），出错时返回 None"""
+        try:
+            from .engine import ConsoleSink, drain
+        except ImportError:
+            from engine import ConsoleSink, drain
 
-    def run(self, directory: str, confirm: bool = False, verbose: bool = False) -> None:
+        safety_config = self.config.get_safety_config()
+        dry_run = False if confirm else safety_config.get('dry_run', True)
+        matching_config = self.config.get_matching_config()
+        sink = ConsoleSink(verbose=verbose,
+                           log_unmatched=matching_config.get('log_unmatched', True))
         try:
-            print(f"扫描目录：{directory}")
-            video_files, subtitle_files = self.file_scanner.scan_directory(directory)
+            if stream:
+                return drain(self.engine.run_streaming(directory, dry_run=dry_run), sink)
+            return drain(self.engine.run(directory, dry_run=dry_run), sink)
+        except Exception as e:
+            print(f"错误：{e}")
+            import traceback
+            traceback.print_exc()
+            return None
 
-            print(f"找到 {len(video_files)} 个视频文件")
-            print(f"找到 {len(subtitle_files)} 个字幕文件")
+    def run_batch(self, directories: List[str], confirm: bool = False, verbose: bool = False,
+                  jobs: Optional[int] = None, split: Optional[bool] = None) -> None:
+        try:
+            from .batch import run_batch
+        except ImportError:
+            from batch import run_batch
 
-            if not video_files or not subtitle_files:
-                print("未找到视频或字幕文件，退出")
-                return
+        batch_config = self.config.get_batch_config()
+        safety_config = self.config.get_safety_config()
+        dry_run = False if confirm else safety_config.get('dry_run', True)
+        if split is None:
+            split = batch_config.get('split_roots', False)
 
-            all_files = video_files + subtitle_files
-            global_tokens, token_counter = self.cluster_analyzer.analyze(all_files)
+        try:
+            report = run_batch(self.config.config_path, directories, dry_run=dry_run,
+                               max_workers=jobs or batch_config.get('max_workers') or None,
+                               split_roots=split)
+        except ValueError as e:
+            print(f"错误：{e}")
+            return
+
+        print(f"批处理 {report['directory_count']} 个目录（{report['workers']} 个进程，"
+              f"{'演习模式' if dry_run else '执行模式'}）")
+        for result in report['results']:
+            if not result['success']:
+                print(f"\n[失败] {result['directory']}：{result.get('error')}")
+                continue
+            print(f"\n{result['directory']}：匹配 {result['renamed_count']} 个，"
+                  f"跳过 {result['skipped_count']} 个，失败 {result['failed_count']} 个")
+            if verbose:
+                for renamed in result['renamed_files']:
+                    print(f"  {renamed['old_name']} -> {renamed['new_name']}")
+
+        print("\n=== 总结 ===")
+        print(f"匹配成功：{report['renamed_count']} 个")
+        print(f"跳过：{report['skipped_count']} 个")
+        print(f"失败：{report['failed_count']} 个")
+        print(f"出错目录：{report['error_count']} 个")
+        print(f"耗时：{report['elapsed']:.2f} 秒")
+
+    def undo(self, journal: str, confirm: bool = False) -> None:
+        safety_config = self.config.get_safety_config()
+        dry_run = False if confirm else safety_config.get('dry_run', True)
+        if dry_run:
+            print("=== 演习模式（Dry Run）===")
+            print("使用 --confirm 或 -y 参数执行实际撤销\n")
+        try:
+            outcome = self.renamer.undo(journal, dry_run=dry_run)
+        except (OSError, ValueError) as e:
+            print(f"错误：无法读取重命名日志：{e}")
+            return
+        restored = sum(1 for operation in outcome.operations if outcome.succeeded(operation.source))
+        print("\n=== 总结 ===")
+        print(f"恢复：{restored} 个")
+        print(f"跳过：{len(outcome.errors)} 个")
+
+    def watch(self, directory: str, confirm: bool = False, verbose: bool = False) -> None:
+        try:
+            from .watcher import WatchSession
+        except ImportError:
+            from watcher import WatchSession
+
+        safety_config = self.config.get_safety_config()
+        dry_run = False if confirm else safety_config.get('dry_run', True)
 
+        def report(match_result: MatchResult, success: bool) -> None:
             if verbose:
-                print(f"\n全局Token（前20个）：")
-                for token, count in token_counter.most_common(20):
-                    print(f"  {token}: {count}")
+                print(f"  评分：{match_result.score:.1f}（{match_result.video.name}）")
 
-            safety_config = self.config.get_safety_config()
-            if confirm:
-                dry_run = False
-            else:
-                dry_run = safety_config.get('dry_run', True)
+        print(f"监视目录：{directory}")
+        session = WatchSession(self, directory, dry_run=dry_run, on_result=report)
+        print(f"监视后端：{session.backend_name}，{'演习模式' if dry_run else '执行模式'}，按 Ctrl+C 退出")
+        try:
+            session.serve()
+        except KeyboardInterrupt:
+            print("\n停止监视")
+        finally:
+            session.close()
 
-            if dry_run:
-                print("\n=== 演习模式（Dry Run）===")
-                print("仅显示拟重命名结果，不会实际修改文件")
-                print("使用 --confirm 或 -y 参数执行实际重命名\n")
-            else:
-                print("\n=== 执行模式 ===")
-                print("将实际重命名字幕文件\n")
-
-            matched_count = 0
-            skipped_count = 0
-
-            for video in video_files:
-                match_result = self.matcher.find_best_match(video, subtitle_files, global_tokens)
-
-                if match_result:
-                    if verbose:
-                        print(f"\n匹配：{video.name}")
-                        print(f"  字幕：{match_result.subtitle.name}")
-                        print(f"  评分：{match_result.score:.1f}")
-                        print(f"    - 基础分：{match_result.score - match_result.language_weight - match_result.format_weight - match_result.lineage_bonus:.1f}")
-                        print(f"    - 语言权重：{match_result.language_weight:.1f}")
-                        print(f"    - 格式权重：{match_result.format_weight:.1f}")
-                        print(f"    - 血统加分：{match_result.lineage_bonus:.1f}")
-
-                    success = self.renamer.rename(match_result, dry_run=dry_run)
-                    if success:
-                        matched_count += 1
-                        subtitle_files.remove(match_result.subtitle)
-                else:
-                    if verbose:
-                        print(f"\n未匹配：{video.name}")
-                    skipped_count += 1
-
-            print(f"\n=== 总结 ===")
-            print(f"匹配成功：{matched_count} 个")
-            print(f"跳过：{skipped_count} 个")
-            print(f"剩余未匹配字幕：{len(subtitle_files)} 个")
-
-            matching_config = self.config.get_matching_config()
-            if matching_config.get('log_unmatched', True) and subtitle_files:
-                print(f"\n未匹配的字幕文件：")
-                for subtitle in subtitle_files:
-                    print(f"  {subtitle.name}")
 
-        except Exception as e:
-            print(f"错误：{e}")
-            import traceback
-            traceback.print_exc()
+def undo_main(argv: List[str]):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='submatcher.py undo',
+        description='按重命名日志撤销一批重命名'
+    )
+    parser.add_argument('journal', help='重命名日志文件（执行重命名时输出的路径）')
+    parser.add_argument('-c', '--config', default='config.yaml',
+                       help='配置文件路径（默认：config.yaml）')
+    parser.add_argument('-y', '--confirm', action='store_true',
+                       help='确认执行实际撤销（默认为演习模式）')
+
+    args = parser.parse_args(argv)
+    SubMatcher(args.config).undo(args.journal, confirm=args.confirm)
 
 
 def main():
     import argparse
 
+    if sys.argv[1:2] == ['undo']:
+        undo_main(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(
         description='智能字幕对齐重命名工具',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -485,21 +1532,71 @@ def main():
   python submatcher.py /path/to/videos
   python submatcher.py /path/to/videos --confirm
   python submatcher.py /path/to/videos -c custom_config.yaml -v
+  python submatcher.py /path/to/videos --watch --confirm
+  python submatcher.py /path/to/show1 /path/to/show2 -j 4
+  python submatcher.py /path/to/library --split --confirm
+  python submatcher.py /path/to/archive --stream --confirm
+  python submatcher.py /path/to/videos --profile --profile-output submatcher.prof
+  python submatcher.py undo ~/.cache/mcp-submatcher/journals/<日志文件>.jsonl --confirm
         """
     )
 
-    parser.add_argument('directory', help='要扫描的目录路径')
+    parser.add_argument('directories', nargs='+', metavar='directory',
+                       help='要扫描的目录路径（多个目录时批量并行处理）')
     parser.add_argument('-c', '--config', default='config.yaml',
                        help='配置文件路径（默认：config.yaml）')
     parser.add_argument('-y', '--confirm', action='store_true',
                        help='确认执行实际重命名（默认为演习模式）')
     parser.add_argument('-v', '--verbose', action='store_true',
                        help='显示详细输出')
+    parser.add_argument('-w', '--watch', action='store_true',
+                       help='监视目录变化，持续匹配新增的字幕')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                       help='批处理的并行进程数（默认：batch.max_workers 或 CPU 核数）')
+    parser.add_argument('--split', action='store_true',
+                       help='批处理时将每个目录按子目录（剧集）拆分后并行处理')
+    parser.add_argument('--stream', action='store_true',
+                       help='流式处理超大目录树：扫描结果写入临时文件，逐组匹配、分批重命名，内存占用不随文件数增长')
+    parser.add_argument('--profile', action='store_true',
+                       help='结束时输出各阶段耗时、处理数量、缓存命中率和峰值内存')
+    parser.add_argument('--profile-output', metavar='FILE', default=None,
+                       help='同时用 cProfile 分析并将结果写入 FILE（可用 python -m pstats FILE 查看）')
 
     args = parser.parse_args()
 
     matcher = SubMatcher(args.config)
-    matcher.run(args.directory, confirm=args.confirm, verbose=args.verbose)
+    batch = len(args.directories) > 1 or args.split or args.jobs is not None
+    if args.watch and len(args.directories) > 1:
+        parser.error('--watch 只支持一个目录')
+    if args.stream and (batch or args.watch):
+        parser.error('--stream 只支持单个目录，且不能与 --watch 同时使用')
+
+    profiler = None
+    if args.profile or args.profile_output:
+        matcher.metrics.enabled = True
+        if args.profile_output:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+    started = time.perf_counter()
+    try:
+        if args.watch:
+            matcher.watch(args.directories[0], confirm=args.confirm, verbose=args.verbose)
+        elif batch:
+            matcher.run_batch(args.directories, confirm=args.confirm, verbose=args.verbose,
+                              jobs=args.jobs, split=args.split or None)
+        else:
+            matcher.run(args.directories[0], confirm=args.confirm, verbose=args.verbose,
+                        stream=args.stream)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile_output)
+        if args.profile or args.profile_output:
+            print(f"\n=== 性能统计（总耗时 {time.perf_counter() - started:.3f} 秒）===")
+            print(matcher.metrics.format())
+            if profiler is not None:
+                print(f"cProfile 结果已写入：{args.profile_output}")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+向量化评分引擎（可选，依赖 numpy 和 scipy）
+将视频、字幕编码为限定在全局 Token 上的稀疏关联矩阵，一次稀疏矩阵乘法得到所有共享 Token 数，
+集数、语言、格式、血统各项以向量运算叠加，结果与 Matcher 的逐对评分完全一致
+
+在配置中设置 matching.engine: numpy 启用；可用以下命令在实际媒体库上核对两种引擎的结果：
+    python core/vector_engine.py /path/to/videos [config.yaml]
+"""
+
+import sys
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from scipy import sparse
+
+Adjacency = List[List[Tuple[int, float]]]
+
+
+def _incidence(rows: Sequence[Iterable[int]], columns: int) -> sparse.csr_matrix:
+    """由每行的列号集合构造 0/1 稀疏矩阵"""
+    indptr = [0]
+    indices: List[int] = []
+    for row in rows:
+        indices.extend(row)
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.int32)
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(rows), columns))
+
+
+def _bits(mask: int) -> List[int]:
+    bits = []
+    position = 0
+    while mask:
+        if mask & 1:
+            bits.append(position)
+        mask >>= 1
+        position += 1
+    return bits
+
+
+def score_adjacency(videos, subtitles, global_tokens: Set[str],
+                    language_table: Sequence[float], format_table: Sequence[float],
+                    lineage_weight: Optional[float], min_score_threshold: float,
+                    removed: Iterable[int] = ()) -> Adjacency:
+    """计算所有候选对的总分，返回与 Matcher 标量路径相同的邻接表
+
+    videos / subtitles 须已由 Matcher.annotate 计算特征；lineage_weight 为 None 表示关闭血统加分，
+    removed 中的字幕下标不参与匹配。
+    """
+    if not videos or not subtitles:
+        return [[] for _ in videos]
+
+    vocabulary: Dict[str, int] = {token: index for index, token in enumerate(global_tokens)}
+    token_count = len(vocabulary)
+    video_tokens = _incidence(
+        [{vocabulary[t] for t in video.tokens if t in vocabulary} for video in videos], token_count)
+    subtitle_tokens = _incidence(
+        [{vocabulary[t] for t in subtitle.tokens if t in vocabulary} for subtitle in subtitles],
+        token_count)
+    # 共享的全局 Token 数（每个文件的 Token 已去重）
+    base = (video_tokens @ subtitle_tokens.T).astype(np.float64) * 10.0
+
+    # 集数加分：季+集相同 +50，仅集相同 +30；只有视频同时识别出季和集时才计算
+    episode_keys: Dict[int, int] = {}
+    season_keys: Dict[Tuple[int, int], int] = {}
+    video_episode_rows = []
+    video_season_rows = []
+    for video in videos:
+        if video.season is not None and video.episode is not None:
+            video_episode_rows.append((episode_keys.setdefault(video.episode, len(episode_keys)),))
+            video_season_rows.append(
+                (season_keys.setdefault((video.season, video.episode), len(season_keys)),))
+        else:
+            video_episode_rows.append(())
+            video_season_rows.append(())
+    subtitle_episode_rows = []
+    subtitle_season_rows = []
+    for subtitle in subtitles:
+        episode_key = episode_keys.get(subtitle.episode)
+        season_key = season_keys.get((subtitle.season, subtitle.episode))
+        subtitle_episode_rows.append(() if episode_key is None else (episode_key,))
+        subtitle_season_rows.append(() if season_key is None else (season_key,))
+    same_episode = _incidence(video_episode_rows, len(episode_keys)) @ \
+        _incidence(subtitle_episode_rows, len(episode_keys)).T
+    same_season = _incidence(video_season_rows, len(season_keys)) @ \
+        _incidence(subtitle_season_rows, len(season_keys)).T
+    base = base + same_episode * 30.0 + same_season * 20.0
+
+    base = sparse.csr_matrix(base)
+    base.eliminate_zeros()
+    if removed:
+        keep = np.ones(len(subtitles), dtype=bool)
+        keep[list(removed)] = False
+        base = base @ sparse.diags(keep.astype(np.float64))
+        base.eliminate_zeros()
+    base.sort_indices()
+
+    rows = np.repeat(np.arange(len(videos)), np.diff(base.indptr))
+    columns = base.indices
+
+    # 字幕的语言、格式特征 ID 为 -1 时对应表末尾的 0
+    subtitle_language = np.array([subtitle.language for subtitle in subtitles], dtype=np.int64)
+    subtitle_format = np.array([subtitle.format for subtitle in subtitles], dtype=np.int64)
+    language_weights = np.asarray(language_table, dtype=np.float64)[subtitle_language]
+    format_weights = np.asarray(format_table, dtype=np.float64)[subtitle_format]
+
+    # 与标量路径相同的加法顺序，保证浮点结果逐位一致
+    total = base.data + language_weights[columns]
+    total = total + format_weights[columns]
+
+    if lineage_weight is not None:
+        group_count = max(f.release_groups.bit_length() for f in (*videos, *subtitles))
+        if group_count <= 64:
+            video_groups = np.array([video.release_groups for video in videos], dtype=np.uint64)
+            subtitle_groups = np.array([subtitle.release_groups for subtitle in subtitles],
+                                       dtype=np.uint64)
+            lineage = (video_groups[rows] & subtitle_groups[columns]) != 0
+        else:
+            video_bits = _incidence([_bits(video.release_groups) for video in videos], group_count)
+            subtitle_bits = _incidence([_bits(subtitle.release_groups) for subtitle in subtitles],
+                                       group_count)
+            shares_group = video_bits @ subtitle_bits.T
+            lineage = np.asarray(shares_group[rows, columns]).ravel() > 0
+        total = total + np.where(lineage, lineage_weight, 0)
+
+    keep = total >= min_score_threshold
+    # 行已按视频下标排列、行内按字幕下标升序，按行切片即得邻接表
+    edges = list(zip(columns[keep].tolist(), total[keep].tolist()))
+    bounds = [0] + np.cumsum(np.bincount(rows[keep], minlength=len(videos))).tolist()
+    return [edges[bounds[row]:bounds[row + 1]] for row in range(len(videos))]
+
+
+def verify_against_scalar(matcher, videos, subtitles, global_tokens: Set[str]) -> List[str]:
+    """分别用标量和向量化路径为同一批文件评分，返回所有不一致之处（为空表示完全一致）"""
+    try:
+        from .submatcher import CandidateIndex
+    except ImportError:
+        from submatcher import CandidateIndex
+
+    candidate_index = CandidateIndex(subtitles, global_tokens)
+    expected = matcher.score_candidates(videos, candidate_index, global_tokens, engine='scalar')
+    actual = matcher.score_candidates(videos, candidate_index, global_tokens, engine='numpy')
+
+    differences = []
+    for video, expected_edges, actual_edges in zip(videos, expected, actual):
+        if expected_edges != actual_edges:
+            expected_map = dict(expected_edges)
+            actual_map = dict(actual_edges)
+            for position in sorted(expected_map.keys() | actual_map.keys()):
+                if expected_map.get(position) != actual_map.get(position):
+                    differences.append(f"{video.name} <-> {subtitles[position].name}: "
+                                       f"scalar={expected_map.get(position)} "
+                                       f"numpy={actual_map.get(position)}")
+    return differences
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("用法：python vector_engine.py <目录> [配置文件]")
+        sys.exit(1)
+
+    try:
+        from .submatcher import SubMatcher
+    except ImportError:
+        from submatcher import SubMatcher
+
+    config_path = sys.argv[2] if len(sys.argv) > 2 else "config.yaml"
+    submatcher = SubMatcher(config_path)
+    video_files, subtitle_files = submatcher.file_scanner.scan_directory(sys.argv[1])
+    global_tokens, _ = submatcher.cluster_analyzer.analyze(video_files + subtitle_files)
+
+    differences = verify_against_scalar(submatcher.matcher, video_files, subtitle_files,
+                                        global_tokens)
+    print(f"视频 {len(video_files)} 个，字幕 {len(subtitle_files)} 个")
+    if differences:
+        print(f"发现 {len(differences)} 处不一致：")
+        for difference in differences[:50]:
+            print(f"  {difference}")
+        sys.exit(1)
+    print("两种引擎的评分完全一致")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+监视模式
+订阅文件系统事件（Linux 使用 inotify，其他平台回退为轮询），增量维护 Token 统计和字幕候选索引，
+按防抖批次只对新增/变化的文件进行匹配和重命名
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    from .submatcher import CandidateIndex, FileInfo, FileType, MatchResult
+    from .engine import ConsoleSink, drain
+except ImportError:
+    from submatcher import CandidateIndex, FileInfo, FileType, MatchResult
+    from engine import ConsoleSink, drain
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_DELETE_SELF | IN_MOVE_SELF)
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """基于 inotify 的递归目录监视（仅 Linux）"""
+
+    name = 'inotify'
+
+    def __init__(self, root: str, extensions: Set[str]):
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self.extensions = extensions
+        self._directories: Dict[int, str] = {}
+        try:
+            self._add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, directory: str) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"inotify_add_watch 失败：{directory}（{os.strerror(error)}）")
+        self._directories[wd] = directory
+
+    def _add_tree(self, root: str) -> List[str]:
+        """监视 root 及其所有子目录，返回其中已存在的媒体文件"""
+        found = []
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            self._add_watch(directory)
+            try:
+                with os.scandir(directory) as iterator:
+                    for entry in iterator:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif os.path.splitext(entry.name)[1].lower() in self.extensions:
+                            found.append(entry.path)
+            except (PermissionError, FileNotFoundError, NotADirectoryError):
+                continue
+        return found
+
+    def read_changes(self, timeout: float) -> Optional[Set[str]]:
+        """等待至多 timeout 秒，返回变化的媒体文件路径；事件队列溢出时返回 None 表示需要全量同步"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changes = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if mask & IN_IGNORED:
+                    self._directories.pop(wd, None)
+                    continue
+                directory = self._directories.get(wd)
+                if directory is None or not name:
+                    continue
+
+                path = os.path.join(directory, os.fsdecode(name))
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        # 新目录内可能已经有文件（例如整体移入的季目录）
+                        try:
+                            changes.update(self._add_tree(path))
+                        except OSError:
+                            return None
+                    elif mask & (IN_DELETE | IN_MOVED_FROM):
+                        # 被移走的目录中的文件无法逐个得知，交给全量同步处理
+                        return None
+                elif os.path.splitext(path)[1].lower() in self.extensions:
+                    changes.add(path)
+        return changes
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher:
+    """定期对比目录快照的回退实现"""
+
+    name = 'polling'
+
+    def __init__(self, root: str, extensions: Set[str], interval: float = 2.0):
+        self.root = root
+        self.extensions = extensions
+        self.interval = interval
+        self._snapshot = self._take_snapshot()
+        self._next_poll = time.monotonic() + interval
+
+    def _take_snapshot(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as iterator:
+                    for entry in iterator:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            elif os.path.splitext(entry.name)[1].lower() in self.extensions:
+                                stat = entry.stat()
+                                snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+                        except OSError:
+                            continue
+            except (PermissionError, FileNotFoundError, NotADirectoryError):
+                continue
+        return snapshot
+
+    def read_changes(self, timeout: float) -> Optional[Set[str]]:
+        wait_for = self._next_poll - time.monotonic()
+        if wait_for > timeout:
+            time.sleep(timeout)
+            return set()
+        if wait_for > 0:
+            time.sleep(wait_for)
+        self._next_poll = time.monotonic() + self.interval
+
+        snapshot = self._take_snapshot()
+        previous = self._snapshot
+        self._snapshot = snapshot
+        changes = {path for path, state in snapshot.items() if previous.get(path) != state}
+        changes.update(path for path in previous if path not in snapshot)
+        return changes
+
+    def close(self) -> None:
+        pass
+
+
+def create_watcher(root: str, extensions: Set[str], watch_config: dict):
+    backend = watch_config.get('backend', 'auto')
+    if backend in ('auto', 'inotify') and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(root, extensions)
+        except (OSError, AttributeError) as e:
+            if backend == 'inotify':
+                raise
+            # 例如超出 fs.inotify.max_user_watches
+            print(f"警告：inotify 不可用（{e}），改用轮询", file=sys.stderr)
+    return PollingWatcher(root, extensions, watch_config.get('poll_interval', 2.0))
+
+
+class WatchSession:
+    """增量匹配会话：维护 Token 计数、全局 Token 集合和未配对字幕的候选索引
+
+    同目录下已有同名字幕的视频视为已配对，不再参与匹配。
+    演习模式下匹配成功的视频和字幕同样视为已处理，直到其中一方变化。
+    会话中的重命名日志归入同一分组，清理旧日志时整个会话计为一份。
+    """
+
+    def __init__(self, submatcher, directory: str, dry_run: bool = True,
+                 on_result: Optional[Callable[[MatchResult, bool], None]] = None,
+                 quiet: bool = False):
+        self.submatcher = submatcher
+        self.config = submatcher.config
+        self.directory = str(Path(directory))
+        self.dry_run = dry_run
+        self.on_result = on_result
+        self.quiet = quiet
+        self.sink = None if quiet else ConsoleSink()
+
+        watch_config = self.config.get_watch_config()
+        self.debounce = watch_config.get('debounce', 0.3)
+        self.max_delay = watch_config.get('max_delay', 1.0)
+        self.video_extensions = set(self.config.get_video_extensions())
+        self.extensions = self.video_extensions | set(self.config.get_subtitle_extensions())
+
+        self.files: Dict[Path, FileInfo] = {}
+        self.token_counter: Counter = Counter()
+        self.global_tokens: Set[str] = set()
+        self.candidate_index = CandidateIndex([], self.global_tokens)
+        self.unpaired_videos: Set[Path] = set()
+        self._videos_by_key: Dict[Tuple[Path, str], Set[Path]] = defaultdict(set)
+        self._subtitles_by_key: Dict[Tuple[Path, str], Set[Path]] = defaultdict(set)
+        # 演习模式下已匹配的 视频 -> 字幕 及其反向映射
+        self._planned: Dict[Path, Path] = {}
+        self._planned_videos: Dict[Path, Path] = {}
+        self.history: Deque[dict] = deque(maxlen=watch_config.get('history_size', 200))
+        self.batches = 0
+        self.journal_group = f"{time.strftime('%Y%m%d-%H%M%S')}-watch-{uuid.uuid4().hex[:12]}"
+
+        self.watcher = create_watcher(self.directory, self.extensions, watch_config)
+        self.backend_name = self.watcher.name
+        self.resync()
+
+    @staticmethod
+    def _pair_key(file_info: FileInfo) -> Tuple[Path, str]:
+        return file_info.path.parent, file_info.stem
+
+    def _update_global(self, tokens: Iterable[str]) -> None:
+        min_common_tokens = self.config.get_matching_config().get('min_common_tokens', 1)
+        for token in set(tokens):
+            count = self.token_counter[token]
+            if count <= 0:
+                del self.token_counter[token]
+                self.global_tokens.discard(token)
+            elif count >= min_common_tokens:
+                self.global_tokens.add(token)
+            else:
+                self.global_tokens.discard(token)
+
+    def _learn(self, file_info: FileInfo) -> None:
+        self.files[file_info.path] = file_info
+        self.token_counter.update(file_info.tokens)
+        self._update_global(file_info.tokens)
+        key = self._pair_key(file_info)
+
+        if file_info.file_type == FileType.VIDEO:
+            self._videos_by_key[key].add(file_info.path)
+            if key not in self._subtitles_by_key:
+                self.unpaired_videos.add(file_info.path)
+            # 新视频使其同名字幕变为已配对
+            for subtitle_path in self._subtitles_by_key.get(key, ()):
+                self.candidate_index.discard(subtitle_path)
+        else:
+            if key not in self._subtitles_by_key:
+                self.unpaired_videos.difference_update(self._videos_by_key.get(key, ()))
+            self._subtitles_by_key[key].add(file_info.path)
+            if key not in self._videos_by_key:
+                self.candidate_index.add(file_info)
+
+    def _forget(self, path: Path) -> None:
+        file_info = self.files.pop(path, None)
+        if file_info is None:
+            return
+        self.token_counter.subtract(file_info.tokens)
+        self._update_global(file_info.tokens)
+        key = self._pair_key(file_info)
+
+        if file_info.file_type == FileType.VIDEO:
+            self.unpaired_videos.discard(path)
+            self._drop_key(self._videos_by_key, key, path)
+            if key not in self._videos_by_key:
+                for subtitle_path in self._subtitles_by_key.get(key, ()):
+                    self.candidate_index.add(self.files[subtitle_path])
+            # 演习模式中分给它的字幕重新成为候选
+            subtitle_path = self._planned.pop(path, None)
+            if subtitle_path is not None:
+                del self._planned_videos[subtitle_path]
+                subtitle = self.files.get(subtitle_path)
+                if subtitle is not None and self._pair_key(subtitle) not in self._videos_by_key:
+                    self.candidate_index.add(subtitle)
+        else:
+            self.candidate_index.discard(path)
+            self._drop_key(self._subtitles_by_key, key, path)
+            if key not in self._subtitles_by_key:
+                self.unpaired_videos.update(self._videos_by_key.get(key, ()))
+            # 演习模式中分到它的视频重新变为未配对
+            video_path = self._planned_videos.pop(path, None)
+            if video_path is not None:
+                del self._planned[video_path]
+                video = self.files.get(video_path)
+                if video is not None and self._pair_key(video) not in self._subtitles_by_key:
+                    self.unpaired_videos.add(video_path)
+
+    @staticmethod
+    def _drop_key(mapping: Dict[Tuple[Path, str], Set[Path]], key: Tuple[Path, str],
+                  path: Path) -> None:
+        paths = mapping.get(key)
+        if paths is not None:
+            paths.discard(path)
+            if not paths:
+                del mapping[key]
+
+    def resync(self) -> List[MatchResult]:
+        """全量扫描一次并处理所有未配对的文件（启动时或事件丢失后）"""
+        video_files, subtitle_files = self.submatcher.file_scanner.scan_directory(self.directory)
+        self.files.clear()
+        self.token_counter.clear()
+        self.global_tokens.clear()
+        self.candidate_index = CandidateIndex([], self.global_tokens)
+        self.unpaired_videos.clear()
+        self._videos_by_key.clear()
+        self._subtitles_by_key.clear()
+        self._planned.clear()
+        self._planned_videos.clear()
+        for file_info in video_files + subtitle_files:
+            self._learn(file_info)
+        return self._match(list(self.unpaired_videos), subtitle_files)
+
+    def apply(self, paths: Iterable[str]) -> List[MatchResult]:
+        """应用一批变化的路径，仅对受影响的文件匹配"""
+        changed_videos = []
+        changed_subtitles = []
+        for raw_path in sorted(paths):
+            path = Path(raw_path)
+            self._forget(path)
+            if not path.is_file():
+                continue
+            if path.suffix.lower() in self.video_extensions:
+                file_info = self.submatcher.file_scanner._create_file_info(path, FileType.VIDEO)
+                changed_videos.append(path)
+            else:
+                file_info = self.submatcher.file_scanner._create_file_info(path, FileType.SUBTITLE)
+                changed_subtitles.append(file_info)
+            self._learn(file_info)
+        self.batches += 1
+        return self._match(changed_videos, changed_subtitles)
+
+    def _match(self, changed_videos: List[Path],
+               changed_subtitles: List[FileInfo]) -> List[MatchResult]:
+        new_tokens = set()
+        new_episodes = set()
+        for subtitle in changed_subtitles:
+            if subtitle.path in self.candidate_index:
+                new_tokens.update(subtitle.tokens)
+                new_episodes.add(subtitle.episode)
+        new_tokens &= self.global_tokens
+
+        # 受影响的视频：新出现的未配对视频，或与新字幕共享全局 Token / 集数的未配对视频
+        changed = set(changed_videos)
+        affected = []
+        for path in self.unpaired_videos:
+            video = self.files[path]
+            if (path in changed or (video.episode is not None and video.episode in new_episodes)
+                    or not new_tokens.isdisjoint(video.tokens)):
+                affected.append(video)
+        if not affected:
+            return []
+        affected.sort(key=lambda video: str(video.path))
+
+        results = self.submatcher.matcher.assign_indexed(affected, self.candidate_index,
+                                                         self.global_tokens)
+        events = self.submatcher.engine.rename(results, dry_run=self.dry_run,
+                                               journal_group=self.journal_group)
+        outcome = drain(events, self.sink).outcome
+        for match_result in results:
+            success = outcome.succeeded(str(match_result.subtitle.path))
+            if success:
+                self.candidate_index.remove(match_result.subtitle)
+                if self.dry_run:
+                    video_path = match_result.video.path
+                    self.unpaired_videos.discard(video_path)
+                    self._planned[video_path] = match_result.subtitle.path
+                    self._planned_videos[match_result.subtitle.path] = video_path
+                else:
+                    subtitle = match_result.subtitle
+                    renamed = subtitle.path.parent / (match_result.video.stem + subtitle.extension)
+                    self._forget(subtitle.path)
+                    file_scanner = self.submatcher.file_scanner
+                    self._learn(file_scanner._create_file_info(renamed, FileType.SUBTITLE))
+            self.history.append({
+                'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'video': match_result.video.name,
+                'subtitle': match_result.subtitle.name,
+                'score': match_result.score,
+                'success': success,
+                'dry_run': self.dry_run,
+            })
+            if self.on_result is not None:
+                self.on_result(match_result, success)
+        return results
+
+    def serve(self, stop_event: Optional[threading.Event] = None) -> None:
+        """事件循环：收集事件，静默 debounce 秒或累计 max_delay 秒后处理一批"""
+        pending: Set[str] = set()
+        first_seen = last_seen = 0.0
+        while stop_event is None or not stop_event.is_set():
+            changes = self.watcher.read_changes(self.debounce if pending else 0.5)
+            now = time.monotonic()
+            if changes is None:
+                pending.clear()
+                self.resync()
+                continue
+            if changes:
+                if not pending:
+                    first_seen = now
+                pending |= changes
+                last_seen = now
+            if pending and (now - last_seen >= self.debounce or now - first_seen >= self.max_delay):
+                batch = pending
+                pending = set()
+                self.apply(batch)
+
+    def status(self) -> dict:
+        return {
+            'directory': self.directory,
+            'backend': self.backend_name,
+            'dry_run': self.dry_run,
+            'file_count': len(self.files),
+            'unpaired_videos': len(self.unpaired_videos),
+            'batches': self.batches,
+            'recent': list(self.history),
+        }
+
+    def close(self) -> None:
+        self.watcher.close()
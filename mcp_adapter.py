@@ -5,8 +5,13 @@ MCP Adapter for SubMatcher
 """
 
 import sys
+import json
+import base64
 import logging
-from typing import Dict, List, Optional
+import threading
+from bisect import bisect_right
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from dataclasses import asdict
 from pathlib import Path
 
@@ -14,11 +19,36 @@ BASE_DIR = Path(__file__).parent
 CORE_DIR = BASE_DIR / "core"
 sys.path.insert(0, str(BASE_DIR))
 
-from core.submatcher import SubMatcher, Config, FileInfo, MatchResult
+from core.submatcher import DEFAULT_PLAN_DIR, SubMatcher, Config, FileInfo, MatchResult
+from core.plans import PlanStore, RenamePlan, ScanSnapshot, ScanStore
+from core.engine import UNTIL_MATCH, UNTIL_SCAN, ScanCompleted, drain
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# progress(已完成, 总数或 None, 说明)
+ProgressCallback = Callable[[float, Optional[float], str], None]
+
+SCAN_ORDER = ('video', 'subtitle')
+CURSOR_FIELDS = {'scan': ('scan_id', 'type', 'after'), 'preview': ('plan_id', 'offset')}
+
+
+def encode_cursor(state: Dict) -> str:
+    """将分页状态编码为不透明的游标字符串"""
+    return base64.urlsafe_b64encode(json.dumps(state).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str, kind: str) -> Dict:
+    """解析游标，格式不正确或类型不符时抛出 ValueError"""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if (not isinstance(state, dict) or state.get('kind') != kind
+            or any(field not in state for field in CURSOR_FIELDS[kind])):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return state
+
 
 def file_info_to_dict(file_info: FileInfo) -> Dict:
     """将 FileInfo 对象转换为字典"""
@@ -28,7 +58,7 @@ def file_info_to_dict(file_info: FileInfo) -> Dict:
         'name': file_info.name,
         'stem': file_info.stem,
         'extension': file_info.extension,
-        'tokens': file_info.tokens,
+        'tokens': list(file_info.tokens),
         'season': file_info.season,
         'episode': file_info.episode
     }
@@ -54,22 +84,118 @@ class SubMatcherAdapter:
             config_path = str(BASE_DIR / "core" / "config.yaml")
         self.config_path = config_path
         self.matcher = SubMatcher(config_path)
+        plans_config = self.matcher.config.get_plans_config()
+        self.plans = PlanStore(**plans_config)
+        # 扫描快照保存在计划目录下的 scans 子目录中，数量和有效期与计划相同
+        plans_path = plans_config.get('path', DEFAULT_PLAN_DIR)
+        self.scans = ScanStore(**{**plans_config,
+                                  'path': str(Path(plans_path) / 'scans') if plans_path else None})
+        self.metrics = self.matcher.metrics
+        self.watches: Dict[str, tuple] = {}
+        self._watch_lock = threading.Lock()
         logger.info(f"SubMatcherAdapter initialized with config: {config_path}")
 
-    def scan_directory(self, directory: str) -> Dict:
-        """扫描视频/字幕文件"""
-        logger.info(f"Scanning directory: {directory}")
+    def refresh_config(self) -> None:
+        """配置文件在外部被修改时重新加载；通过 set_config_value 的修改会立即生效"""
+        if self.matcher.config.refresh():
+            logger.info(f"Config reloaded: {self.config_path}")
+
+    def iter_scan_entries(self, video_files: List[FileInfo], subtitle_files: List[FileInfo],
+                          after: Optional[Tuple[str, str]] = None
+                          ) -> Iterator[Tuple[str, FileInfo]]:
+        """按（文件类型，路径）顺序逐个产出文件，从游标 after 之后开始"""
+        groups = (('video', video_files), ('subtitle', subtitle_files))
+        start_group = 0 if after is None else SCAN_ORDER.index(after[0])
+        for index, (file_type, files) in enumerate(groups):
+            if index < start_group:
+                continue
+            start = 0
+            if after is not None and index == start_group:
+                # 扫描结果按路径排序，二分定位游标位置
+                start = bisect_right(files, after[1], key=lambda f: str(f.path))
+            for file_info in files[start:]:
+                yield file_type, file_info
+
+    def iter_matches(self, plan: RenamePlan, offset: int = 0) -> Iterator[Dict]:
+        """从 offset 开始逐个产出计划中的匹配结果，附带备选字幕；margin 为与最接近的备选的分差"""
+        for match_result in plan.matches[offset:]:
+            result = match_result_to_dict(match_result)
+            alternatives = plan.alternatives.get(str(match_result.video.path), [])
+            result['margin'] = alternatives[0]['margin'] if alternatives else None
+            result['alternatives'] = alternatives
+            yield result
+
+    def skipped_alternatives(self, plan: RenamePlan) -> List[Dict]:
+        """未匹配但有候选字幕的视频（多为同分被跳过），附带备选字幕"""
+        matched = {str(match_result.video.path) for match_result in plan.matches}
+        return [{'video': Path(video).name, 'path': video, 'alternatives': alternatives}
+                for video, alternatives in plan.alternatives.items() if video not in matched]
+
+    def scan_directory(self, directory: str, limit: Optional[int] = None,
+                       cursor: Optional[str] = None,
+                       progress: Optional[ProgressCallback] = None) -> Dict:
+        """扫描视频/字幕文件；提供 limit 时分页返回，next_cursor 用于获取下一页
+
+        第一页的扫描结果保存为快照，后续分页通过 cursor 直接读取快照，不会重新扫描；
+        最后一页返回后快照即被删除。
+        """
+        logger.info(f"Scanning directory: {directory}, limit={limit}, cursor={cursor}")
         
         try:
-            video_files, subtitle_files = self.matcher.file_scanner.scan_directory(directory)
+            after = None
+            if cursor:
+                state = decode_cursor(cursor, 'scan')
+                snapshot = self.scans.get(state['scan_id'])
+                self.metrics.cache('scans', int(snapshot is not None), int(snapshot is None))
+                if snapshot is None:
+                    return {
+                        'success': False,
+                        'error': 'Cursor expired, scan again',
+                        'directory': directory
+                    }
+                if snapshot.directory != str(Path(directory).resolve()):
+                    return {
+                        'success': False,
+                        'error': ('Cursor was created for a different directory: '
+                                  f'{snapshot.directory}'),
+                        'directory': directory
+                    }
+                after = (state['type'], state['after'])
+            else:
+                if progress is not None:
+                    def scan_progress(directories: int, entries: int) -> None:
+                        progress(entries, None,
+                                 f"Scanned {directories} directories, {entries} entries")
+                else:
+                    scan_progress = None
+                self.refresh_config()
+                scanned = drain(self.matcher.engine.run(directory, until=UNTIL_SCAN,
+                                                        scan_progress=scan_progress))
+                snapshot = ScanSnapshot.build(directory, scanned.videos, scanned.subtitles,
+                                              scanned.scan_stats)
+            video_files, subtitle_files = snapshot.videos, snapshot.subtitles
+            
+            entries = self.iter_scan_entries(video_files, subtitle_files, after)
+            page = list(islice(entries, limit)) if limit else list(entries)
+            next_cursor = None
+            if page and next(entries, None) is not None:
+                if cursor is None:
+                    self.scans.put(snapshot)
+                last_type, last_file = page[-1]
+                next_cursor = encode_cursor({'kind': 'scan', 'scan_id': snapshot.plan_id,
+                                             'type': last_type, 'after': str(last_file.path)})
+            elif cursor is not None:
+                self.scans.discard(snapshot.plan_id)
             
             result = {
                 'success': True,
                 'directory': directory,
-                'video_files': [file_info_to_dict(f) for f in video_files],
-                'subtitle_files': [file_info_to_dict(f) for f in subtitle_files],
+                'video_files': [file_info_to_dict(f) for t, f in page if t == 'video'],
+                'subtitle_files': [file_info_to_dict(f) for t, f in page if t == 'subtitle'],
                 'video_count': len(video_files),
-                'subtitle_count': len(subtitle_files)
+                'subtitle_count': len(subtitle_files),
+                'scan_stats': snapshot.scan_stats,
+                'next_cursor': next_cursor
             }
             
             logger.info(f"Found {len(video_files)} video files and {len(subtitle_files)} subtitle files")
@@ -83,82 +209,191 @@ class SubMatcherAdapter:
                 'directory': directory
             }
 
-    def analyze_matches(self, directory: str) -> List[Dict]:
-        """分析匹配（演习模式）"""
-        logger.info(f"Analyzing matches for directory: {directory}")
+    def _build_plan(self, directory: str, progress: Optional[ProgressCallback] = None,
+                    alternatives: bool = False) -> Optional[RenamePlan]:
+        """扫描并匹配目录，生成重命名计划；没有视频或字幕时返回 None
+
+        alternatives 为 True（预览）时在分配过程中顺便收集备选字幕，直接执行时不收集
+        """
+        if progress is not None:
+            def scan_progress(directories: int, entries: int) -> None:
+                progress(0, 2, f"Scanned {directories} directories, {entries} entries")
+        else:
+            scan_progress = None
+        self.refresh_config()
+
+        def on_event(event) -> None:
+            if (isinstance(event, ScanCompleted) and event.videos and event.subtitles
+                    and progress is not None):
+                progress(1, 2, f"Matching {len(event.videos)} videos against "
+                               f"{len(event.subtitles)} subtitles")
+
+        events = self.matcher.engine.run(directory, until=UNTIL_MATCH, scan_progress=scan_progress,
+                                         alternatives=alternatives)
+        result = drain(events, on_event)
+        if not result.videos or not result.subtitles:
+            return None
+
+        with self.metrics.stage('plan.build') as record:
+            plan = RenamePlan.build(directory, result.matches, result.unmatched,
+                                    result.alternatives)
+            record.count('entries', len(plan.entries))
+        if progress is not None:
+            progress(2, 2, f"Found {len(plan.entries)} matches")
+        return plan
+
+    def analyze_matches(self, directory: str, limit: Optional[int] = None,
+                        cursor: Optional[str] = None,
+                        progress: Optional[ProgressCallback] = None) -> Dict:
+        """分析匹配（演习模式），返回可供 execute_rename 直接应用的计划 ID
+
+        后续分页通过 cursor 直接读取已保存的计划，不会重新扫描和匹配。
+        """
+        logger.info(f"Analyzing matches for directory: {directory}, limit={limit}, cursor={cursor}")
         
         try:
-            video_files, subtitle_files = self.matcher.file_scanner.scan_directory(directory)
+            offset = 0
+            if cursor:
+                state = decode_cursor(cursor, 'preview')
+                plan = self.plans.get(state['plan_id'])
+                self.metrics.cache('plans', int(plan is not None), int(plan is None))
+                if plan is None:
+                    return {
+                        'success': False,
+                        'error': 'Cursor expired, run preview again',
+                        'directory': directory
+                    }
+                if plan.directory != str(Path(directory).resolve()):
+                    return {
+                        'success': False,
+                        'error': f'Cursor was created for a different directory: {plan.directory}',
+                        'directory': directory
+                    }
+                offset = state['offset']
+            else:
+                plan = self._build_plan(directory, progress, alternatives=True)
             
-            if not video_files or not subtitle_files:
-                logger.warning("No video or subtitle files found")
-                return []
+                if plan is None:
+                    logger.warning("No video or subtitle files found")
+                    return {
+                        'success': True,
+                        'directory': directory,
+                        'plan_id': None,
+                        'match_count': 0,
+                        'matches': [],
+                        'next_cursor': None
+                    }
             
-            all_files = video_files + subtitle_files
-            global_tokens, token_counter = self.matcher.cluster_analyzer.analyze(all_files)
+                self.plans.put(plan)
             
-            matches = []
-            for video in video_files:
-                match_result = self.matcher.matcher.find_best_match(video, subtitle_files, global_tokens)
-                if match_result:
-                    matches.append(match_result_to_dict(match_result))
-                    subtitle_files.remove(match_result.subtitle)
+            matches = self.iter_matches(plan, offset)
+            page = list(islice(matches, limit)) if limit else list(matches)
+            next_cursor = None
+            if page and next(matches, None) is not None:
+                next_cursor = encode_cursor({'kind': 'preview', 'plan_id': plan.plan_id,
+                                             'offset': offset + len(page)})
             
-            logger.info(f"Found {len(matches)} matches")
-            return matches
+            logger.info(f"Found {len(plan.entries)} matches, plan {plan.plan_id}")
+            result = {
+                'success': True,
+                'directory': directory,
+                'plan_id': plan.plan_id,
+                'match_count': len(plan.entries),
+                'matches': page,
+                'next_cursor': next_cursor
+            }
+            # 未匹配视频的备选只在第一页返回
+            if offset == 0:
+                result['skipped_alternatives'] = self.skipped_alternatives(plan)
+            return result
             
         except Exception as e:
             logger.error(f"Error analyzing matches: {e}")
-            return []
+            return {
+                'success': False,
+                'error': str(e),
+                'directory': directory
+            }
 
-    def execute_rename(self, directory: str, dry_run: bool = True) -> Dict:
-        """执行重命名"""
-        logger.info(f"Executing rename for directory: {directory}, dry_run={dry_run}")
+    def execute_rename(self, directory: str, dry_run: bool = True,
+                       plan_id: Optional[str] = None) -> Dict:
+        """执行重命名；提供 plan_id 时校验文件指纹后直接应用预览过的计划"""
+        logger.info(f"Executing rename for directory: {directory}, dry_run={dry_run}, "
+                    f"plan_id={plan_id}")
         
         try:
-            video_files, subtitle_files = self.matcher.file_scanner.scan_directory(directory)
-            
-            if not video_files or not subtitle_files:
-                return {
-                    'success': False,
-                    'error': 'No video or subtitle files found',
-                    'directory': directory
-                }
-            
-            all_files = video_files + subtitle_files
-            global_tokens, token_counter = self.matcher.cluster_analyzer.analyze(all_files)
+            if plan_id:
+                plan = self.plans.get(plan_id)
+                self.metrics.cache('plans', int(plan is not None), int(plan is None))
+                if plan is None:
+                    return {
+                        'success': False,
+                        'error': 'Plan not found or expired, run preview again',
+                        'directory': directory,
+                        'plan_id': plan_id
+                    }
+                if plan.directory != str(Path(directory).resolve()):
+                    return {
+                        'success': False,
+                        'error': f'Plan was created for a different directory: {plan.directory}',
+                        'directory': directory,
+                        'plan_id': plan_id
+                    }
+                with self.metrics.stage('plan.verify') as record:
+                    changed_files = plan.changed_files()
+                    record.count('files', 2 * len(plan.entries))
+                if changed_files:
+                    logger.warning(f"Plan {plan_id} is stale: {len(changed_files)} files changed")
+                    return {
+                        'success': False,
+                        'error': 'Files changed since preview, run preview again',
+                        'directory': directory,
+                        'plan_id': plan_id,
+                        'changed_files': changed_files
+                    }
+            else:
+                plan = self._build_plan(directory)
+                if plan is None:
+                    return {
+                        'success': False,
+                        'error': 'No video or subtitle files found',
+                        'directory': directory
+                    }
             
             renamed_files = []
             failed_files = []
-            skipped_files = []
             
-            for video in video_files:
-                match_result = self.matcher.matcher.find_best_match(video, subtitle_files, global_tokens)
-                if match_result:
-                    success = self.matcher.renamer.rename(match_result, dry_run=dry_run)
-                    if success:
-                        renamed_files.append({
-                            'old_name': match_result.subtitle.name,
-                            'new_name': f"{match_result.video.stem}{match_result.subtitle.extension}",
-                            'video_name': match_result.video.name,
-                            'score': match_result.score
-                        })
-                        subtitle_files.remove(match_result.subtitle)
-                    else:
-                        failed_files.append(match_result.subtitle.name)
+            # 整批作为一次事务重命名，写入可用于撤销的重命名日志
+            outcome = drain(self.matcher.engine.rename(plan.matches, dry_run=dry_run)).outcome
+            for match_result in plan.matches:
+                if outcome.succeeded(str(match_result.subtitle.path)):
+                    renamed_files.append({
+                        'old_name': match_result.subtitle.name,
+                        'new_name': f"{match_result.video.stem}{match_result.subtitle.extension}",
+                        'video_name': match_result.video.name,
+                        'score': match_result.score
+                    })
                 else:
-                    skipped_files.append(video.name)
+                    failed_files.append(match_result.subtitle.name)
+            skipped_files = plan.skipped
+            
+            # 实际执行后文件已变化，计划不可再次使用
+            if plan_id and not dry_run:
+                self.plans.discard(plan_id)
             
             result = {
                 'success': True,
                 'directory': directory,
                 'dry_run': dry_run,
+                'plan_id': plan_id,
                 'renamed_count': len(renamed_files),
                 'failed_count': len(failed_files),
                 'skipped_count': len(skipped_files),
                 'renamed_files': renamed_files,
                 'failed_files': failed_files,
-                'skipped_files': skipped_files
+                'skipped_files': skipped_files,
+                'errors': {Path(source).name: error for source, error in outcome.errors.items()},
+                'journal': outcome.journal
             }
             
             logger.info(f"Rename completed: {len(renamed_files)} renamed, {len(failed_files)} failed, {len(skipped_files)} skipped")
@@ -171,3 +406,102 @@ class SubMatcherAdapter:
                 'error': str(e),
                 'directory': directory
             }
+
+    def execute_rename_batch(self, directories: List[str], dry_run: bool = True,
+                             split: Optional[bool] = None) -> Dict:
+        """在进程池中批量处理多个目录，返回汇总报告"""
+        from core.batch import run_batch
+
+        batch_config = self.matcher.config.get_batch_config()
+        if split is None:
+            split = batch_config.get('split_roots', False)
+        logger.info(f"Executing batch rename for {len(directories)} directories, "
+                    f"dry_run={dry_run}, split={split}")
+
+        try:
+            result = run_batch(self.config_path, directories, dry_run=dry_run,
+                               max_workers=batch_config.get('max_workers') or None,
+                               split_roots=split)
+            logger.info(f"Batch completed in {result['elapsed']:.2f}s: "
+                        f"{result['renamed_count']} renamed, {result['failed_count']} failed, "
+                        f"{result['error_count']} directories with errors")
+            return result
+
+        except Exception as e:
+            logger.error(f"Error executing batch rename: {e}")
+            return {
+                'success': False,
+                'error': str(e),
+                'directories': directories
+            }
+
+    def start_watch(self, directory: str, dry_run: bool = True) -> Dict:
+        """启动目录监视，新增字幕会被增量匹配"""
+        from core.watcher import WatchSession
+
+        logger.info(f"Starting watch for directory: {directory}, dry_run={dry_run}")
+        self.refresh_config()
+        key = str(Path(directory).resolve())
+
+        try:
+            with self._watch_lock:
+                if key in self.watches:
+                    return {
+                        'success': False,
+                        'error': 'Directory is already being watched',
+                        'directory': directory
+                    }
+
+                def on_result(match_result: MatchResult, success: bool):
+                    logger.info(f"Watch matched {match_result.subtitle.name} -> "
+                                f"{match_result.video.stem}{match_result.subtitle.extension} "
+                                f"(success={success})")
+
+                session = WatchSession(self.matcher, key, dry_run=dry_run, on_result=on_result,
+                                       quiet=True)
+                stop_event = threading.Event()
+                thread = threading.Thread(target=session.serve, args=(stop_event,),
+                                          name=f"watch:{key}", daemon=True)
+                thread.start()
+                self.watches[key] = (session, stop_event, thread)
+
+            return {'success': True, **session.status()}
+
+        except Exception as e:
+            logger.error(f"Error starting watch: {e}")
+            return {
+                'success': False,
+                'error': str(e),
+                'directory': directory
+            }
+
+    def stop_watch(self, directory: str) -> Dict:
+        """停止目录监视"""
+        key = str(Path(directory).resolve())
+        with self._watch_lock:
+            entry = self.watches.pop(key, None)
+        if entry is None:
+            return {
+                'success': False,
+                'error': 'Directory is not being watched',
+                'directory': directory
+            }
+
+        session, stop_event, thread = entry
+        stop_event.set()
+        thread.join(timeout=5)
+        session.close()
+        logger.info(f"Stopped watch for directory: {key}")
+        return {'success': True, **session.status()}
+
+    def get_metrics(self, reset: bool = False) -> Dict:
+        """返回运行指标；reset 为 True 时返回后清零"""
+        snapshot = self.metrics.snapshot()
+        if reset:
+            self.metrics.reset()
+        return {'success': True, **snapshot}
+
+    def list_watches(self) -> List[Dict]:
+        """列出正在运行的目录监视"""
+        with self._watch_lock:
+            return [session.status() for session, _, _ in self.watches.values()]
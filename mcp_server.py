@@ -13,9 +13,16 @@ MCP Server for SubMatcher
 """
 
 import sys
+import json
+import time
+import asyncio
 import logging
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Any
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
 BASE_DIR = Path(__file__).parent
 sys.path.insert(0, str(BASE_DIR))
@@ -24,16 +31,183 @@ from mcp.server import Server
 from mcp.server.stdio import stdio_server
 from mcp.types import Tool, TextContent
 
-from mcp_adapter import SubMatcherAdapter
-from config_nlp import ConfigMCPWrapper
-
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 server = Server("mcp-submatcher")
 
-adapter = SubMatcherAdapter()
-config_wrapper = ConfigMCPWrapper()
+CONFIG_PATH = str(BASE_DIR / "core" / "config.yaml")
+
+# 组件在首次调用工具时才创建（连同匹配器、配置管理的导入），握手前不解析配置、不写任何文件
+_adapter = None
+_config_wrapper = None
+_executor = None
+_init_lock = threading.Lock()
+
+
+def get_adapter():
+    global _adapter
+    if _adapter is None:
+        with _init_lock:
+            if _adapter is None:
+                from mcp_adapter import SubMatcherAdapter
+                _adapter = SubMatcherAdapter(CONFIG_PATH)
+    return _adapter
+
+
+def get_config_wrapper():
+    global _config_wrapper
+    if _config_wrapper is None:
+        with _init_lock:
+            if _config_wrapper is None:
+                from config_nlp import ConfigMCPWrapper
+                _config_wrapper = ConfigMCPWrapper(CONFIG_PATH)
+    return _config_wrapper
+
+
+def get_executor() -> 'ToolExecutor':
+    global _executor
+    if _executor is None:
+        with _init_lock:
+            if _executor is None:
+                # 只读取 server 段，配置类工具不必构建整个匹配器
+                from core.submatcher import Config
+                _executor = ToolExecutor(Config(CONFIG_PATH).get_server_config())
+    return _executor
+
+
+def _init_worker(config_path: str) -> None:
+    """进程池工作进程初始化：stdout 是 MCP 协议通道，任何输出都改写到 stderr"""
+    global CONFIG_PATH
+    sys.stdout = sys.stderr
+    CONFIG_PATH = config_path
+
+
+def _adapter_call(method: str, *args, **kwargs):
+    """在工作线程/进程中执行适配器方法（进程池中使用子进程自己的 adapter）"""
+    return getattr(get_adapter(), method)(*args, **kwargs)
+
+
+class ToolExecutor:
+    """将阻塞的扫描/匹配/重命名工作移出事件循环，并按目录限制并发"""
+
+    def __init__(self, server_config: Dict):
+        self.kind = server_config.get('executor', 'thread')
+        self.max_workers = server_config.get('max_workers', 4)
+        self.per_directory_limit = server_config.get('per_directory_limit', 1)
+        # 0 或空值表示不限制
+        self.timeout = server_config.get('tool_timeout', 600) or None
+        self.page_size = server_config.get('page_size', 200)
+        self.progress_interval = server_config.get('progress_interval', 0.5)
+        if self.kind == 'process':
+            # 与 batch 相同：服务器进程中有其他线程，使用 spawn 避免 fork 继承被占用的锁
+            self.pool: Executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker, initargs=(CONFIG_PATH,))
+        else:
+            self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tool")
+        # 配置读写等轻量操作始终在线程中执行，不占用进程池
+        self.light_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="config")
+        self.batch_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch")
+        # 目录 -> [信号量, 使用者数]；没有任务占用或排队时删除，字典不会随访问过的目录增长
+        self._directory_limits: Dict[str, list] = {}
+
+    async def _acquire(self, keys: List[str]) -> None:
+        """按给定顺序占用各目录的名额；等待中被取消时归还已占用的名额"""
+        held = []
+        try:
+            for key in keys:
+                limit = self._directory_limits.get(key)
+                if limit is None:
+                    limit = self._directory_limits[key] = [
+                        asyncio.Semaphore(self.per_directory_limit), 0
+                    ]
+                limit[1] += 1
+                try:
+                    await limit[0].acquire()
+                except BaseException:
+                    self._release_key(key, held=False)
+                    raise
+                held.append(key)
+        except BaseException:
+            self._release(held)
+            raise
+
+    def _release_key(self, key: str, held: bool = True) -> None:
+        limit = self._directory_limits[key]
+        if held:
+            limit[0].release()
+        limit[1] -= 1
+        if limit[1] == 0:
+            del self._directory_limits[key]
+
+    def _release(self, keys: List[str]) -> None:
+        for key in keys:
+            self._release_key(key)
+
+    async def _run_holding(self, keys: List[str], pool: Executor, func: Callable, *args) -> Any:
+        """占用目录名额后把 func 提交到 pool，直到工作线程/进程真正结束才归还名额
+
+        超时只是不再等待结果：已开始的任务无法中断，仍会继续操作目录，
+        因此名额在执行器 future 的完成回调中释放，而不是在 wait_for 返回时。
+        """
+        loop = asyncio.get_running_loop()
+        await self._acquire(keys)
+        try:
+            future = pool.submit(func, *args)
+        except BaseException:
+            self._release(keys)
+            raise
+
+        def release(_) -> None:
+            try:
+                loop.call_soon_threadsafe(self._release, keys)
+            except RuntimeError:
+                pass  # 事件循环已关闭
+
+        future.add_done_callback(release)
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+
+    def _progress_reporter(self, loop: asyncio.AbstractEventLoop,
+                           send: Callable[[float, Optional[float], str], Awaitable[None]]
+                           ) -> Callable:
+        """把工作线程中的进度回调转发为事件循环中的通知，并按 progress_interval 限频"""
+        last_sent = [0.0]
+
+        def report(done: float, total: Optional[float], message: str) -> None:
+            now = time.monotonic()
+            if total is None or done < total:
+                if now - last_sent[0] < self.progress_interval:
+                    return
+            last_sent[0] = now
+            asyncio.run_coroutine_threadsafe(send(done, total, message), loop)
+
+        return report
+
+    async def run_directory_task(self, directory: str, method: str, *args,
+                                 progress: Optional[Callable] = None, **kwargs) -> Any:
+        """执行针对某个目录的适配器方法；同一目录的调用排队，不同目录并行
+
+        progress 为协程函数 (done, total, message)，只在线程池模式下转发，
+        进程池中的回调无法跨进程传递。
+        """
+        loop = asyncio.get_running_loop()
+        if progress is not None and isinstance(self.pool, ThreadPoolExecutor):
+            kwargs['progress'] = self._progress_reporter(loop, progress)
+        call = functools.partial(_adapter_call, method, directory, *args, **kwargs)
+        return await self._run_holding([str(Path(directory).resolve())], self.pool, call)
+
+    async def run_batch_task(self, directories: List[str], method: str, *args) -> Any:
+        """执行多目录批处理；批处理自带进程池，这里只占用一个线程，并按固定顺序锁定所有目录"""
+        keys = sorted({str(Path(directory).resolve()) for directory in directories})
+        return await self._run_holding(keys, self.batch_pool,
+                                       _adapter_call, method, directories, *args)
+
+    async def run_light(self, func: Callable, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(self.light_pool, func, *args),
+                                      timeout=self.timeout)
+
 
 
 @server.list_tools()
@@ -42,13 +216,22 @@ async def list_tools() -> list[Tool]:
     return [
         Tool(
             name="scan_media_files",
-            description="扫描指定目录中的视频和字幕文件",
+            description="扫描指定目录中的视频和字幕文件（分页返回）",
             inputSchema={
                 "type": "object",
                 "properties": {
                     "directory": {
                         "type": "string",
                         "description": "要扫描的目录路径"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "minimum": 1,
+                        "description": "每页返回的条目数（默认使用 server.page_size）"
+                    },
+                    "cursor": {
+                        "type": "string",
+                        "description": "上一页返回的 next_cursor，用于获取下一页"
                     }
                 },
                 "required": ["directory"]
@@ -56,13 +239,22 @@ async def list_tools() -> list[Tool]:
         ),
         Tool(
             name="preview_matching",
-            description="预览字幕匹配结果（演习模式，不会实际修改文件）",
+            description="预览字幕匹配结果（演习模式，不会实际修改文件），附带备选字幕与分差，返回可供 rename_subtitles 使用的计划 ID",
             inputSchema={
                 "type": "object",
                 "properties": {
                     "directory": {
                         "type": "string",
                         "description": "要分析的目录路径"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "minimum": 1,
+                        "description": "每页返回的条目数（默认使用 server.page_size）"
+                    },
+                    "cursor": {
+                        "type": "string",
+                        "description": "上一页返回的 next_cursor，用于获取下一页"
                     }
                 },
                 "required": ["directory"]
@@ -82,11 +274,94 @@ async def list_tools() -> list[Tool]:
                         "type": "boolean",
                         "description": "是否确认执行实际重命名（默认为 false，仅演习模式）",
                         "default": False
+                    },
+                    "plan_id": {
+                        "type": "string",
+                        "description": "preview_matching 返回的计划 ID；提供时直接应用预览过的计划，不再重新匹配"
                     }
                 },
                 "required": ["directory"]
             }
         ),
+        Tool(
+            name="rename_subtitles_batch",
+            description="批量处理多个相互独立的目录（多进程并行），返回汇总报告",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "directories": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "要处理的目录路径列表"
+                    },
+                    "confirm": {
+                        "type": "boolean",
+                        "description": "是否确认执行实际重命名（默认为 false，仅演习模式）",
+                        "default": False
+                    },
+                    "split": {
+                        "type": "boolean",
+                        "description": "是否将每个目录按子目录（剧集）拆分后并行处理（默认使用 batch.split_roots）"
+                    }
+                },
+                "required": ["directories"]
+            }
+        ),
+        Tool(
+            name="start_watch",
+            description="持续监视目录，新下载的字幕会被自动匹配（默认为演习模式）",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "directory": {
+                        "type": "string",
+                        "description": "要监视的目录路径"
+                    },
+                    "confirm": {
+                        "type": "boolean",
+                        "description": "是否确认执行实际重命名（默认为 false，仅演习模式）",
+                        "default": False
+                    }
+                },
+                "required": ["directory"]
+            }
+        ),
+        Tool(
+            name="stop_watch",
+            description="停止监视指定目录",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "directory": {
+                        "type": "string",
+                        "description": "正在监视的目录路径"
+                    }
+                },
+                "required": ["directory"]
+            }
+        ),
+        Tool(
+            name="list_watches",
+            description="列出正在运行的目录监视及最近的匹配记录",
+            inputSchema={
+                "type": "object",
+                "properties": {}
+            }
+        ),
+        Tool(
+            name="get_metrics",
+            description="获取运行指标：各阶段（扫描、解析、聚类、评分、分配、重命名）及各工具的耗时和处理数量、缓存命中率、峰值内存",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "reset": {
+                        "type": "boolean",
+                        "description": "返回后清零统计（默认为 false）",
+                        "default": False
+                    }
+                }
+            }
+        ),
         Tool(
             name="get_config_value",
             description="获取配置文件中指定路径的值",
@@ -118,6 +393,33 @@ async def list_tools() -> list[Tool]:
                 "required": ["path", "value"]
             }
         ),
+        Tool(
+            name="set_config_values",
+            description="批量设置多个配置值：全部生效或全部不生效，只备份一次并写入一条审计日志",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "changes": {
+                        "type": "array",
+                        "description": "要修改的配置项列表",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "path": {
+                                    "type": "string",
+                                    "description": "配置路径，例如：'language_weights[0].weight'"
+                                },
+                                "value": {
+                                    "description": "要设置的值"
+                                }
+                            },
+                            "required": ["path", "value"]
+                        }
+                    }
+                },
+                "required": ["changes"]
+            }
+        ),
         Tool(
             name="get_config_summary",
             description="获取当前配置摘要",
@@ -129,43 +431,119 @@ async def list_tools() -> list[Tool]:
     ]
 
 
+def _progress_sender() -> Optional[Callable[[float, Optional[float], str], Awaitable[None]]]:
+    """客户端在请求中提供 progressToken 时，返回发送进度通知的协程函数"""
+    try:
+        ctx = server.request_context
+    except LookupError:
+        return None
+    if ctx.meta is None or ctx.meta.progressToken is None:
+        return None
+    token = ctx.meta.progressToken
+
+    async def send(done: float, total: Optional[float], message: str) -> None:
+        try:
+            await ctx.session.send_progress_notification(token, done, total, message=message)
+        except Exception as e:
+            logger.warning(f"Failed to send progress notification: {e}")
+
+    return send
+
+
+def _json_content(result: Any) -> list[TextContent]:
+    """工具结果统一序列化为 JSON，客户端可以直接解析"""
+    return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False))]
+
+
 @server.call_tool()
 async def call_tool(name: str, arguments: Any) -> list[TextContent]:
     """调用 MCP 工具"""
     logger.info(f"Tool called: {name} with arguments: {arguments}")
+    started = time.perf_counter()
     
     try:
+        executor = get_executor()
         if name == "scan_media_files":
-            result = adapter.scan_directory(arguments["directory"])
-            return [TextContent(type="text", text=str(result))]
+            result = await executor.run_directory_task(
+                arguments["directory"], "scan_directory",
+                arguments.get("limit", executor.page_size), arguments.get("cursor"),
+                progress=_progress_sender())
+            return _json_content(result)
         
         elif name == "preview_matching":
-            result = adapter.analyze_matches(arguments["directory"])
-            return [TextContent(type="text", text=str(result))]
+            result = await executor.run_directory_task(
+                arguments["directory"], "analyze_matches",
+                arguments.get("limit", executor.page_size), arguments.get("cursor"),
+                progress=_progress_sender())
+            return _json_content(result)
         
         elif name == "rename_subtitles":
             confirm = arguments.get("confirm", False)
-            result = adapter.execute_rename(arguments["directory"], dry_run=not confirm)
-            return [TextContent(type="text", text=str(result))]
+            result = await executor.run_directory_task(arguments["directory"], "execute_rename",
+                                                       not confirm, arguments.get("plan_id"))
+            return _json_content(result)
+        
+        elif name == "rename_subtitles_batch":
+            confirm = arguments.get("confirm", False)
+            result = await executor.run_batch_task(arguments["directories"], "execute_rename_batch",
+                                                   not confirm, arguments.get("split"))
+            return _json_content(result)
+        
+        # 监视会话保存在本进程中，始终使用线程执行
+        elif name == "start_watch":
+            confirm = arguments.get("confirm", False)
+            result = await executor.run_light(get_adapter().start_watch, arguments["directory"],
+                                              not confirm)
+            return _json_content(result)
+        
+        elif name == "stop_watch":
+            result = await executor.run_light(get_adapter().stop_watch, arguments["directory"])
+            return _json_content(result)
+        
+        elif name == "list_watches":
+            result = get_adapter().list_watches()
+            return _json_content(result)
+        
+        elif name == "get_metrics":
+            result = get_adapter().get_metrics(arguments.get("reset", False))
+            return _json_content(result)
         
         elif name == "get_config_value":
-            result = config_wrapper.get_config_value(arguments["path"])
-            return [TextContent(type="text", text=str(result))]
+            result = await executor.run_light(get_config_wrapper().get_config_value,
+                                              arguments["path"])
+            return _json_content(result)
         
         elif name == "set_config_value":
-            result = config_wrapper.set_config_value(arguments["path"], arguments["value"])
-            return [TextContent(type="text", text=str(result))]
+            result = await executor.run_light(get_config_wrapper().set_config_value,
+                                              arguments["path"], arguments["value"])
+            return _json_content(result)
+        
+        elif name == "set_config_values":
+            result = await executor.run_light(get_config_wrapper().set_config_values,
+                                              arguments["changes"])
+            return _json_content(result)
         
         elif name == "get_config_summary":
-            result = config_wrapper.get_config_summary()
-            return [TextContent(type="text", text=str(result))]
+            result = await executor.run_light(get_config_wrapper().get_config_summary)
+            return _json_content(result)
         
         else:
             return [TextContent(type="text", text=f"Unknown tool: {name}")]
     
+    except asyncio.TimeoutError:
+        logger.error(f"Tool {name} timed out after {executor.timeout}s")
+        message = f"Error: tool {name} timed out after {executor.timeout}s"
+        return [TextContent(type="text", text=message)]
+    
     except Exception as e:
         logger.error(f"Error calling tool {name}: {e}")
         return [TextContent(type="text", text=f"Error: {str(e)}")]
+    
+    finally:
+        # 工具级耗时（含排队等待）；进程池模式下各阶段的指标记录在工作进程中。
+        # 只调用过配置类工具时不为记录耗时而创建匹配器
+        if _adapter is not None:
+            _adapter.metrics.record(f"tool.{name}", time.perf_counter() - started)
 
 
 async def main():
@@ -0,0 +1,93 @@
+import random
+import sys
+from pathlib import Path
+
+import pytest
+import yaml
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+# 核心模块按脚本方式导入（与 CLI 一致），适配器与配置管理器从仓库根目录导入
+sys.path.insert(0, str(BASE_DIR))
+sys.path.insert(0, str(BASE_DIR / "core"))
+# 合成媒体库生成器
+sys.path.insert(0, str(BASE_DIR / "benchmarks"))
+
+DEFAULT_CONFIG = BASE_DIR / "core" / "config.yaml"
+
+
+@pytest.fixture
+def make_config(tmp_path):
+    """以仓库默认配置为基础写出临时配置文件，返回其路径
+
+    关键字参数按配置节覆盖，如 make_config(matching={'partition': 'show'})；
+    字典按键合并，列表等其他值（如 episode_patterns）整体替换。
+    扫描缓存默认关闭，缓存、计划、备份与重命名日志都放在 tmp_path 下。
+    每次调用写入新文件，同一测试中的多个配置互不影响。
+    """
+    written = []
+
+    def factory(**sections):
+        with open(DEFAULT_CONFIG, 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f)
+        defaults = {
+            'scan_cache': {'enabled': False, 'path': str(tmp_path / "scan_cache.db")},
+            'plans': {'path': str(tmp_path / "plans")},
+            'safety': {'backup_dir': str(tmp_path / "backups"),
+                       'journal_dir': str(tmp_path / "journals")},
+        }
+        for section, values in list(defaults.items()) + list(sections.items()):
+            if isinstance(values, dict):
+                config.setdefault(section, {}).update(values)
+            else:
+                config[section] = values
+        config_path = tmp_path / f"config-{len(written)}.yaml"
+        with open(config_path, 'w', encoding='utf-8') as f:
+            yaml.safe_dump(config, f, allow_unicode=True)
+        written.append(config_path)
+        return str(config_path)
+
+    return factory
+
+
+@pytest.fixture
+def make_submatcher(make_config):
+    """按 make_config 的覆盖项构建 SubMatcher"""
+    from submatcher import SubMatcher
+
+    def factory(**sections):
+        return SubMatcher(make_config(**sections))
+
+    return factory
+
+
+SHOWS = ['Breaking.Bad', 'The.Office', 'Star.Trek.Picard', 'Dark', 'Fargo', 'Better.Call.Saul']
+TAGS = ['1080p.WEB-DL.x264-NTB', '720p.HDTV.x264-KILLERS', '2160p.WEBRip.x265-RARBG']
+LANGUAGES = ['chs', 'cht', 'eng', 'chs&eng', '']
+
+
+@pytest.fixture(scope='session')
+def make_library():
+    """按随机种子生成小型媒体库
+
+    每集一个视频；字幕的数量（0-2 个）、命名风格（空格分隔、1x02 编号、
+    缺少剧名）、语言和扩展名随机，覆盖同分、无字幕和多字幕的情况。
+    """
+    def factory(root, seed, seasons=2):
+        rnd = random.Random(seed)
+        root.mkdir(parents=True)
+        for show in SHOWS:
+            tag = rnd.choice(TAGS)
+            for season in range(1, seasons + 1):
+                for episode in range(1, rnd.randint(3, 9)):
+                    code = f"S{season:02d}E{episode:02d}"
+                    (root / f"{show}.{code}.{tag}.mkv").touch()
+                    for _ in range(rnd.randint(0, 2)):
+                        title = show.replace('.', ' ') if rnd.random() < 0.5 else ''
+                        number = code if rnd.random() < 0.7 else f"{season}x{episode:02d}"
+                        language = rnd.choice(LANGUAGES)
+                        name = ' '.join(part for part in (title, number, language) if part)
+                        extension = rnd.choice(['.ass', '.srt'])
+                        (root / f"{name} {rnd.randint(0, 9999)}{extension}").touch()
+        return root
+
+    return factory
@@ -0,0 +1,125 @@
+import itertools
+import random
+
+import pytest
+
+import assignment
+from assignment import ambiguous_lefts, max_weight_matching
+
+
+def brute_force(adjacency, right_count):
+    """枚举每个左侧节点的所有选择（含不匹配），返回最大总权重"""
+    best = 0.0
+    choices = [[None] + [v for v, _ in edges] for edges in adjacency]
+    weights = [dict(edges) for edges in adjacency]
+    for combination in itertools.product(*choices):
+        used = [v for v in combination if v is not None]
+        if len(used) != len(set(used)):
+            continue
+        best = max(best, sum(weights[u][v] for u, v in enumerate(combination) if v is not None))
+    return best
+
+
+def random_graph(rnd, left_count, right_count, degree, max_weight):
+    return [sorted((v, float(rnd.randint(1, max_weight)))
+                   for v in rnd.sample(range(right_count), min(degree, right_count)))
+            for _ in range(left_count)]
+
+
+def total_weight(adjacency, matching):
+    weights = [dict(edges) for edges in adjacency]
+    return sum(weights[u][v] for u, v in matching.items())
+
+
+def check_matching(adjacency, right_count, matching):
+    assert len(set(matching.values())) == len(matching)
+    for u, v in matching.items():
+        assert 0 <= v < right_count
+        assert v in dict(adjacency[u])
+
+
+SOLVERS = [pytest.param(assignment._augmenting_path_matching, id='python')]
+if assignment._load_scipy_solver():
+    SOLVERS.append(pytest.param(
+        lambda adjacency, right_count: assignment._scipy_matching(
+            assignment._load_scipy_solver(), adjacency, right_count), id='scipy'))
+
+
+@pytest.mark.parametrize('solve', SOLVERS)
+def test_matches_brute_force_on_small_graphs(solve):
+    rnd = random.Random(2)
+    for _ in range(300):
+        left_count = rnd.randint(1, 6)
+        right_count = rnd.randint(1, 6)
+        # 权重范围小时同分很多，覆盖同分的增广路径
+        adjacency = random_graph(rnd, left_count, right_count, rnd.randint(0, 4),
+                                 rnd.choice([2, 5, 100]))
+        if not any(adjacency):
+            continue
+        matching = solve(adjacency, right_count)
+        check_matching(adjacency, right_count, matching)
+        assert total_weight(adjacency, matching) == brute_force(adjacency, right_count)
+
+
+def test_solvers_agree_on_total_weight():
+    rnd = random.Random(5)
+    adjacency = random_graph(rnd, 400, 300, 12, 20)
+    expected = total_weight(adjacency, assignment._augmenting_path_matching(adjacency, 300))
+    assert total_weight(adjacency, max_weight_matching(adjacency, 300)) == expected
+
+
+def test_empty_graph():
+    assert max_weight_matching([], 3) == {}
+    assert max_weight_matching([[], []], 3) == {}
+
+
+def test_ambiguous_lefts_detects_swappable_ties():
+    # 视频 0、1 对字幕 0、1 同分，互换后总分不变
+    adjacency = [[(0, 10.0), (1, 10.0)], [(0, 10.0), (1, 10.0)], [(2, 5.0)]]
+    matching = max_weight_matching(adjacency, 3)
+    assert ambiguous_lefts(adjacency, matching) == [0, 1]
+
+
+def optimal_matchings(adjacency):
+    """枚举所有最大权匹配"""
+    best, matchings = None, []
+    choices = [[None] + [v for v, _ in edges] for edges in adjacency]
+    weights = [dict(edges) for edges in adjacency]
+    for combination in itertools.product(*choices):
+        used = [v for v in combination if v is not None]
+        if len(used) != len(set(used)):
+            continue
+        total = sum(weights[u][v] for u, v in enumerate(combination) if v is not None)
+        if best is None or total > best:
+            best, matchings = total, []
+        if total == best:
+            matchings.append(combination)
+    return matchings
+
+
+@pytest.mark.parametrize('solve', SOLVERS)
+def test_ambiguous_lefts_detects_rotations(solve):
+    # 三个视频轮换字幕总分不变，不存在可直接互换的两个视频
+    adjacency = [[(0, 10.0), (1, 10.0)], [(1, 10.0), (2, 10.0)], [(2, 10.0), (0, 10.0)]]
+    assert ambiguous_lefts(adjacency, solve(adjacency, 3)) == [0, 1, 2]
+    # 分数不同但互换后总分不变
+    adjacency = [[(0, 10.0), (1, 9.0)], [(1, 8.0), (0, 9.0)]]
+    assert ambiguous_lefts(adjacency, solve(adjacency, 2)) == [0, 1]
+    adjacency = [[(0, 10.0), (1, 5.0)], [(1, 10.0), (0, 5.0)], [(2, 5.0)]]
+    assert ambiguous_lefts(adjacency, solve(adjacency, 3)) == []
+
+
+@pytest.mark.parametrize('solve', SOLVERS)
+def test_ambiguous_lefts_matches_brute_force(solve):
+    rnd = random.Random(11)
+    for _ in range(300):
+        left_count = rnd.randint(1, 5)
+        right_count = rnd.randint(1, 5)
+        adjacency = random_graph(rnd, left_count, right_count, rnd.randint(0, 3),
+                                 rnd.choice([2, 3, 5]))
+        if not any(adjacency):
+            continue
+        matching = solve(adjacency, right_count)
+        expected = sorted(u for u, v in matching.items()
+                          if any(other[u] != v for other in optimal_matchings(adjacency)))
+        assert ambiguous_lefts(adjacency, matching) == expected
@@ -0,0 +1,85 @@
+import pytest
+
+from batch import expand_directories, run_batch
+
+
+def make_show(directory, name, episodes=3):
+    directory.mkdir(parents=True, exist_ok=True)
+    for episode in range(1, episodes + 1):
+        (directory / f"{name}.S01E{episode:02d}.1080p.mkv").touch()
+        (directory / f"{name} S01E{episode:02d} chs.ass").touch()
+
+
+def test_expand_removes_duplicates_and_nested(tmp_path):
+    (tmp_path / "a" / "inner").mkdir(parents=True)
+    (tmp_path / "b").mkdir()
+    directories = [str(tmp_path / "b"), str(tmp_path / "a" / "inner"), str(tmp_path / "a"),
+                   str(tmp_path / "b" / ".." / "b")]
+    assert expand_directories(directories) == [str(tmp_path / "a"), str(tmp_path / "b")]
+    with pytest.raises(ValueError):
+        expand_directories([str(tmp_path / "missing")])
+
+
+def test_expand_splits_roots_into_subdirectories(tmp_path):
+    make_show(tmp_path / "library" / "Show A", "Show.A")
+    make_show(tmp_path / "library" / "Show B", "Show.B")
+    single = tmp_path / "single"
+    make_show(single, "Show.C")
+    assert expand_directories([str(tmp_path / "library"), str(single)], split_roots=True) == [
+        str(tmp_path / "library" / "Show A"), str(tmp_path / "library" / "Show B"), str(single)]
+
+    # 根目录下只有非媒体文件时照常拆分
+    extensions = ['.mkv', '.ass']
+    (tmp_path / "library" / "notes.txt").touch()
+    assert expand_directories([str(tmp_path / "library")], split_roots=True,
+                              media_extensions=extensions) == [
+        str(tmp_path / "library" / "Show A"), str(tmp_path / "library" / "Show B")]
+
+    # 根目录下直接有媒体文件时不拆分，这些文件仍可与子目录中的文件匹配
+    (tmp_path / "library" / "Show.A.S01E04.1080p.MKV").touch()
+    assert expand_directories([str(tmp_path / "library")], split_roots=True,
+                              media_extensions=extensions) == [str(tmp_path / "library")]
+
+
+@pytest.fixture
+def libraries(tmp_path):
+    roots = []
+    for index, name in enumerate(["Show.A", "Show.B", "Show.C"]):
+        root = tmp_path / f"library{index}"
+        make_show(root / name, name, episodes=index + 2)
+        roots.append(root)
+    return roots
+
+
+def renamed(report):
+    return {(result['directory'], entry['old_name'], entry['new_name'])
+            for result in report['results'] for entry in result['renamed_files']}
+
+
+def test_process_pool_matches_single_process(libraries, make_config):
+    config_path = make_config()
+    directories = [str(root) for root in reversed(libraries)]
+    single = run_batch(config_path, directories, dry_run=True, max_workers=1)
+    pooled = run_batch(config_path, directories, dry_run=True, max_workers=3)
+    assert pooled['workers'] == 3 and pooled['success']
+    assert [result['directory'] for result in pooled['results']] == [
+        str(root) for root in libraries]
+    assert renamed(pooled) == renamed(single)
+    assert pooled['renamed_count'] == single['renamed_count'] == 2 + 3 + 4
+    # 演习模式不修改文件
+    assert not list(libraries[0].rglob('*.1080p.ass'))
+
+
+def test_process_pool_renames_split_shards(tmp_path, make_config):
+    root = tmp_path / "library"
+    for name in ["Show.A", "Show.B"]:
+        make_show(root / name, name)
+    (root / "README.txt").touch()
+    report = run_batch(make_config(), [str(root)], dry_run=False, max_workers=2,
+                       split_roots=True)
+    assert report['success'] and report['directory_count'] == 2
+    assert report['renamed_count'] == 6 and report['error_count'] == 0
+    assert all(result['journal'] for result in report['results'])
+    assert sorted(path.name for path in root.rglob('*.ass')) == sorted(
+        f"{name}.S01E{episode:02d}.1080p.ass" for name in ["Show.A", "Show.B"]
+        for episode in range(1, 4))
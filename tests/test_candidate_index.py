@@ -0,0 +1,90 @@
+import pytest
+
+from submatcher import CandidateIndex, FileType
+
+
+@pytest.fixture
+def library(tmp_path, make_library, make_submatcher):
+    root = make_library(tmp_path / "library", seed=7)
+    submatcher = make_submatcher()
+    videos, subtitles = submatcher.file_scanner.scan_directory(str(root))
+    global_tokens, _ = submatcher.cluster_analyzer.analyze(videos + subtitles)
+    return submatcher.matcher, videos, subtitles, global_tokens
+
+
+def brute_force(matcher, video, subtitles, global_tokens, removed=()):
+    return [position for position, subtitle in enumerate(subtitles)
+            if position not in removed and matcher.match(video, subtitle, global_tokens) > 0]
+
+
+def test_candidates_equal_brute_force(library):
+    matcher, videos, subtitles, global_tokens = library
+    candidate_index = CandidateIndex(subtitles, global_tokens)
+    for video in videos:
+        expected = brute_force(matcher, video, subtitles, global_tokens)
+        assert candidate_index.candidate_positions(video) == expected
+        candidates = candidate_index.candidates(video)
+        assert candidates == [subtitles[position] for position in expected]
+        # 候选集上的最佳匹配与全量扫描相同，包括同分时的选择
+        indexed = matcher.find_best_match(video, candidates, global_tokens)
+        full = matcher.find_best_match(video, subtitles, global_tokens)
+        assert (indexed and indexed.subtitle) == (full and full.subtitle)
+        # 命中次数即共享的全局 Token 数
+        for position, common in candidate_index.candidate_counts(video):
+            shared = set(video.tokens) & set(subtitles[position].tokens) & global_tokens
+            assert common == len(shared)
+
+
+def test_candidates_follow_add_and_remove(library):
+    matcher, videos, subtitles, global_tokens = library
+    candidate_index = CandidateIndex(subtitles[:-10], global_tokens)
+    removed = set(range(0, len(subtitles) - 10, 4))
+    for position in removed:
+        candidate_index.remove(subtitles[position])
+    for subtitle in subtitles[-10:]:
+        candidate_index.add(subtitle)
+    # 重新加入已删除的字幕时追加在末尾，旧位置保持删除
+    readded = subtitles[0]
+    candidate_index.add(readded)
+
+    assert readded.path in candidate_index
+    assert subtitles[4].path not in candidate_index
+    current = candidate_index.subtitles
+    for video in videos:
+        expected = brute_force(matcher, video, current, global_tokens,
+                               removed=candidate_index.removed)
+        assert candidate_index.candidate_positions(video) == expected
+
+
+def test_scalar_scores_equal_detailed_scores(library):
+    matcher, videos, subtitles, global_tokens = library
+    threshold = matcher.config.get_matching_config().get('min_score_threshold', 0)
+    candidate_index = CandidateIndex(subtitles, global_tokens)
+    adjacency = matcher.score_candidates(videos, candidate_index, global_tokens,
+                                         engine='scalar')
+    assert any(adjacency)
+    for video, edges in zip(videos, adjacency):
+        expected = []
+        for position in brute_force(matcher, video, subtitles, global_tokens):
+            subtitle = subtitles[position]
+            assert subtitle.file_type == FileType.SUBTITLE
+            score = matcher._calculate_detailed_score(
+                video, subtitle, matcher.match(video, subtitle, global_tokens)).score
+            if score >= threshold:
+                expected.append((position, score))
+        assert edges == expected
+
+
+def test_top_matches_equal_full_sort(library):
+    matcher, videos, subtitles, global_tokens = library
+    for video in videos:
+        scored = []
+        for order, subtitle in enumerate(subtitles):
+            base_score = matcher.match(video, subtitle, global_tokens)
+            if base_score > 0:
+                result = matcher._calculate_detailed_score(video, subtitle, base_score)
+                scored.append((-result.score, order, result))
+        # 全量排序：总分从高到低，同分时保持字幕的原始顺序
+        expected = [(result.subtitle, result.score) for _, _, result in sorted(scored)[:3]]
+        ranked = matcher.top_matches(video, subtitles, global_tokens, 3)
+        assert [(result.subtitle, result.score) for result in ranked] == expected
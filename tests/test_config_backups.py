@@ -0,0 +1,67 @@
+import os
+import time
+
+import pytest
+
+from config_nlp import ConfigManager
+
+
+@pytest.fixture
+def manager_for(tmp_path, make_config):
+    def factory(**retention):
+        manager = ConfigManager(make_config(config_backups=retention))
+        manager.backup_dir = tmp_path / "config_backups"
+        manager.backup_dir.mkdir(exist_ok=True)
+        manager.log_file = tmp_path / "SYSTEM_MOD_LOG.md"
+        return manager
+
+    return factory
+
+
+def backups(manager):
+    return sorted(manager.backup_dir.glob("config_backup_*.yaml"))
+
+
+def test_identical_content_is_backed_up_once(manager_for):
+    manager = manager_for(max_backups=50, max_age_days=90)
+    original = open(manager.config_path, 'rb').read()
+    first = manager.set_config_value('matching.min_score_threshold', 60)
+    second = manager.set_config_value('matching.min_score_threshold', 50)
+    # 改回原值后再次修改：备份内容与第一份相同，复用已有文件
+    third = manager.set_config_value('matching.min_score_threshold', 60)
+    assert first.success and second.success and third.success
+    assert third.backup_path == first.backup_path != second.backup_path
+    assert len(backups(manager)) == 2
+    assert open(first.backup_path, 'rb').read() == original
+    # 复用的备份被视为最新，不会先于其他备份被清理
+    assert os.stat(first.backup_path).st_mtime >= os.stat(second.backup_path).st_mtime
+
+    # 值未变化时不备份、不写日志
+    unchanged = manager.set_config_value('matching.min_score_threshold', 60)
+    assert unchanged.success and unchanged.backup_path is None
+    assert len(backups(manager)) == 2
+    assert manager.log_file.read_text(encoding='utf-8').count('## ') == 3
+
+
+def test_retention_keeps_newest_backups(manager_for):
+    manager = manager_for(max_backups=3, max_age_days=0)
+    paths = []
+    for threshold in range(51, 58):
+        change = manager.set_config_value('matching.min_score_threshold', threshold)
+        assert change.success
+        paths.append(change.backup_path)
+    assert [str(path) for path in backups(manager)] == sorted(paths[-3:])
+
+
+def test_retention_drops_expired_backups(manager_for):
+    manager = manager_for(max_backups=0, max_age_days=30)
+    stale = manager.backup_dir / "config_backup_20000101_000000_0123456789abcdef.yaml"
+    recent = manager.backup_dir / "config_backup_20000102_000000_fedcba9876543210.yaml"
+    for path, age_days in ((stale, 31), (recent, 29)):
+        path.write_text("matching: {}\n", encoding='utf-8')
+        old = time.time() - age_days * 86400
+        os.utime(path, (old, old))
+    change = manager.set_config_value('matching.min_score_threshold', 60)
+    assert change.success
+    assert not stale.exists() and recent.exists()
+    assert len(backups(manager)) == 2
@@ -0,0 +1,155 @@
+import gc
+from pathlib import Path
+
+import pytest
+import yaml
+
+from config_nlp import ConfigManager
+from core.config_store import ConfigStore
+from core.submatcher import Config, EpisodeExtractor, SubMatcher
+
+INVALID_CONDITION = 'episode_group >= 10 or season_group < 3'
+
+
+@pytest.fixture
+def config_path(make_config):
+    return Path(make_config())
+
+
+@pytest.fixture
+def manager(config_path, tmp_path):
+    manager = ConfigManager(str(config_path))
+    manager.backup_dir = tmp_path / "backups"
+    manager.log_file = tmp_path / "SYSTEM_MOD_LOG.md"
+    return manager
+
+
+def test_store_reparses_only_after_file_changes(config_path):
+    store = ConfigStore.for_path(str(config_path))
+    assert ConfigStore.for_path(str(config_path.parent / "." / config_path.name)) is store
+    first = store.load()
+    assert store.load() is first
+
+    received = []
+
+    def record(data):
+        received.append(data)
+
+    store.subscribe(record)
+    # 直接编辑文件：大小变化，下一次 load 重新解析并通知订阅者
+    with open(config_path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(dict(first, marker=1), f, allow_unicode=True)
+    reloaded = store.load()
+    assert reloaded is not first and reloaded['marker'] == 1
+    assert received == [reloaded]
+
+
+def test_write_replaces_file_and_notifies(config_path):
+    store = ConfigStore.for_path(str(config_path))
+    received = []
+
+    def record(data):
+        received.append(data)
+
+    store.subscribe(record)
+    store.write(dict(store.load(), marker=2))
+
+    assert not Path(f"{config_path}.tmp").exists()
+    with open(config_path, 'r', encoding='utf-8') as f:
+        assert yaml.safe_load(f)['marker'] == 2
+    assert store.load()['marker'] == 2
+    assert [data['marker'] for data in received] == [2]
+
+
+def test_subscribers_are_held_weakly(config_path):
+    store = ConfigStore.for_path(str(config_path))
+    store.load()
+    before = len(store._listeners)
+    config = Config(str(config_path))
+    assert len(store._listeners) == before + 1
+    del config
+    gc.collect()
+    store.write(dict(store.load()))
+    assert len(store._listeners) == before
+
+
+def test_valid_change_recompiles_live_matcher(config_path, manager):
+    matcher = SubMatcher(str(config_path))
+    change = manager.set_config_value('episode_patterns[0].condition', 'episode_group <= 10')
+
+    assert change.success
+    assert manager.log_file.exists()
+    assert matcher.episode_extractor.patterns[0]['condition'] == 'episode_group <= 10'
+
+
+def test_invalid_condition_is_not_written(config_path, manager, tmp_path):
+    matcher = SubMatcher(str(config_path))
+    before = config_path.read_bytes()
+
+    change = manager.set_config_value('episode_patterns[2].condition', INVALID_CONDITION)
+
+    assert not change.success
+    assert '不支持的集数条件' in change.error
+    assert config_path.read_bytes() == before
+    assert not manager.log_file.exists()
+    assert not manager.backup_dir.exists()
+    # 运行中的匹配器保持原配置，之后新建的匹配器（服务器重启）仍可正常构建
+    assert matcher.episode_extractor.extract('Show.S01E02.mkv') == (1, 2)
+    assert SubMatcher(str(config_path)).episode_extractor.extract('Show.S01E02.mkv') == (1, 2)
+
+
+def test_invalid_batch_is_not_written(config_path, manager):
+    before = config_path.read_bytes()
+    batch = manager.set_config_values([('matching.min_score_threshold', 10),
+                                       ('episode_patterns[0].pattern', 'S(\\d+')])
+    assert not batch.success
+    assert config_path.read_bytes() == before
+
+
+def test_failing_listener_does_not_skip_others(config_path):
+    store = ConfigStore.for_path(str(config_path))
+    data = dict(store.load())
+    received = []
+
+    def failing(new_data):
+        raise RuntimeError('boom')
+
+    def recording(new_data):
+        received.append(new_data)
+
+    store.subscribe(failing)
+    store.subscribe(recording)
+    store.write(dict(data, marker=1))
+
+    assert received and received[-1]['marker'] == 1
+    assert store.load()['marker'] == 1
+
+
+def test_extractor_keeps_patterns_when_recompile_fails(config_path):
+    config = Config(str(config_path))
+    original = config.config
+    extractor = EpisodeExtractor(config)
+    thresholds = []
+    config.add_listener(
+        lambda: thresholds.append(config.get_matching_config()['min_score_threshold']))
+    bad = dict(config.config)
+    bad['matching'] = dict(bad['matching'], min_score_threshold=99)
+    bad['episode_patterns'] = [{'pattern': r'S(\d+)E(\d+)', 'season_group': 1, 'episode_group': 2,
+                                'condition': INVALID_CONDITION}]
+
+    with pytest.raises(ValueError):
+        config._on_change(bad)
+
+    assert extractor.extract('Show.S01E02.mkv') == (1, 2)
+    assert len(extractor.patterns) == len(extractor._chains)
+    # 其他回调已按新配置编译，回滚后用原配置重新编译
+    assert config.config is original
+    assert thresholds == [99, original['matching']['min_score_threshold']]
+
+
+def test_builtin_method_subscriber(config_path):
+    store = ConfigStore.for_path(str(config_path))
+    received = []
+    store.subscribe(received.append)
+    store.write(dict(store.load(), marker=3))
+    assert [data['marker'] for data in received] == [3]
@@ -0,0 +1,116 @@
+import re
+
+import pytest
+
+from engine import (UNTIL_MATCH, UNTIL_SCAN, RenameCompleted, RunCompleted, RunStarted,
+                    ScanCompleted, SubtitleRenamed, TokensAnalyzed, VideoMatched, drain)
+
+# 引擎重构之前 SubMatcher.run 的控制台输出（演习模式）
+EXPECTED_OUTPUT = """扫描目录：{library}
+找到 4 个视频文件
+找到 6 个字幕文件
+
+=== 演习模式（Dry Run）===
+仅显示拟重命名结果，不会实际修改文件
+使用 --confirm 或 -y 参数执行实际重命名
+
+[DRY RUN] Show S01E01 chs.ass -> Show.S01E01.1080p.WEB-DL.x264-GRP.ass
+[DRY RUN] Show S01E02 chs.ass -> Show.S01E02.1080p.WEB-DL.x264-GRP.ass
+[DRY RUN] Show S01E03 chs.ass -> Show.S01E03.1080p.WEB-DL.x264-GRP.ass
+
+=== 总结 ===
+匹配成功：3 个
+跳过：0 个
+剩余未匹配字幕：3 个
+
+未匹配的字幕文件：
+  Other S05E09 chs.ass
+  Show S01E02 eng.srt
+  Show.S01E04.1080p.WEB-DL.x264-GRP.ass
+"""
+
+EXPECTED_VERBOSE_MATCH = """
+匹配：Show.S01E04.1080p.WEB-DL.x264-GRP.mkv
+  字幕：Show.S01E04.1080p.WEB-DL.x264-GRP.ass
+  评分：240.0
+    - 基础分：120.0
+    - 语言权重：0.0
+    - 格式权重：100.0
+    - 血统加分：20.0
+
+[DRY RUN] Show S01E01 chs.ass"""
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = tmp_path / "library"
+    root.mkdir()
+    for episode in range(1, 5):
+        (root / f"Show.S01E{episode:02d}.1080p.WEB-DL.x264-GRP.mkv").touch()
+    for episode in range(1, 4):
+        (root / f"Show S01E{episode:02d} chs.ass").touch()
+    # 次选字幕、其他剧集的字幕，以及已与视频同名的字幕
+    (root / "Show S01E02 eng.srt").touch()
+    (root / "Other S05E09 chs.ass").touch()
+    (root / "Show.S01E04.1080p.WEB-DL.x264-GRP.ass").touch()
+    return root
+
+
+@pytest.fixture
+def submatcher(make_submatcher):
+    return make_submatcher(safety={'dry_run': True})
+
+
+def test_console_output_matches_previous_run(submatcher, library, capsys):
+    before = sorted(path.name for path in library.iterdir())
+    submatcher.run(str(library))
+    assert capsys.readouterr().out == EXPECTED_OUTPUT.format(library=library)
+    assert sorted(path.name for path in library.iterdir()) == before
+
+
+def test_verbose_output_lists_scores(submatcher, library, capsys):
+    submatcher.run(str(library), verbose=True)
+    out = capsys.readouterr().out
+    assert re.search(r"^扫描耗时：\d+\.\d\d 秒（10 个条目，\d+ 个/秒）$", out, re.MULTILINE)
+    assert "\n全局Token（前20个）：\n  show: 9\n" in out
+    assert EXPECTED_VERBOSE_MATCH in out
+    # 详细输出只在非详细输出的基础上增加内容
+    lines = out.splitlines()
+    for line in EXPECTED_OUTPUT.format(library=library).splitlines():
+        assert line in lines
+
+
+def test_events_follow_pipeline_order(submatcher, library):
+    events = list(submatcher.engine.run(str(library), dry_run=True))
+    kinds = [type(event) for event in events]
+    assert kinds[:3] == [RunStarted, ScanCompleted, TokensAnalyzed]
+    assert kinds[3:7] == [VideoMatched] * 4
+    assert kinds[7:] == [SubtitleRenamed] * 3 + [RenameCompleted, RunCompleted]
+    # 视频事件按扫描顺序产出
+    result = events[-1]
+    assert [event.video for event in events[3:7]] == result.videos
+    assert len(result.matches) == 4 and result.unmatched == []
+    # 已与视频同名的字幕无需重命名，不计入成功
+    assert len(result.renamed) == 3
+    assert [match.subtitle.name for match in result.failed] == [
+        'Show.S01E04.1080p.WEB-DL.x264-GRP.ass']
+
+
+def test_until_stops_early(submatcher, library):
+    scanned = drain(submatcher.engine.run(str(library), until=UNTIL_SCAN))
+    assert isinstance(scanned, RunCompleted)
+    assert len(scanned.videos) == 4 and scanned.matches == []
+    matched = drain(submatcher.engine.run(str(library), until=UNTIL_MATCH))
+    assert len(matched.matches) == 4 and matched.outcome is None
+    with pytest.raises(ValueError):
+        drain(submatcher.engine.run(str(library), until='everything'))
+
+
+def test_confirmed_run_renames_files(submatcher, library, capsys):
+    result = submatcher.run(str(library), confirm=True)
+    assert "[RENAME] Show S01E01 chs.ass -> Show.S01E01.1080p.WEB-DL.x264-GRP.ass" in (
+        capsys.readouterr().out)
+    assert len(result.renamed) == 3
+    assert sorted(path.name for path in library.glob('*.ass')) == [
+        'Other S05E09 chs.ass'] + [f"Show.S01E{episode:02d}.1080p.WEB-DL.x264-GRP.ass"
+                                   for episode in range(1, 5)]
@@ -0,0 +1,105 @@
+import operator
+import random
+import re
+
+import pytest
+import yaml
+
+from submatcher import Config, EpisodeExtractor, validate_config
+
+OPERATORS = {'>=': operator.ge, '<=': operator.le, '==': operator.eq, '!=': operator.ne,
+             '>': operator.gt, '<': operator.lt}
+
+TITLES = ['Show', 'The.Office.2005', 'Star Trek', 'Blade.Runner.2049', '1923', 'Se7en.Days']
+NUMBERS = ['S{s:02d}E{e:02d}', 's{s}e{e}', '{s}x{e:02d}', '{s}{e:02d}', 'Season {s} Episode {e}',
+           'E{e:02d}', '']
+SUFFIXES = ['1080p.WEB-DL', '720p', 'chs&eng', 'x264-NTB', '2160p.HDR', 'v2', '']
+
+
+def generate_stems(count, seed):
+    rnd = random.Random(seed)
+    stems = []
+    for _ in range(count):
+        number = rnd.choice(NUMBERS).format(s=rnd.randint(1, 12), e=rnd.randint(0, 30))
+        parts = [rnd.choice(TITLES), number, rnd.choice(SUFFIXES), rnd.choice(SUFFIXES)]
+        stems.append(rnd.choice(['.', ' ', '_']).join(part for part in parts if part))
+    return stems
+
+
+def reference_extract(patterns, filename):
+    """逐个模式 re.search，取第一个满足条件的结果（合并成单个正则之前的语义）"""
+    for pattern_config in patterns:
+        match = re.search(pattern_config['pattern'], filename, re.IGNORECASE)
+        if not match:
+            continue
+        values = {'season_group': int(match.group(pattern_config['season_group'])),
+                  'episode_group': int(match.group(pattern_config['episode_group']))}
+        condition = pattern_config.get('condition') or ''
+        clauses = [clause.split() for clause in condition.split(' and ') if clause]
+        if all(OPERATORS[op](values[field], int(value)) for field, op, value in clauses):
+            return values['season_group'], values['episode_group']
+    return None, None
+
+
+def test_combined_regex_matches_sequential_search(make_config):
+    config_path = make_config()
+    extractor = EpisodeExtractor(Config(config_path))
+    with open(config_path, 'r', encoding='utf-8') as f:
+        patterns = yaml.safe_load(f)['episode_patterns']
+    stems = generate_stems(3000, seed=11)
+    stems += ['Show 112 chs', 'Show 105 chs', 'Show S01E02 1x03', 'Show 2x05 0312',
+              'Show 1999 Remaster', 'no episode here']
+    for stem in stems:
+        assert extractor.extract(stem) == reference_extract(patterns, stem), stem
+    assert extractor.extract_many(stems[:100]) == [extractor.extract(stem)
+                                                   for stem in stems[:100]]
+
+
+def test_conditions_support_both_groups(make_config):
+    config_path = make_config(episode_patterns=[
+        {'pattern': r'(\d{1,2})(\d{2})', 'season_group': 1, 'episode_group': 2,
+         'condition': 'season_group <= 5 and episode_group != 0'},
+        {'pattern': r'S(\d{1,2})E(\d{1,2})', 'season_group': 1, 'episode_group': 2},
+    ])
+    extractor = EpisodeExtractor(Config(config_path))
+    assert extractor.extract('Show 312') == (3, 12)
+    # 条件不满足时从下一个模式继续
+    assert extractor.extract('Show 712 S02E03') == (2, 3)
+    assert extractor.extract('Show 300') == (None, None)
+
+
+@pytest.mark.parametrize('patterns, filename, expected', [
+    # 反向引用：合并后组号偏移，\2 会指向其他组
+    ([r'S(\d+)E(\d+)', r'(\d)(\d)\2', r'(\d+)x(\d+)'], 'x 122', (1, 2)),
+    # 全局内联标志：合并后会作用于其他模式
+    ([r'Season (\d+) Episode (\d+)', r'(?x) S (\d+) \s* EP (\d+)'], 'Show Season 2 Episode 5',
+     (2, 5)),
+    ([r'Season (\d+) Episode (\d+)', r'(?x) S (\d+) \s* EP (\d+)'], 'Show S3 EP4', (3, 4)),
+    # 不同模式中的同名组
+    ([r'S(?P<n>\d+)E(\d+)', r'(?P<n>\d+)x(\d+)', r'E(?P<n>\d+)-(\d+)'], 'Show 2x05', (2, 5)),
+    ([r'S(?P<n>\d+)E(\d+)', r'(?P<n>\d+)x(\d+)', r'E(?P<n>\d+)-(\d+)'], 'Show E3-07', (3, 7)),
+])
+def test_unchainable_patterns_fall_back_to_search(make_config, patterns, filename, expected):
+    patterns = [{'pattern': pattern, 'season_group': 1, 'episode_group': 2}
+                for pattern in patterns]
+    extractor = EpisodeExtractor(Config(make_config(episode_patterns=patterns)))
+    assert extractor.extract(filename) == reference_extract(patterns, filename) == expected
+
+
+@pytest.mark.parametrize('condition', [
+    "__import__('os').system('true')",
+    'episode_group >= 1 or True',
+    'episode >= 1',
+    'episode_group >= 1.5',
+])
+def test_unsupported_conditions_are_rejected(make_config, condition):
+    config_path = make_config(episode_patterns=[
+        {'pattern': r'(\d{1,2})(\d{2})', 'season_group': 1, 'episode_group': 2,
+         'condition': condition},
+    ])
+    with pytest.raises(ValueError):
+        EpisodeExtractor(Config(config_path))
+    with open(config_path, 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f)
+    with pytest.raises(ValueError):
+        validate_config(data)
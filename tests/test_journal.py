@@ -0,0 +1,160 @@
+import os
+
+import pytest
+
+import journal
+from journal import (STATE_COMMITTED, STATE_ROLLED_BACK, STATE_STAGED, BatchRenamer,
+                     RenameJournal, RenameOperation, check_operations)
+
+
+@pytest.fixture
+def renamer(tmp_path):
+    return BatchRenamer(str(tmp_path / "journals"))
+
+
+def make_files(directory, names):
+    directory.mkdir(exist_ok=True)
+    for name in names:
+        (directory / name).write_text(name, encoding='utf-8')
+    return [str(directory / name) for name in names]
+
+
+def contents(directory):
+    return {path.name: path.read_text(encoding='utf-8') for path in directory.iterdir()}
+
+
+def test_check_rejects_conflicts_and_existing_targets(tmp_path):
+    a, b, c, d = make_files(tmp_path / "files", ['a', 'b', 'c', 'd'])
+    target = str(tmp_path / "files" / "x")
+    valid, errors = check_operations([
+        RenameOperation(a, target),
+        RenameOperation(b, target),       # 与 a 的目标冲突
+        RenameOperation(c, d),            # 目标已存在且不会被移走
+        RenameOperation(d, d),            # 空操作
+    ])
+    assert [operation.source for operation in valid] == [a]
+    assert set(errors) == {b, c, d}
+
+
+def test_check_cascades_through_chains(tmp_path):
+    a, b, c = make_files(tmp_path / "files", ['a', 'b', 'c'])
+    blocked = str(tmp_path / "files" / "blocked")
+    make_files(tmp_path / "files", ['blocked'])
+    # c 的目标被占用 → c 留在原地 → b -> c 随之被拒绝 → a -> b 也被拒绝
+    valid, errors = check_operations([
+        RenameOperation(a, b), RenameOperation(b, c), RenameOperation(c, blocked)])
+    assert valid == []
+    assert set(errors) == {a, b, c}
+
+
+def test_swap_commits_and_undo_restores(tmp_path, renamer):
+    directory = tmp_path / "files"
+    a, b, c = make_files(directory, ['a', 'b', 'c'])
+    outcome = renamer.execute([RenameOperation(a, b), RenameOperation(b, a),
+                               RenameOperation(c, str(directory / "d"))], dry_run=False)
+    assert outcome.state == STATE_COMMITTED and not outcome.errors
+    assert contents(directory) == {'a': 'b', 'b': 'a', 'd': 'c'}
+    assert RenameJournal.load(outcome.journal)[1] == STATE_COMMITTED
+
+    undone = renamer.undo(outcome.journal)
+    assert undone.state == STATE_COMMITTED and not undone.errors
+    assert contents(directory) == {'a': 'a', 'b': 'b', 'c': 'c'}
+    # 再次撤销时文件都已在原位
+    again = renamer.undo(outcome.journal)
+    assert again.operations == [] and not again.errors
+    assert contents(directory) == {'a': 'a', 'b': 'b', 'c': 'c'}
+
+
+def test_failure_rolls_back_whole_batch(tmp_path, renamer, monkeypatch):
+    directory = tmp_path / "files"
+    sources = make_files(directory, ['a', 'b', 'c'])
+    operations = [RenameOperation(source, source + '.new') for source in sources]
+    real_rename = os.rename
+    calls = []
+
+    def flaky_rename(source, destination):
+        calls.append(source)
+        # 第二阶段移动第二个文件时失败
+        if len(calls) == len(sources) + 2:
+            raise OSError("磁盘已满")
+        real_rename(source, destination)
+
+    monkeypatch.setattr(journal.os, 'rename', flaky_rename)
+    outcome = renamer.execute(operations, dry_run=False)
+    monkeypatch.undo()
+
+    assert outcome.state == STATE_ROLLED_BACK
+    assert set(outcome.errors) == set(sources)
+    assert not any(outcome.succeeded(source) for source in sources)
+    assert contents(directory) == {'a': 'a', 'b': 'b', 'c': 'c'}
+    assert RenameJournal.load(outcome.journal)[1] == STATE_ROLLED_BACK
+
+
+def test_undo_recovers_interrupted_batch(tmp_path, renamer, monkeypatch):
+    directory = tmp_path / "files"
+    sources = make_files(directory, ['a', 'b', 'c'])
+    operations = [RenameOperation(source, source + '.new') for source in sources]
+    real_rename = os.rename
+    calls = []
+
+    def crashing_rename(source, destination):
+        calls.append(source)
+        # 第一个文件已移到目标名，其余仍是临时名时进程被中断（不会回滚）
+        if len(calls) == len(sources) + 2:
+            raise KeyboardInterrupt
+        real_rename(source, destination)
+
+    monkeypatch.setattr(journal.os, 'rename', crashing_rename)
+    with pytest.raises(KeyboardInterrupt):
+        renamer.execute(operations, dry_run=False)
+    monkeypatch.undo()
+
+    journal_path = next((tmp_path / "journals").glob('*.jsonl'))
+    assert RenameJournal.load(str(journal_path))[1] == STATE_STAGED
+    assert 'a.new' in contents(directory)
+
+    outcome = renamer.undo(str(journal_path))
+    assert outcome.state == STATE_COMMITTED and not outcome.errors
+    assert contents(directory) == {'a': 'a', 'b': 'b', 'c': 'c'}
+
+
+def test_undo_skips_replaced_files(tmp_path, renamer):
+    directory = tmp_path / "files"
+    a, b = make_files(directory, ['a', 'b'])
+    outcome = renamer.execute([RenameOperation(a, a + '.new'), RenameOperation(b, b + '.new')],
+                              dry_run=False)
+    # 重命名之后 a.new 被另一个同名文件替换（先建新文件，保证 inode 不同）
+    replacement, = make_files(directory, ['replacement'])
+    os.replace(replacement, a + '.new')
+
+    undone = renamer.undo(outcome.journal)
+    assert set(undone.errors) == {a + '.new'}
+    assert contents(directory) == {'a.new': 'replacement', 'b': 'b'}
+
+
+def test_prune_counts_a_group_as_one_journal(tmp_path):
+    renamer = BatchRenamer(str(tmp_path / "journals"), keep=2)
+    files = make_files(tmp_path / "files", [f"f{index}" for index in range(8)])
+    journals = []
+
+    def rename(index, group=None):
+        outcome = renamer.execute([RenameOperation(files[index], f"{files[index]}.renamed")],
+                                  dry_run=False, group=group)
+        assert outcome.state == STATE_COMMITTED
+        journals.append(outcome.journal)
+        # 按修改时间排序，相邻两次写入的时间需可区分
+        old = 1_000_000 + index
+        os.utime(outcome.journal, (old, old))
+        if group:
+            os.utime(os.path.dirname(outcome.journal), (old, old))
+
+    rename(0)
+    for index in range(1, 5):
+        rename(index, group="20260101-000000-watch-abc")
+    # 一个会话的四份日志计为一份，不会挤掉其他日志
+    assert all(os.path.exists(path) for path in journals)
+    rename(5)
+    rename(6)
+    assert not os.path.exists(journals[0])
+    assert not os.path.exists(os.path.dirname(journals[1]))
+    assert [os.path.exists(path) for path in journals[5:]] == [True, True]
@@ -0,0 +1,106 @@
+import random
+
+import pytest
+
+from keywords import KeywordAutomaton
+
+
+def substring_labels(keywords, text):
+    return frozenset(label for keyword, label in keywords if keyword in text)
+
+
+def test_overlapping_and_nested_keywords():
+    keywords = [('chs', 0), ('chs&eng', 1), ('eng', 2), ('en', 3), ('hse', 4), ('sh', 5)]
+    automaton = KeywordAutomaton(keywords)
+    # chs&eng 同时包含 chs、eng、en；沿失败指针回退后仍能识别 sh、hse
+    assert automaton.search('show.chs&eng') == {0, 1, 2, 3, 5}
+    assert automaton.search('chsheng') == {0, 2, 3, 5}
+    assert automaton.search('chse') == {0, 4}
+    assert automaton.search('cheng') == {2, 3}
+    assert automaton.search('') == frozenset()
+
+
+def test_same_keyword_with_several_labels():
+    automaton = KeywordAutomaton([('cht&eng', 0), ('cht&eng', 1), ('cht', 2)])
+    assert automaton.search('show.cht&eng.ass') == {0, 1, 2}
+    assert automaton.search('show.cht.ass') == {2}
+
+
+def test_empty_keyword_always_matches():
+    automaton = KeywordAutomaton([('', 3), ('zh', 1)])
+    assert automaton.search('show') == {3}
+    assert automaton.search('show.zh') == {1, 3}
+
+
+def test_search_is_case_sensitive():
+    # 自动机按原样比较，调用方（Matcher）负责统一转小写
+    automaton = KeywordAutomaton([('eng', 0), ('简体', 1)])
+    assert automaton.search('SHOW.ENG') == frozenset()
+    assert automaton.search('show.eng.简体') == {0, 1}
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_texts_agree_with_substring_scan(seed):
+    rnd = random.Random(seed)
+    alphabet = 'abcs&e'
+    keywords = [(''.join(rnd.choice(alphabet) for _ in range(rnd.randint(1, 4))), label)
+                for label in range(15)]
+    automaton = KeywordAutomaton(keywords)
+    for _ in range(300):
+        text = ''.join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 20)))
+        assert automaton.search(text) == substring_labels(keywords, text), text
+
+
+NAMES = [
+    'Show.S01E01.1080p.WEB-DL.x264-SPARKS',
+    'Show.S01E01.1080p.WEB-DL.x264-SPARKS.chs&eng',
+    'Show.S01E01.720p.HDTV.x265-FGT.CHT',
+    'Show.S01E01.简体&英文.WEBRip',
+    'Show S01E01 [繁中] BluRay 2160p',
+    'Show.S01E01.English.eztv',
+    'Show.S01E01.sc.rarbg',
+    'Show.S01E01.ZH.yts.4K',
+    'Show.S01E01.bdrip.中英.DVDRip',
+]
+
+
+def reference_language_weight(config, name):
+    """原实现：按配置顺序逐个关键词做子串查找"""
+    for lang_config in config.get_language_weights():
+        for keyword in lang_config.get('keywords', []):
+            if keyword.lower() in name.lower():
+                return lang_config.get('weight', 0)
+    return 0
+
+
+def reference_lineage_bonus(config, video_name, subtitle_name):
+    lineage_config = config.get_lineage_bonus_config()
+    if not lineage_config.get('enabled', False):
+        return 0
+    for group in lineage_config.get('common_release_groups', []):
+        if group.lower() in video_name.lower() and group.lower() in subtitle_name.lower():
+            return lineage_config.get('weight', 20)
+    return 0
+
+
+def test_matcher_weights_agree_with_substring_scan(tmp_path, make_submatcher):
+    library = tmp_path / "library"
+    library.mkdir()
+    for index, name in enumerate(NAMES):
+        (library / f"{name}.mkv").touch()
+        (library / f"{name}.{index}.ass").touch()
+    submatcher = make_submatcher()
+    matcher, config = submatcher.matcher, submatcher.config
+    videos, subtitles = submatcher.file_scanner.scan_directory(str(library))
+    assert len(videos) == len(subtitles) == len(NAMES)
+    checked = set()
+    for video in videos:
+        for subtitle in subtitles:
+            result = matcher._calculate_detailed_score(video, subtitle, 0)
+            assert result.language_weight == reference_language_weight(config, subtitle.stem)
+            assert result.lineage_bonus == reference_lineage_bonus(config, video.stem,
+                                                                   subtitle.stem)
+            checked.add((result.language_weight, result.lineage_bonus))
+    # 覆盖多个语言权重以及有无血统加分两种情况
+    assert len({weight for weight, _ in checked}) >= 4
+    assert {bonus for _, bonus in checked} == {0, 20}
@@ -0,0 +1,249 @@
+import json
+import shutil
+import time
+from pathlib import Path
+
+import pytest
+
+from generate import generate_library
+from mcp_adapter import SubMatcherAdapter, decode_cursor
+from plans import ScanSnapshot, ScanStore
+
+
+@pytest.fixture
+def adapter(make_config):
+    return SubMatcherAdapter(make_config())
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = tmp_path / "library"
+    root.mkdir()
+    for episode in range(1, 8):
+        (root / f"Show.S01E{episode:02d}.1080p.mkv").touch()
+        (root / f"Show S01E{episode:02d} chs.ass").touch()
+    return root
+
+
+def page_paths(result):
+    return [f['path'] for f in result['video_files'] + result['subtitle_files']]
+
+
+def test_scan_pages_read_snapshot_without_rescanning(adapter, library, monkeypatch):
+    first = adapter.scan_directory(str(library), limit=5)
+    assert first['success'] and first['next_cursor']
+
+    def fail(*args, **kwargs):
+        raise AssertionError("翻页时不应重新扫描")
+
+    monkeypatch.setattr(adapter.matcher.file_scanner, 'scan_directory', fail)
+    # 快照建立之后新增的文件不会出现在后续分页中
+    (library / "Show.S01E09.1080p.mkv").touch()
+    paths = page_paths(first)
+    cursor = first['next_cursor']
+    while cursor:
+        page = adapter.scan_directory(str(library), limit=5, cursor=cursor)
+        assert page['success']
+        paths.extend(page_paths(page))
+        cursor = page['next_cursor']
+    assert len(paths) == len(set(paths)) == 14
+
+    # 最后一页之后快照被删除
+    scan_id = decode_cursor(first['next_cursor'], 'scan')['scan_id']
+    assert adapter.scans.get(scan_id) is None
+
+
+def test_scan_cursor_survives_other_adapter(adapter, library, tmp_path):
+    first = adapter.scan_directory(str(library), limit=10)
+    # 另一个工作进程中的适配器从磁盘读取快照
+    other = SubMatcherAdapter(adapter.config_path)
+    shutil.rmtree(library)
+    page = other.scan_directory(str(library), limit=10, cursor=first['next_cursor'])
+    assert page['success']
+    assert len(page_paths(page)) == 4
+
+
+def test_scan_cursor_rejects_other_directory(adapter, library, tmp_path):
+    first = adapter.scan_directory(str(library), limit=5)
+    page = adapter.scan_directory(str(tmp_path), limit=5, cursor=first['next_cursor'])
+    assert not page['success']
+
+
+def test_single_page_scan_keeps_no_snapshot(adapter, library):
+    result = adapter.scan_directory(str(library))
+    assert result['next_cursor'] is None
+    assert not list((Path(adapter.scans.path)).glob('*.json'))
+
+
+def test_preview_pages_share_one_plan(adapter, library):
+    first = adapter.analyze_matches(str(library), limit=3)
+    assert first['success'] and first['next_cursor']
+    matches = list(first['matches'])
+    cursor = first['next_cursor']
+    while cursor:
+        assert decode_cursor(cursor, 'preview')['plan_id'] == first['plan_id']
+        page = adapter.analyze_matches(str(library), limit=3, cursor=cursor)
+        assert page['success'] and page['plan_id'] == first['plan_id']
+        matches.extend(page['matches'])
+        cursor = page['next_cursor']
+    assert sorted(match['video']['name'] for match in matches) == [
+        f"Show.S01E{episode:02d}.1080p.mkv" for episode in range(1, 8)]
+
+
+def test_cursor_kind_is_checked(adapter, library):
+    first = adapter.scan_directory(str(library), limit=5)
+    result = adapter.analyze_matches(str(library), limit=5, cursor=first['next_cursor'])
+    assert not result['success']
+
+
+def snapshots(adapter, library, count):
+    videos, subtitles = adapter.matcher.file_scanner.scan_directory(str(library))
+    return [ScanSnapshot.build(str(library), videos, subtitles, {}) for _ in range(count)]
+
+
+def test_store_drops_expired_snapshots_on_put(adapter, library):
+    store = ScanStore(path=None, ttl=60)
+    stale, fresh = snapshots(adapter, library, 2)
+    stale.created = time.time() - 120
+    store.put(stale)
+    store.put(fresh)
+    assert list(store._plans) == [fresh.plan_id]
+
+
+@pytest.mark.parametrize('on_disk', [False, True])
+def test_store_memory_is_bounded_by_size(adapter, library, tmp_path, on_disk):
+    records = snapshots(adapter, library, 3)
+    sizes = [len(json.dumps(record.to_dict(), ensure_ascii=False)) for record in records]
+    store = ScanStore(path=str(tmp_path / "scans") if on_disk else None, max_plans=10,
+                      max_memory_mb=2.5 * sizes[0] / (1024 * 1024))
+    for record in records:
+        store.put(record)
+    # 只有最近的两个快照留在内存中
+    assert list(store._plans) == [record.plan_id for record in records[1:]]
+    assert store._memory == sizes[1] + sizes[2]
+    # 被淘汰的快照仍可从磁盘读取
+    assert (store.get(records[0].plan_id) is not None) == on_disk
+    store.discard(records[1].plan_id)
+    assert store._memory == sizes[2]
+
+
+def test_plan_applies_once(adapter, library):
+    preview = adapter.analyze_matches(str(library))
+    plan_id = preview['plan_id']
+    result = adapter.execute_rename(str(library), dry_run=False, plan_id=plan_id)
+    assert result['success'] and result['renamed_count'] == 7
+    assert sorted(path.name for path in library.glob('*.ass')) == [
+        f"Show.S01E{episode:02d}.1080p.ass" for episode in range(1, 8)]
+
+    # 执行后计划作废
+    again = adapter.execute_rename(str(library), dry_run=False, plan_id=plan_id)
+    assert not again['success']
+
+
+@pytest.mark.parametrize('change', ['modify', 'delete', 'replace'])
+def test_plan_rejected_after_files_change(adapter, library, change):
+    preview = adapter.analyze_matches(str(library))
+    subtitle = library / "Show S01E03 chs.ass"
+    video = library / "Show.S01E03.1080p.mkv"
+    if change == 'modify':
+        subtitle.write_text("changed", encoding='utf-8')
+        changed = subtitle
+    elif change == 'delete':
+        video.unlink()
+        changed = video
+    else:
+        # 同名替换：大小和修改时间可能不变，inode 不同
+        replacement = library / "replacement"
+        replacement.touch()
+        replacement.replace(subtitle)
+        changed = subtitle
+
+    result = adapter.execute_rename(str(library), dry_run=False, plan_id=preview['plan_id'])
+    assert not result['success']
+    assert result['changed_files'] == [str(changed)]
+    # 整个计划都不执行
+    assert (library / "Show S01E01 chs.ass").exists()
+    assert not list(library.glob('Show.S01E*.1080p.ass'))
+
+
+def test_plan_rejected_for_other_directory(adapter, library, tmp_path):
+    preview = adapter.analyze_matches(str(library))
+    result = adapter.execute_rename(str(tmp_path), dry_run=False, plan_id=preview['plan_id'])
+    assert not result['success']
+
+
+@pytest.fixture
+def generated_library(tmp_path):
+    root = tmp_path / "generated"
+    generate_library(str(root), 800, seed=2)
+    return root
+
+
+def test_preview_lists_alternatives_with_margins(adapter, generated_library):
+    result = adapter.analyze_matches(str(generated_library))
+    assert result['success'] and result['matches']
+    k = adapter.matcher.config.get_matching_config()['alternatives']
+    with_alternatives = [match for match in result['matches'] if match['alternatives']]
+    assert with_alternatives
+    for match in result['matches']:
+        alternatives = match['alternatives']
+        assert len(alternatives) <= k
+        paths = {alternative['path'] for alternative in alternatives}
+        assert match['subtitle']['path'] not in paths
+        assert [alternative['score'] for alternative in alternatives] == sorted(
+            (alternative['score'] for alternative in alternatives), reverse=True)
+        for alternative in alternatives:
+            assert alternative['margin'] == match['score'] - alternative['score']
+        assert match['margin'] == (alternatives[0]['margin'] if alternatives else None)
+    # 未匹配视频的备选只在第一页返回
+    assert 'skipped_alternatives' in result
+    paged = adapter.analyze_matches(str(generated_library), limit=10)
+    page = adapter.analyze_matches(str(generated_library), limit=10, cursor=paged['next_cursor'])
+    assert 'skipped_alternatives' in paged and 'skipped_alternatives' not in page
+
+
+def test_preview_alternatives_exclude_assigned_subtitles(adapter, generated_library):
+    result = adapter.analyze_matches(str(generated_library))
+    assert result['success'] and result['matches']
+    assigned = {match['subtitle']['path'] for match in result['matches']}
+    with_alternatives = [match for match in result['matches'] if match['alternatives']]
+    assert with_alternatives
+    for match in result['matches']:
+        for alternative in match['alternatives']:
+            assert alternative['path'] not in assigned
+            assert alternative['margin'] >= 0
+
+
+def test_preview_alternatives_match_brute_force(make_config, generated_library):
+    # 不跳过同分时，备选即未分配字幕中总分最高的 k 个
+    adapter = SubMatcherAdapter(make_config(matching={'skip_on_conflict': False}))
+    result = adapter.analyze_matches(str(generated_library))
+    assigned = {match['subtitle']['path'] for match in result['matches']}
+    with_alternatives = [match for match in result['matches'] if match['alternatives']]
+    assert with_alternatives
+    submatcher = adapter.matcher
+    videos, subtitles = submatcher.file_scanner.scan_directory(str(generated_library))
+    global_tokens, _ = submatcher.cluster_analyzer.analyze(videos + subtitles)
+    free = [subtitle for subtitle in subtitles if str(subtitle.path) not in assigned]
+    k = submatcher.config.get_matching_config()['alternatives']
+    threshold = submatcher.config.get_matching_config()['min_score_threshold']
+    by_path = {str(video.path): video for video in videos}
+    for match in with_alternatives[:50]:
+        ranked = submatcher.matcher.top_matches(by_path[match['video']['path']], free,
+                                                global_tokens, k)
+        expected = [candidate.score for candidate in ranked if candidate.score >= threshold]
+        assert [alternative['score'] for alternative in match['alternatives']] == expected
+
+
+def test_execute_without_plan_skips_alternatives(adapter, generated_library, monkeypatch):
+    calls = []
+    assign = adapter.matcher.matcher.assign
+
+    def spy(*args, **kwargs):
+        calls.append(args[4] if len(args) > 4 else kwargs.get('alternatives'))
+        return assign(*args, **kwargs)
+
+    monkeypatch.setattr(adapter.matcher.matcher, 'assign', spy)
+    result = adapter.execute_rename(str(generated_library), dry_run=True)
+    assert result['success']
+    assert calls == [None]
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+import mcp_server
+from mcp_server import ToolExecutor
+
+
+def make_executor(**overrides):
+    config = {'executor': 'thread', 'max_workers': 2, 'per_directory_limit': 1,
+              'tool_timeout': 0.05}
+    config.update(overrides)
+    return ToolExecutor(config)
+
+
+def test_same_directory_calls_queue_and_others_run_in_parallel(tmp_path, monkeypatch):
+    executor = make_executor(max_workers=4, tool_timeout=None)
+    lock = threading.Lock()
+    running = {}
+    peaks = {}
+
+    def fake_call(method, directory):
+        with lock:
+            running[directory] = running.get(directory, 0) + 1
+            peaks[directory] = max(peaks.get(directory, 0), running[directory])
+            peaks['total'] = max(peaks.get('total', 0), sum(running.values()))
+        time.sleep(0.05)
+        with lock:
+            running[directory] -= 1
+        return method
+
+    monkeypatch.setattr(mcp_server, '_adapter_call', fake_call)
+    directories = [str(tmp_path / name) for name in ('a', 'a', 'a', 'b', 'b')]
+
+    async def scenario():
+        return await asyncio.gather(*(executor.run_directory_task(directory, 'scan_directory')
+                                      for directory in directories))
+
+    assert asyncio.run(scenario()) == ['scan_directory'] * 5
+    assert peaks[directories[0]] == peaks[directories[-1]] == 1
+    assert peaks['total'] == 2
+    executor.pool.shutdown()
+
+
+def test_tool_timeout(tmp_path, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(mcp_server, '_adapter_call', lambda method, directory: release.wait())
+    executor = make_executor()
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await executor.run_directory_task(str(tmp_path), 'scan_directory')
+
+    asyncio.run(scenario())
+    release.set()
+    executor.pool.shutdown()
+
+
+@pytest.mark.parametrize('timeout, expected', [(0, None), (None, None), (30, 30)])
+def test_zero_timeout_means_no_limit(timeout, expected):
+    executor = make_executor(tool_timeout=timeout)
+    assert executor.timeout == expected
+    executor.pool.shutdown()
+
+
+def test_import_builds_no_components():
+    # 握手前不构建匹配器与配置管理器，也不导入它们
+    code = ("import sys, mcp_server; "
+            "assert (mcp_server._adapter, mcp_server._config_wrapper, mcp_server._executor) "
+            "== (None, None, None); "
+            "assert not {'mcp_adapter', 'config_nlp', 'submatcher'} & set(sys.modules)")
+    subprocess.run([sys.executable, '-c', code], cwd=Path(mcp_server.__file__).parent,
+                   check=True)
+
+
+def test_timed_out_task_keeps_directory_slot(tmp_path):
+    executor = make_executor()
+    key = str(tmp_path.resolve())
+    release = threading.Event()
+    started = []
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await executor._run_holding([key], executor.pool, release.wait)
+        # 工作线程仍在运行：同一目录的新任务必须等待，而不是与它并发
+        second = asyncio.ensure_future(
+            executor._run_holding([key], executor.pool, started.append, 'second'))
+        await asyncio.sleep(0.1)
+        assert started == []
+        assert key in executor._directory_limits
+        release.set()
+        executor.timeout = None
+        await second
+        assert started == ['second']
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert executor._directory_limits == {}
+    executor.pool.shutdown()
+
+
+def test_idle_directory_limits_are_dropped(tmp_path):
+    executor = make_executor(tool_timeout=None)
+
+    async def scenario():
+        for index in range(5):
+            directory = tmp_path / str(index)
+            directory.mkdir()
+            await executor._run_holding([str(directory)], executor.pool, len, 'x')
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert executor._directory_limits == {}
+    executor.pool.shutdown()
+
+
+def test_cancelled_wait_releases_queued_slot(tmp_path):
+    executor = make_executor(tool_timeout=None)
+    key = str(tmp_path.resolve())
+    release = threading.Event()
+
+    async def scenario():
+        first = asyncio.ensure_future(executor._run_holding([key], executor.pool, release.wait))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(executor._run_holding([key], executor.pool, len, 'x'))
+        await asyncio.sleep(0.05)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        assert executor._directory_limits[key][1] == 1
+        release.set()
+        await first
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert executor._directory_limits == {}
+    executor.pool.shutdown()
+
+
+@pytest.fixture
+def server_components(make_config, monkeypatch, tmp_path):
+    """让工具使用临时配置，并在测试结束后丢弃按需创建的组件"""
+    monkeypatch.setattr(mcp_server, 'CONFIG_PATH', make_config(
+        server={'executor': 'thread', 'tool_timeout': 0},
+        watch={'backend': 'polling', 'poll_interval': 0.05}))
+    for name in ('_adapter', '_config_wrapper', '_executor'):
+        monkeypatch.setattr(mcp_server, name, None)
+    manager = mcp_server.get_config_wrapper().manager
+    manager.backup_dir = tmp_path / "config_backups"
+    manager.log_file = tmp_path / "SYSTEM_MOD_LOG.md"
+    yield
+    if mcp_server._adapter is not None:
+        for watch in mcp_server._adapter.list_watches():
+            mcp_server._adapter.stop_watch(watch['directory'])
+
+
+def call(name, **arguments):
+    content = asyncio.run(mcp_server.call_tool(name, arguments))
+    return json.loads(content[0].text)
+
+
+def test_every_tool_returns_json(server_components, tmp_path):
+    library = tmp_path / "library"
+    library.mkdir()
+    (library / "Show.S01E01.1080p.mkv").touch()
+    (library / "Show S01E01 chs.ass").touch()
+    directory = str(library)
+
+    assert call('rename_subtitles', directory=directory)['success']
+    assert call('start_watch', directory=directory)['success']
+    assert [watch['directory'] for watch in call('list_watches')] == [str(library.resolve())]
+    assert call('stop_watch', directory=directory)['success']
+    assert call('get_config_value', path='matching.min_score_threshold') == 50
+    assert call('set_config_value', path='matching.min_score_threshold', value=60)['success']
+    assert call('set_config_values', changes=[
+        {'path': 'matching.min_score_threshold', 'value': 55}])['success']
+    assert isinstance(call('get_config_summary'), dict)
+
+
+def test_process_executor_keeps_stdout_clean(make_config, monkeypatch, tmp_path, capfd):
+    monkeypatch.setattr(mcp_server, 'CONFIG_PATH', make_config())
+    (tmp_path / "Show.S01E01.1080p.mkv").touch()
+    (tmp_path / "Show S01E01 chs.ass").touch()
+    executor = make_executor(executor='process', max_workers=1, tool_timeout=None)
+    try:
+        result = asyncio.run(executor.run_directory_task(str(tmp_path), 'execute_rename', True))
+        executor.pool.submit(print, 'worker output').result()
+    finally:
+        executor.pool.shutdown()
+    assert result['success'] and result['renamed_count'] == 1
+    # 工作进程中的任何输出都改写到 stderr，不进入协议通道
+    captured = capfd.readouterr()
+    assert captured.out == ''
+    assert 'worker output' in captured.err
@@ -0,0 +1,83 @@
+import pytest
+
+from metrics import Metrics
+
+
+def test_stages_accumulate_time_and_counts():
+    metrics = Metrics()
+    for files in (3, 5):
+        with metrics.stage('scan') as record:
+            record.count('files', files)
+    metrics.record('rename', 0.5, {'renamed': 2})
+    metrics.count('leftovers', 4)
+
+    snapshot = metrics.snapshot()
+    scan = snapshot['stages']['scan']
+    assert scan['calls'] == 2 and scan['files'] == 8
+    assert scan['max_seconds'] <= scan['total_seconds']
+    assert scan['mean_seconds'] == pytest.approx(scan['total_seconds'] / 2)
+    assert snapshot['stages']['rename']['total_seconds'] == 0.5
+    assert snapshot['counters'] == {'leftovers': 4}
+
+    table = metrics.format()
+    assert table.splitlines()[1].startswith('rename')
+    assert 'files=8' in table and 'calls=' not in table
+
+
+def test_cache_hit_rates():
+    metrics = Metrics()
+    metrics.cache('scan_cache', 3, 1)
+    metrics.cache('scan_cache', 1, 0)
+    metrics.cache('empty', 0, 0)
+    metrics.register_cache('tokenizer', lambda: (9, 1))
+    caches = metrics.snapshot()['caches']
+    assert caches['scan_cache'] == {'hits': 4, 'misses': 1, 'hit_rate': 0.8}
+    assert caches['empty']['hit_rate'] is None
+    assert caches['tokenizer']['hit_rate'] == 0.9
+
+    metrics.reset()
+    assert list(metrics.snapshot()['caches']) == ['tokenizer']
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics(enabled=False)
+    with metrics.stage('scan') as record:
+        record.count('files', 3)
+    metrics.record('rename', 1.0)
+    metrics.count('leftovers')
+    metrics.cache('scan_cache', 1, 1)
+    snapshot = metrics.snapshot()
+    assert snapshot['stages'] == snapshot['counters'] == snapshot['caches'] == {}
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = tmp_path / "library"
+    root.mkdir()
+    for episode in range(1, 9):
+        (root / f"Show.S01E{episode:02d}.1080p.WEB-DL.mkv").touch()
+        (root / f"Show S01E{episode:02d} chs.ass").touch()
+    (root / "Show S01E09 eng.srt").touch()
+    return root
+
+
+def run_pipeline(submatcher, root):
+    videos, subtitles = submatcher.file_scanner.scan_directory(str(root))
+    global_tokens, _ = submatcher.cluster_analyzer.analyze(videos + subtitles)
+    matches = submatcher.matcher.assign(videos, subtitles, global_tokens)
+    return sorted((str(m.video.path), str(m.subtitle.path), m.score) for m in matches)
+
+
+def test_pipeline_records_stages_without_changing_results(library, make_submatcher):
+    enabled = make_submatcher(metrics={'enabled': True})
+    disabled = make_submatcher(metrics={'enabled': False})
+    matches = run_pipeline(enabled, library)
+    assert len(matches) == 8
+    assert run_pipeline(disabled, library) == matches
+
+    snapshot = enabled.metrics.snapshot()
+    assert snapshot['stages']['scan.parse']['files'] == 17
+    assert snapshot['stages']['scan.walk']['directories'] == 1
+    assert {'cluster', 'match.score', 'match.assign'} <= set(snapshot['stages'])
+    assert snapshot['caches']['tokenizer']['misses'] > 0
+    assert disabled.metrics.snapshot()['stages'] == {}
@@ -0,0 +1,154 @@
+import pytest
+
+from engine import UNTIL_MATCH, SubtitleUnmatched, VideoMatched, drain
+from generate import generate_library, generate_names
+from submatcher import partition_by_directory
+
+
+def touch(root, *names):
+    for name in names:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+
+
+def test_subtitles_join_nearest_directory_with_videos(make_submatcher, tmp_path):
+    touch(tmp_path, "A/A.S01E01.mkv", "A/A S01E01.ass", "A/Subs/A S01E02.ass",
+          "B/Season 1/B.S01E01.mkv", "B/B S01E01.ass", "Loose/A S01E03.ass")
+    submatcher = make_submatcher()
+    videos, subtitles = submatcher.file_scanner.scan_directory(str(tmp_path))
+    partitions, leftover = partition_by_directory(videos, subtitles)
+
+    def names(files):
+        return sorted(file_info.name for file_info in files)
+
+    assert {directory.relative_to(tmp_path).as_posix(): (names(v), names(s))
+            for directory, (v, s) in partitions.items()} == {
+        'A': (['A.S01E01.mkv'], ['A S01E01.ass', 'A S01E02.ass']),
+        'B/Season 1': (['B.S01E01.mkv'], []),
+    }
+    # B/ 本身不直接包含视频，其中的字幕与 Loose/ 中的一样留给全局匹配
+    assert names(leftover) == ['A S01E03.ass', 'B S01E01.ass']
+
+
+def test_leftovers_are_matched_globally(make_submatcher, tmp_path):
+    touch(tmp_path, "Show/Show.S01E01.1080p.mkv", "Show/Show.S01E02.1080p.mkv",
+          "Show/Show S01E01 chs.ass", "Other/Other.S01E01.1080p.mkv",
+          "Subtitles/Show S01E02 chs.ass", "Subtitles/Other S01E01 chs.ass")
+    pairs = {}
+    for partition in ('none', 'directory'):
+        submatcher = make_submatcher(matching={'partition': partition})
+        videos, subtitles = submatcher.file_scanner.scan_directory(str(tmp_path))
+        global_tokens, _ = submatcher.cluster_analyzer.analyze(videos + subtitles)
+        matches = submatcher.matcher.assign(videos, subtitles, global_tokens)
+        pairs[partition] = {(match.video.name, match.subtitle.name) for match in matches}
+    assert pairs['directory'] == pairs['none'] == {
+        ('Show.S01E01.1080p.mkv', 'Show S01E01 chs.ass'),
+        ('Show.S01E02.1080p.mkv', 'Show S01E02 chs.ass'),
+        ('Other.S01E01.1080p.mkv', 'Other S01E01 chs.ass'),
+    }
+
+
+def test_show_clusters_group_by_title(make_submatcher, tmp_path):
+    touch(tmp_path, "The.Office.S01E01.mkv", "The Office US S01E01 chs.ass",
+          "Star.Trek.Picard.S01E01.mkv", "Star Trek Picard S01E01.ass",
+          "Star.Trek.Discovery.S01E01.mkv", "Star Trek Discovery S01E01.ass",
+          "Lonely.S01E01.mkv", "S01E05 chs.ass")
+    submatcher = make_submatcher()
+    videos, subtitles = submatcher.file_scanner.scan_directory(str(tmp_path))
+    clusters = submatcher.cluster_analyzer.show_clusters(videos, subtitles)
+
+    # 剧名 Token 互为子集的写法合并；只共享部分 Token 的剧集保持分开
+    assert sorted((sorted(file_info.name for file_info in cluster.videos),
+                   sorted(file_info.name for file_info in cluster.subtitles))
+                  for cluster in clusters.clusters) == [
+        (['Star.Trek.Discovery.S01E01.mkv'], ['Star Trek Discovery S01E01.ass']),
+        (['Star.Trek.Picard.S01E01.mkv'], ['Star Trek Picard S01E01.ass']),
+        (['The.Office.S01E01.mkv'], ['The Office US S01E01 chs.ass']),
+    ]
+    # 只有视频的剧集和没有剧名的字幕不分组
+    assert [video.name for video in clusters.unclustered_videos] == ['Lonely.S01E01.mkv']
+    assert [subtitle.name for subtitle in clusters.unclustered_subtitles] == ['S01E05 chs.ass']
+
+
+def test_show_mode_matches_unclustered_files_globally(make_submatcher, tmp_path):
+    # Lonely 只有视频、字幕没有剧名，两者都不分组，由最后的全局匹配配对
+    touch(tmp_path, "Show.S01E01.1080p.mkv", "Show S01E01 chs.ass", "Lonely.S01E03.1080p.mkv",
+          "S01E03 chs.ass")
+    submatcher = make_submatcher(matching={'partition': 'show'})
+    result = drain(submatcher.engine.run(str(tmp_path), until=UNTIL_MATCH))
+    assert {(match.video.name, match.subtitle.name) for match in result.matches} == {
+        ('Show.S01E01.1080p.mkv', 'Show S01E01 chs.ass'),
+        ('Lonely.S01E03.1080p.mkv', 'S01E03 chs.ass'),
+    }
+
+
+@pytest.fixture
+def flat_library(tmp_path):
+    """多部剧集混放在同一目录中的媒体库"""
+    root = tmp_path / "flat"
+    root.mkdir()
+    for _, name in generate_names(1500, seed=3):
+        (root / name).touch()
+    return root
+
+
+@pytest.fixture
+def tree_library(tmp_path):
+    root = tmp_path / "tree"
+    generate_library(str(root), 1500, seed=3)
+    return root
+
+
+def in_memory_pairs(submatcher, directory):
+    result = drain(submatcher.engine.run(str(directory), until=UNTIL_MATCH))
+    return {(str(match.video.path), str(match.subtitle.path)) for match in result.matches}
+
+
+def streaming_pairs(submatcher, directory):
+    pairs = set()
+    unmatched = 0
+    unmatched_subtitles = []
+    for event in submatcher.engine.run_streaming(str(directory), until=UNTIL_MATCH):
+        if isinstance(event, VideoMatched):
+            if event.match is None:
+                unmatched += 1
+            else:
+                pairs.add((str(event.video.path), str(event.match.subtitle.path)))
+        elif isinstance(event, SubtitleUnmatched):
+            unmatched_subtitles.append(event.path)
+    return pairs, event, unmatched, unmatched_subtitles
+
+
+def test_show_mode_never_pairs_different_shows(make_submatcher, flat_library):
+    submatcher = make_submatcher(matching={'partition': 'show'})
+    videos, subtitles = submatcher.file_scanner.scan_directory(str(flat_library))
+    clusters = submatcher.cluster_analyzer.show_clusters(videos, subtitles)
+    cluster_of = {}
+    for index, cluster in enumerate(clusters.clusters):
+        for file_info in cluster.videos + cluster.subtitles:
+            cluster_of[str(file_info.path)] = index
+
+    pairs = in_memory_pairs(submatcher, flat_library)
+    assert pairs
+    for video, subtitle in pairs:
+        # 分组内的文件只与同组的文件配对；未分组的文件只与未分组的文件配对
+        assert cluster_of.get(video) == cluster_of.get(subtitle)
+
+
+@pytest.mark.parametrize('partition, library', [('show', 'flat_library'),
+                                                ('directory', 'tree_library')])
+def test_streaming_matches_in_memory(make_submatcher, partition, library, request):
+    directory = request.getfixturevalue(library)
+    submatcher = make_submatcher(matching={'partition': partition})
+    expected = in_memory_pairs(submatcher, directory)
+    pairs, completed, unmatched, unmatched_subtitles = streaming_pairs(submatcher, directory)
+    assert pairs == expected
+    assert completed.matched_count == len(expected)
+    assert completed.unmatched_count == unmatched == completed.video_count - len(expected)
+    # 未匹配的字幕经溢出文件排序后逐个产出，StreamCompleted 只保留计数
+    _, subtitles = submatcher.file_scanner.scan_directory(str(directory))
+    matched_subtitles = {subtitle for _, subtitle in pairs}
+    assert unmatched_subtitles == sorted(str(subtitle.path) for subtitle in subtitles
+                                         if str(subtitle.path) not in matched_subtitles)
+    assert completed.unmatched_subtitle_count == len(unmatched_subtitles)
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from scan_cache import config_digest
+
+
+@pytest.fixture
+def cached_submatcher(make_submatcher):
+    """同一测试中的所有 SubMatcher 共用 tmp_path 下的一个扫描缓存"""
+    def factory(**tokenization):
+        return make_submatcher(scan_cache={'enabled': True}, tokenization=tokenization)
+
+    return factory
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = tmp_path / "library"
+    (root / "Season 1").mkdir(parents=True)
+    for episode in range(1, 6):
+        (root / "Season 1" / f"Show.S01E{episode:02d}.1080p.mkv").touch()
+        (root / "Season 1" / f"Show S01E{episode:02d} chs.ass").touch()
+    return root
+
+
+def scan(submatcher, root):
+    videos, subtitles = submatcher.file_scanner.scan_directory(str(root))
+    parsed = {str(f.path): (f.tokens, f.season, f.episode) for f in videos + subtitles}
+    stats = submatcher.file_scanner.last_scan_stats
+    return parsed, stats['cache_hits'], stats['cache_misses']
+
+
+def test_rescan_hits_cache_with_same_results(cached_submatcher, library):
+    submatcher = cached_submatcher()
+    first, hits, misses = scan(submatcher, library)
+    assert (hits, misses) == (0, 10)
+    second, hits, misses = scan(submatcher, library)
+    assert (hits, misses) == (10, 0)
+    assert second == first
+
+
+def test_changed_and_new_files_are_reparsed(cached_submatcher, library):
+    submatcher = cached_submatcher()
+    scan(submatcher, library)
+
+    subtitle = library / "Season 1" / "Show S01E02 chs.ass"
+    subtitle.write_text("1\n00:00:01,000 --> 00:00:02,000\n", encoding='utf-8')
+    # 同名替换为另一个文件：只有 inode 不同
+    replaced = library / "Season 1" / "Show S01E03 chs.ass"
+    replacement = library / "replacement"
+    replacement.touch()
+    stat = replaced.stat()
+    os.utime(replacement, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    replacement.replace(replaced)
+    (library / "Season 1" / "Show S01E06 chs.ass").touch()
+    (library / "Season 1" / "Show.S01E05.1080p.mkv").unlink()
+
+    parsed, hits, misses = scan(submatcher, library)
+    assert (hits, misses) == (7, 3)
+    assert parsed[str(library / "Season 1" / "Show S01E06 chs.ass")][1:] == (1, 6)
+
+    # 已删除的文件从缓存中清除
+    digest = config_digest(submatcher.config.get_tokenization_config(),
+                           submatcher.config.get_episode_patterns())
+    cached = submatcher.file_scanner._get_scan_cache().load(str(library), digest)
+    assert str(library / "Season 1" / "Show.S01E05.1080p.mkv") not in cached
+    assert len(cached) == 10
+
+
+def test_config_change_invalidates_cache(cached_submatcher, library):
+    first, _, _ = scan(cached_submatcher(), library)
+    other = cached_submatcher(ignore_tokens=['show'])
+    parsed, hits, misses = scan(other, library)
+    assert (hits, misses) == (0, 10)
+    assert all('show' not in tokens for tokens, _, _ in parsed.values())
+    assert parsed != first
@@ -0,0 +1,71 @@
+import random
+
+import pytest
+
+from submatcher import Config, Tokenizer
+
+NAMES = [
+    'The.Show.S01E02.1080p.WEB-DL.x264-GROUP',
+    '[Group] The Show - 02 [1080p][CHS&ENG]',
+    'the_show__s01e02__chs',
+    'Show (2019) - S01E02 - Pilot, Part 1',
+    'Show.S01E02..720p.--.eng',
+    'SHOW 1x02 [简体] 中英',
+    '',
+    '....',
+]
+
+
+def reference_tokenize(config, filename):
+    """原实现：按配置顺序依次用每个分隔符切分"""
+    tokenization_config = config.get_tokenization_config()
+    tokens = [filename]
+    for sep in tokenization_config.get('separators', []):
+        tokens = [part for token in tokens for part in token.split(sep)]
+    ignore_tokens = set(tokenization_config.get('ignore_tokens', []))
+    cleaned_tokens = []
+    for token in tokens:
+        token = token.strip().lower()
+        if (len(token) >= tokenization_config.get('min_token_length', 2)
+                and token not in ignore_tokens and not token.isdigit()):
+            cleaned_tokens.append(token)
+    return cleaned_tokens
+
+
+@pytest.mark.parametrize('separators', [
+    None,
+    [' - ', '][', '.', '_', ' ', '[', ']', '-'],
+    ['__', '.', ' - ', ' '],
+    ['--', '-', '.', ' '],
+])
+def test_tokens_equal_sequential_split(make_config, separators):
+    tokenization = {} if separators is None else {'separators': separators}
+    config = Config(make_config(tokenization=tokenization))
+    tokenizer = Tokenizer(config)
+    rnd = random.Random(3)
+    names = NAMES + [''.join(rnd.choice('ab S01E.-_[] &') for _ in range(rnd.randint(0, 30)))
+                     for _ in range(2000)]
+    for name in names:
+        assert tokenizer.tokenize(name) == reference_tokenize(config, name), name
+
+
+def test_cache_returns_fresh_lists(make_config):
+    tokenizer = Tokenizer(Config(make_config()))
+    first = tokenizer.tokenize(NAMES[0])
+    first.append('mutated')
+    second = tokenizer.tokenize(NAMES[0])
+    assert 'mutated' not in second
+    assert tokenizer._tokenize_cached.cache_info().hits == 1
+    # 不同文件名中相同的 Token 共享同一个对象
+    other = tokenizer.tokenize('Another.Show.S01E02.1080p.WEB-DL.x264-GROUP')
+    assert next(token for token in other if token == 'x264') is second[second.index('x264')]
+
+
+def test_cache_is_bounded(make_config):
+    tokenizer = Tokenizer(Config(make_config(tokenization={'cache_size': 4})))
+    for index in range(10):
+        tokenizer.tokenize(f"Show.S01E{index:02d}")
+    info = tokenizer._tokenize_cached.cache_info()
+    assert info.currsize == info.maxsize == 4
+    assert tokenizer.tokenize('Show.S01E09') == ['show', 's01e09']
+    assert tokenizer._tokenize_cached.cache_info().hits == 1
@@ -0,0 +1,60 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+from submatcher import CandidateIndex  # noqa: E402
+from vector_engine import verify_against_scalar  # noqa: E402
+
+
+@pytest.fixture
+def submatcher_for(make_submatcher):
+    def factory(engine='scalar', lineage=True):
+        return make_submatcher(matching={'engine': engine}, lineage_bonus={'enabled': lineage})
+
+    return factory
+
+
+@pytest.fixture(scope='module')
+def library(tmp_path_factory, make_library):
+    return make_library(tmp_path_factory.mktemp("vector") / "library", seed=5, seasons=8)
+
+
+def scan(submatcher, library):
+    videos, subtitles = submatcher.file_scanner.scan_directory(str(library))
+    global_tokens, _ = submatcher.cluster_analyzer.analyze(videos + subtitles)
+    return videos, subtitles, global_tokens
+
+
+@pytest.mark.parametrize('lineage', [True, False])
+def test_scores_match_scalar(submatcher_for, library, lineage):
+    submatcher = submatcher_for(lineage=lineage)
+    videos, subtitles, global_tokens = scan(submatcher, library)
+    assert verify_against_scalar(submatcher.matcher, videos, subtitles, global_tokens) == []
+
+
+def test_removed_subtitles_match_scalar(submatcher_for, library):
+    submatcher = submatcher_for()
+    matcher = submatcher.matcher
+    videos, subtitles, global_tokens = scan(submatcher, library)
+    candidate_index = CandidateIndex(subtitles, global_tokens)
+    for subtitle in subtitles[::3]:
+        candidate_index.remove(subtitle)
+
+    expected = matcher.score_candidates(videos, candidate_index, global_tokens, engine='scalar')
+    actual = matcher.score_candidates(videos, candidate_index, global_tokens, engine='numpy')
+    assert any(expected)
+    assert actual == expected
+
+
+def test_assignment_matches_scalar(submatcher_for, library):
+    results = []
+    for engine in ('scalar', 'numpy'):
+        submatcher = submatcher_for(engine=engine)
+        videos, subtitles, global_tokens = scan(submatcher, library)
+        candidate_index = CandidateIndex(subtitles, global_tokens)
+        matches = submatcher.matcher.assign_indexed(videos, candidate_index, global_tokens)
+        results.append({(str(match.video.path), str(match.subtitle.path), match.score)
+                        for match in matches})
+    assert results[0]
+    assert results[0] == results[1]
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+import submatcher as submatcher_module
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "library"
+    for directory in ["Season 1", "Season 2/extras", "Specials.mkv", "locked/inner"]:
+        (root / directory).mkdir(parents=True)
+    for name in ["Season 1/Show.S01E01.mkv", "Season 1/Show.S01E01.chs.ass",
+                 "Season 1/Show.S01E02.MKV", "Season 1/Show.S01E02.SRT",
+                 "Season 1/notes.txt", "Season 2/Show.S02E01.mp4",
+                 "Season 2/extras/Show.S02E01.eng.srt", "Specials.mkv/Show.S00E01.mkv",
+                 "locked/Show.S03E01.mkv", "locked/inner/Show.S03E01.ass", "Show.S01E03.avi"]:
+        (root / name).write_text(name, encoding='utf-8')
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    (outside / "Other.S01E01.mkv").touch()
+    # 指向目录的符号链接不进入，指向文件的符号链接照常收录
+    (root / "linked").symlink_to(outside, target_is_directory=True)
+    (root / "Show.S01E04.mkv").symlink_to(outside / "Other.S01E01.mkv")
+    (root / "broken.ass").symlink_to(tmp_path / "missing.ass")
+    return root
+
+
+def rglob_reference(config, root):
+    """原实现：Path.rglob 遍历，按扩展名分类"""
+    videos, subtitles = set(), set()
+    for path in root.rglob('*'):
+        if path.is_file():
+            if path.suffix.lower() in config.get_video_extensions():
+                videos.add(str(path))
+            elif path.suffix.lower() in config.get_subtitle_extensions():
+                subtitles.add(str(path))
+    return videos, subtitles
+
+
+def scanned_paths(submatcher, root):
+    videos, subtitles = submatcher.file_scanner.scan_directory(str(root))
+    return [str(f.path) for f in videos], [str(f.path) for f in subtitles]
+
+
+@pytest.mark.parametrize('max_workers', [1, 8])
+def test_walk_matches_rglob(tree, make_submatcher, max_workers):
+    submatcher = make_submatcher(scanning={'max_workers': max_workers})
+    expected_videos, expected_subtitles = rglob_reference(submatcher.config, tree)
+    videos, subtitles = scanned_paths(submatcher, tree)
+    assert set(videos) == expected_videos and set(subtitles) == expected_subtitles
+    assert str(tree / "Show.S01E04.mkv") in videos
+    assert not any('outside' in path or 'linked' in path for path in videos)
+    # 并发遍历的结果按路径排序，多次扫描结果一致
+    assert videos == sorted(videos) and subtitles == sorted(subtitles)
+    assert scanned_paths(submatcher, tree) == (videos, subtitles)
+    stats = submatcher.file_scanner.last_scan_stats
+    assert stats['directories'] == 7
+    assert stats['media_files'] == len(videos) + len(subtitles)
+
+
+def test_unreadable_directory_is_skipped(tree, make_submatcher, monkeypatch):
+    submatcher = make_submatcher()
+    expected_videos, expected_subtitles = rglob_reference(submatcher.config, tree)
+    real_scandir = os.scandir
+    locked = str(tree / "locked")
+
+    def scandir(path):
+        if str(path) == locked:
+            raise PermissionError(13, "Permission denied", path)
+        return real_scandir(path)
+
+    monkeypatch.setattr(submatcher_module.os, 'scandir', scandir)
+    videos, subtitles = scanned_paths(submatcher, tree)
+    # 无权限的目录及其子目录被跳过，其余结果不变
+    assert set(videos) == {path for path in expected_videos if not path.startswith(locked)}
+    assert set(subtitles) == {path for path in expected_subtitles
+                              if not path.startswith(locked)}
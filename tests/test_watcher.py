@@ -0,0 +1,182 @@
+import os
+import sys
+import time
+
+import pytest
+
+from mcp_adapter import SubMatcherAdapter
+from watcher import InotifyWatcher, PollingWatcher, WatchSession
+
+EXTENSIONS = {'.mkv', '.ass'}
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / "library"
+    root.mkdir()
+    return root
+
+
+def test_polling_watcher_reports_media_changes(root):
+    watcher = PollingWatcher(str(root), EXTENSIONS, interval=0)
+    assert watcher.read_changes(0.1) == set()
+
+    video = root / "Show.S01E01.mkv"
+    video.touch()
+    (root / "notes.txt").touch()
+    (root / "Season 2").mkdir()
+    (root / "Season 2" / "Show.S02E01.ass").touch()
+    assert watcher.read_changes(0.1) == {str(video), str(root / "Season 2" / "Show.S02E01.ass")}
+
+    video.write_text("more data", encoding='utf-8')
+    assert watcher.read_changes(0.1) == {str(video)}
+    video.unlink()
+    assert watcher.read_changes(0.1) == {str(video)}
+    assert watcher.read_changes(0.1) == set()
+
+
+def test_polling_watcher_waits_for_interval(root):
+    watcher = PollingWatcher(str(root), EXTENSIONS, interval=60)
+    (root / "Show.S01E01.mkv").touch()
+    # 未到轮询时间时只等待 timeout，不扫描目录
+    assert watcher.read_changes(0.01) == set()
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify 仅在 Linux 上可用')
+def test_inotify_watcher_follows_new_directories(root, tmp_path):
+    watcher = InotifyWatcher(str(root), EXTENSIONS)
+    try:
+        video = root / "Show.S01E01.mkv"
+        video.write_text("data", encoding='utf-8')
+        (root / "notes.txt").touch()
+        assert watcher.read_changes(1.0) == {str(video)}
+
+        # 整体移入的季目录：其中已有的文件和之后新建的文件都被报告
+        season = tmp_path / "Season 2"
+        season.mkdir()
+        (season / "Show.S02E01.mkv").touch()
+        os.rename(season, root / "Season 2")
+        assert watcher.read_changes(1.0) == {str(root / "Season 2" / "Show.S02E01.mkv")}
+        (root / "Season 2" / "Show.S02E01.ass").touch()
+        assert watcher.read_changes(1.0) == {str(root / "Season 2" / "Show.S02E01.ass")}
+
+        # 移走目录后无法得知其中的文件，要求全量同步
+        os.rename(root / "Season 2", tmp_path / "moved")
+        assert watcher.read_changes(1.0) is None
+    finally:
+        watcher.close()
+
+
+@pytest.fixture
+def watch_config(make_config):
+    return make_config(watch={'backend': 'polling', 'poll_interval': 0.05, 'debounce': 0.05,
+                              'max_delay': 0.2})
+
+
+def make_library(root):
+    for episode in range(1, 4):
+        (root / f"Show.S01E{episode:02d}.1080p.mkv").touch()
+    (root / "Show S01E01 chs.ass").touch()
+
+
+def test_session_matches_only_new_files(root, watch_config):
+    from submatcher import SubMatcher
+
+    make_library(root)
+    session = WatchSession(SubMatcher(watch_config), str(root), dry_run=False, quiet=True)
+    try:
+        # 启动时的全量同步处理已有的字幕
+        assert (root / "Show.S01E01.1080p.ass").exists()
+        assert session.status()['unpaired_videos'] == 2
+
+        subtitle = root / "Show S01E02 chs.ass"
+        subtitle.touch()
+        results = session.apply([str(subtitle)])
+        assert [result.video.name for result in results] == ["Show.S01E02.1080p.mkv"]
+        assert (root / "Show.S01E02.1080p.ass").exists() and not subtitle.exists()
+
+        # 不相关的字幕不会触发其他视频的匹配
+        assert session.apply([str(root / "missing.ass")]) == []
+        status = session.status()
+        assert status['unpaired_videos'] == 1 and status['batches'] == 2
+        assert [entry['success'] for entry in status['recent']] == [True, True]
+
+        # 删除已配对的字幕后视频重新变为未配对
+        (root / "Show.S01E02.1080p.ass").unlink()
+        session.apply([str(root / "Show.S01E02.1080p.ass")])
+        assert session.status()['unpaired_videos'] == 2
+    finally:
+        session.close()
+
+
+def test_dry_run_matches_are_handled(root, watch_config):
+    from submatcher import SubMatcher
+
+    make_library(root)
+    session = WatchSession(SubMatcher(watch_config), str(root), dry_run=True, quiet=True)
+    try:
+        # 演习模式不改名，但已匹配的视频不再算作未配对
+        assert not (root / "Show.S01E01.1080p.ass").exists()
+        assert session.status()['unpaired_videos'] == 2
+
+        subtitle = root / "Show S01E02 chs.ass"
+        subtitle.touch()
+        results = session.apply([str(subtitle)])
+        assert [result.video.name for result in results] == ["Show.S01E02.1080p.mkv"]
+        assert session.status()['unpaired_videos'] == 1
+        assert subtitle not in session.candidate_index
+
+        # 删除已匹配的字幕后视频重新变为未配对
+        subtitle.unlink()
+        assert session.apply([str(subtitle)]) == []
+        assert session.status()['unpaired_videos'] == 2
+        # 删除已匹配的视频后字幕重新成为候选
+        video = root / "Show.S01E01.1080p.mkv"
+        video.unlink()
+        session.apply([str(video)])
+        assert root / "Show S01E01 chs.ass" in session.candidate_index
+    finally:
+        session.close()
+
+
+def test_session_journals_share_one_group(root, watch_config):
+    from submatcher import SubMatcher
+
+    make_library(root)
+    submatcher = SubMatcher(watch_config)
+    session = WatchSession(submatcher, str(root), dry_run=False, quiet=True)
+    try:
+        (root / "Show S01E02 chs.ass").touch()
+        session.apply([str(root / "Show S01E02 chs.ass")])
+    finally:
+        session.close()
+    journal_dir = submatcher.renamer.batch_renamer.journal_dir
+    assert [path.name for path in journal_dir.iterdir()] == [session.journal_group]
+    assert len(list((journal_dir / session.journal_group).glob('*.jsonl'))) == 2
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_watch_tools_start_list_and_stop(root, watch_config):
+    make_library(root)
+    adapter = SubMatcherAdapter(watch_config)
+    started = adapter.start_watch(str(root), dry_run=False)
+    try:
+        assert started['success'] and started['backend'] == 'polling'
+        assert not adapter.start_watch(str(root))['success']
+        assert [watch['directory'] for watch in adapter.list_watches()] == [str(root.resolve())]
+
+        (root / "Show S01E03 chs.ass").touch()
+        assert wait_for(lambda: (root / "Show.S01E03.1080p.ass").exists())
+    finally:
+        stopped = adapter.stop_watch(str(root))
+    assert stopped['success'] and stopped['batches'] >= 1
+    assert adapter.list_watches() == []
+    assert not adapter.stop_watch(str(root))['success']